@@ -1,11 +1,18 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
 import os
 
 # Load environment variables
 load_dotenv()
 
+from app.services.profiler import ProfilingMiddleware
+from app.services.tracing import TracingMiddleware, configure_logging, render_metrics
+from app.services.warmup import Warmup
+
+configure_logging()
+
 # Create FastAPI app
 app = FastAPI(
     title="NeuroSim API",
@@ -34,10 +41,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Resumable uploads report progress in this header; every response carries its request ID
+    expose_headers=["Upload-Offset", "X-Request-ID", "X-Profile-Id"],
 )
 
+# Profiles the thread serving requests sent with X-Profile: 1 and an admin token
+app.add_middleware(ProfilingMiddleware)
+
+# Outermost, so request IDs and latencies cover everything below it
+app.add_middleware(TracingMiddleware)
+
 # Import routers
-from app.routers import upload, segmentation, simulation, gemini, snowflake, stl
+from app.routers import upload, segmentation, simulation, gemini, snowflake, stl, storage, jobs, admin
 
 # Include routers
 app.include_router(upload.router, prefix="/api", tags=["upload"])
@@ -46,6 +61,49 @@ app.include_router(simulation.router, prefix="/api", tags=["simulation"])
 app.include_router(gemini.router, prefix="/api/gemini", tags=["gemini"])
 app.include_router(snowflake.router, prefix="/api/snowflake", tags=["snowflake"])
 app.include_router(stl.router, prefix="/api", tags=["stl"])
+app.include_router(storage.router, prefix="/api/storage", tags=["storage"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
+
+
+def _warm_gemini():
+    from app.services.gemini_service import get_model
+    get_model()
+
+
+# Heavy libraries load lazily; warmup pulls them in after startup so /health answers at once
+warmup = Warmup([
+    "scipy.ndimage",
+    "skimage.measure",
+    "nibabel",
+    "pydicom",
+], optional=[
+    # Only the AI analysis endpoints need Gemini; the rest of the API is ready without it
+    _warm_gemini,
+])
+
+
+@app.on_event("startup")
+def start_warmup():
+    warmup.start()
+
+
+@app.on_event("startup")
+def start_storage_collection():
+    # Periodic TTL/quota/LRU eviction of case data
+    from app.services.storage_manager import get_storage_manager
+    get_storage_manager().start()
+
+
+# Segmentation workers running inside this process (JOB_INLINE_WORKERS; 0 = enqueue only)
+inline_workers = []
+
+
+@app.on_event("startup")
+def start_inline_workers():
+    from app.services.job_queue import JOB_INLINE_WORKERS
+    from app.worker import start_workers
+    inline_workers.extend(start_workers(JOB_INLINE_WORKERS))
 
 
 @app.get("/")
@@ -59,9 +117,45 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    # Liveness: the process is up and serving
     return {"status": "healthy"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    # Readiness: warmup has loaded the imaging libraries (a failed Gemini warmup only degrades it)
+    return JSONResponse(warmup.status(), status_code=200 if warmup.ready else 503)
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    # Prometheus text format: per-route request latency and per-stage span histograms
+    from app.services.job_queue import get_job_queue
+    from app.services.storage_manager import get_storage_manager
+    extra_lines = get_storage_manager().render_metrics() + get_job_queue().render_metrics()
+    return PlainTextResponse(render_metrics() + "\n".join(extra_lines) + "\n", media_type="text/plain; version=0.0.4")
+
+
+@app.on_event("shutdown")
+def flush_pending_writes():
+    # Drain the simulation write-behind buffer before the process exits
+    from app.services.write_buffer import close_write_buffer
+    close_write_buffer()
+
+
+@app.on_event("shutdown")
+def stop_storage_collection():
+    from app.services.storage_manager import get_storage_manager
+    get_storage_manager().close()
+
+
+@app.on_event("shutdown")
+def stop_inline_workers():
+    # Running jobs are left to their lease; another worker retries them if this one is cut short
+    for worker in inline_workers:
+        worker.stop(timeout=5)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
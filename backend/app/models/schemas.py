@@ -1,12 +1,44 @@
-from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from pydantic import BaseModel, Field
+from typing import List, Dict, Optional, Any, Literal
 from datetime import datetime
 
 
+class UploadedFile(BaseModel):
+    filename: str
+    size: int
+    sha256: str
+
+
 class UploadResponse(BaseModel):
     case_id: str
     filename: str
     status: str
+    files: Optional[List[UploadedFile]] = None
+
+
+class UploadSessionFile(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+
+
+class UploadSessionCreate(BaseModel):
+    files: List[UploadSessionFile]
+
+
+class UploadProgressFile(BaseModel):
+    filename: str
+    size: int
+    offset: int
+
+
+class UploadProgress(BaseModel):
+    case_id: str
+    finalized: bool
+    complete: bool
+    bytes_total: int
+    bytes_received: int
+    files: List[UploadProgressFile]
 
 
 class MeshData(BaseModel):
@@ -16,10 +48,29 @@ class MeshData(BaseModel):
     colors: Optional[List[List[float]]] = None
 
 
+class MeshingPolicy(BaseModel):
+    # "preview" and "full" pick a default triangle budget; max_triangles overrides it
+    mode: Literal["preview", "full"] = "preview"
+    max_triangles: Optional[int] = Field(default=None, gt=0)
+    # Marching cubes step in voxels; None picks one that fits the triangle budget
+    step_size: Optional[int] = Field(default=None, ge=1)
+
+
+class MeshingInfo(BaseModel):
+    mode: str
+    step_size: int
+    vertices: int
+    triangles: int
+    spacing: List[float]
+    units: str = "mm"
+    timings: Dict[str, float]
+
+
 class SegmentationResponse(BaseModel):
     mesh_data: MeshData
     label_names: Dict[str, str]
     case_id: str
+    meshing: Optional[MeshingInfo] = None
 
 
 class SimulationRequest(BaseModel):
@@ -72,7 +123,18 @@ class STLFileInfo(BaseModel):
     voxels: int
 
 
+class RegionStatus(BaseModel):
+    filename: str
+    name: str
+    label: int
+    voxels: int
+    # pending -> meshing -> ready, or skipped when no surface could be built
+    status: Literal["pending", "meshing", "ready", "skipped"]
+
+
 class STLListResponse(BaseModel):
     case_id: str
     stl_files: List[STLFileInfo]
-    status: str
\ No newline at end of file
+    status: str
+    # Every region of the build in meshing order, with its status
+    regions: List[RegionStatus] = []
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""
+Admin-only endpoints: profiling and storage collection
+"""
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from app.services.profiler import PROFILER_ADMIN_TOKEN, PROFILER_MAX_SECONDS, admin_token_valid, attach, get_profiler
+from app.services.storage_manager import get_storage_manager
+from typing import Optional
+
+router = APIRouter()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not PROFILER_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not admin_token_valid(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+def _collapsed_response(profile) -> PlainTextResponse:
+    return PlainTextResponse(
+        profile.collapsed(),
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{profile.id}.folded"',
+            "X-Profile-Id": profile.id
+        }
+    )
+
+
+@router.post("/profile", dependencies=[Depends(require_admin)])
+async def profile_worker(seconds: float = Query(10, gt=0, le=PROFILER_MAX_SECONDS)):
+    """
+    Sample every thread of this worker (request handlers, background tasks,
+    write-behind thread) for `seconds` and return collapsed stacks for a
+    flamegraph.
+    """
+    profile = await attach(seconds)
+    return _collapsed_response(profile)
+
+
+@router.get("/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """
+    Recent profiles, including those recorded for requests sent with X-Profile: 1
+    """
+    return {"profiles": get_profiler().list()}
+
+
+@router.get("/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def download_profile(profile_id: str):
+    """
+    Download a recorded profile as collapsed stacks
+    """
+    profile = get_profiler().get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return _collapsed_response(profile)
+
+
+@router.post("/storage/collect", dependencies=[Depends(require_admin)])
+def collect_storage():
+    """
+    Run a storage garbage collection pass now (TTL, per-case quota, LRU)
+    """
+    return get_storage_manager().collect()
+
+
+@router.delete("/storage/cases/{case_id}", dependencies=[Depends(require_admin)])
+def evict_case(case_id: str):
+    """
+    Delete a case's data now; refused while a job holds the case or is queued for it
+    """
+    storage = get_storage_manager()
+    if storage.case_footprint(case_id) is None:
+        raise HTTPException(status_code=404, detail=f"No stored data for case {case_id}")
+    freed = storage.evict(case_id)
+    if freed is None:
+        raise HTTPException(status_code=409, detail=f"Case {case_id} is in use")
+    return {"case_id": case_id, "freed_bytes": freed}
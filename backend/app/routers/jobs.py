@@ -0,0 +1,61 @@
+"""
+Router for queued segmentation jobs and their progress events
+"""
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.routers.stl import stl_listing
+from app.services.job_queue import FAILED, QUEUED, RUNNING, get_event_log, get_job_queue
+from typing import Optional
+
+router = APIRouter()
+
+
+@router.get("")
+def queue_stats():
+    """
+    Jobs per state and the workers with a recent heartbeat
+    """
+    return get_job_queue().stats()
+
+
+@router.get("/{case_id}")
+def case_jobs(case_id: str):
+    """
+    State, attempts and result or last error of each job queued for a case
+    """
+    jobs = get_job_queue().jobs_for_case(case_id)
+    if not jobs:
+        raise HTTPException(status_code=404, detail=f"No jobs for case {case_id}")
+    return {"case_id": case_id, "jobs": jobs}
+
+
+@router.get("/{case_id}/events")
+async def case_events(case_id: str, last_event_id: Optional[str] = Header(None)):
+    """
+    Server-sent events for a case's segmentation: "stage" transitions, a
+    "mesh_ready" per region as its STL file is written, then "done" (with
+    every STL file) or "failed". Reconnecting with Last-Event-ID resumes
+    after the last event received.
+    """
+    async def snapshot():
+        # No recorded events: describe whatever is already there
+        jobs = await run_in_threadpool(get_job_queue().jobs_for_case, case_id)
+        if any(job["state"] == FAILED for job in jobs):
+            return [{"event": "failed", "data": {"error": jobs[-1]["error"]}}]
+        listing = await run_in_threadpool(stl_listing, case_id)
+        events = [{"event": "mesh_ready", "data": info.model_dump()} for info in listing.stl_files]
+        if not any(job["state"] in (QUEUED, RUNNING) for job in jobs):
+            events.append({"event": "done", "data": {"stl_files": [info.model_dump() for info in listing.stl_files]}})
+        return events
+
+    try:
+        after = int(last_event_id or 0)
+    except ValueError:
+        after = 0
+    return StreamingResponse(
+        get_event_log().stream(case_id, after, snapshot),
+        media_type="text/event-stream",
+        # Proxies must pass events through as they come
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,6 +1,9 @@
 from fastapi import APIRouter, HTTPException
-from app.models.schemas import SegmentationResponse, MeshData
+from typing import Optional
+from app.models.schemas import SegmentationResponse, MeshData, MeshingPolicy
 from app.services.segmentation_engine import process_dicom_to_mesh
+from app.services.serialization import FastJSONResponse
+from app.services.storage_manager import get_storage_manager
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -8,21 +11,29 @@ router = APIRouter()
 
 class SegmentRequest(BaseModel):
     case_id: str
+    # Omitted: a preview-mode mesh
+    meshing: Optional[MeshingPolicy] = None
 
 
-@router.post("/segment", response_model=SegmentationResponse)
+@router.post("/segment", response_model=SegmentationResponse, response_class=FastJSONResponse)
 async def segment_brain(request: SegmentRequest):
     """
     Perform AI-powered segmentation of brain structures
     Processes uploaded DICOM slices or single volume files
     Uses marching cubes algorithm to generate 3D mesh from medical imaging data
+    Pass meshing={"mode": "full"} (or a max_triangles budget) for a
+    high-fidelity mesh; vertices are in millimetres
     """
     case_id = request.case_id
 
     # Process DICOM files and generate 3D mesh
     # If case has DICOM files, performs actual 3D reconstruction from 2D slices
     # Falls back to mock data if no DICOM files are found
-    mesh_data = process_dicom_to_mesh(case_id)
+    # Pinned so the scans can't be evicted while they are being read
+    storage = get_storage_manager()
+    with storage.pin(case_id):
+        storage.touch(case_id)
+        mesh_data, meshing = process_dicom_to_mesh(case_id, request.meshing)
 
     label_names = {
         "0": "skull",
@@ -31,8 +42,10 @@ async def segment_brain(request: SegmentRequest):
         "3": "tumor"
     }
 
-    return SegmentationResponse(
+    # Returned as a response so FastAPI doesn't revalidate the mesh against response_model
+    return FastJSONResponse(SegmentationResponse.model_construct(
         mesh_data=mesh_data,
         label_names=label_names,
-        case_id=case_id
-    )
+        case_id=case_id,
+        meshing=meshing
+    ))
@@ -1,11 +1,12 @@
 from fastapi import APIRouter, HTTPException
 from app.models.schemas import SimulationRequest, SimulationResponse
 from app.services.fea_simulator import perform_tumor_removal_simulation
+from app.services.serialization import FastJSONResponse
 
 router = APIRouter()
 
 
-@router.post("/simulate", response_model=SimulationResponse)
+@router.post("/simulate", response_model=SimulationResponse, response_class=FastJSONResponse)
 async def simulate_surgery(request: SimulationRequest):
     """
     Perform finite element analysis simulation of tumor removal
@@ -16,6 +17,7 @@ async def simulate_surgery(request: SimulationRequest):
             remove_region=request.remove_region,
             skull_opening_size=request.skull_opening_size
         )
-        return result
+        # Returned as a response so FastAPI doesn't revalidate the mesh against response_model
+        return FastJSONResponse(result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Simulation error: {str(e)}")
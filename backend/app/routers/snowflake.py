@@ -1,30 +1,76 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from app.models.schemas import SnowflakeSimulationData
-from app.services.snowflake_service import save_simulation, get_similar_cases
-from typing import List
+from app.services.snowflake_service import save_simulation, get_similar_cases, get_case_statistics, get_writer_stats
+from app.services.write_buffer import WriteBufferFull
+from typing import List, Optional
 
 router = APIRouter()
 
 
-@router.post("/save")
+@router.post("/save", status_code=202)
 async def save_simulation_data(data: SnowflakeSimulationData):
     """
     Save simulation data to Snowflake
+    The row is journaled and queued; it appears in queries once the write
+    buffer flushes it. record_id identifies the row in the case store.
     """
     try:
         result = await save_simulation(data)
-        return {"status": "success", "message": "Simulation data saved", "case_id": data.case_id}
+        return {
+            "status": "queued",
+            "message": "Simulation data accepted; it will be stored on the next flush",
+            "case_id": data.case_id,
+            "record_id": result["record_id"]
+        }
+    except WriteBufferFull as e:
+        raise HTTPException(status_code=503, detail=f"Save queue is full: {str(e)}", headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Snowflake save error: {str(e)}")
 
 
 @router.get("/similar/{tumor_location}")
-async def find_similar_cases(tumor_location: str, limit: int = 5):
+async def find_similar_cases(
+    tumor_location: str,
+    limit: int = 5,
+    tumor_volume: Optional[float] = None,
+    max_displacement: Optional[float] = None,
+    avg_stress: Optional[float] = None,
+    affected_regions: Optional[List[str]] = Query(None)
+):
     """
-    Find similar cases from Snowflake based on tumor location
+    Find the top-k most similar cases by tumor location and, when given,
+    tumor volume, displacement, stress and affected regions.
+    Each case carries a similarity score between 0 and 1.
     """
     try:
-        cases = await get_similar_cases(tumor_location, limit)
+        cases = await get_similar_cases(
+            tumor_location,
+            limit,
+            tumor_volume=tumor_volume,
+            max_displacement=max_displacement,
+            avg_stress=avg_stress,
+            affected_regions=affected_regions
+        )
         return {"similar_cases": cases, "count": len(cases)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Snowflake query error: {str(e)}")
+
+
+@router.get("/statistics")
+async def case_statistics(top_k: int = Query(5, ge=1, le=100)):
+    """
+    Running aggregates across all saved cases: count, mean, variance and
+    range of displacement and stress, plus the most common tumor locations
+    """
+    try:
+        return await get_case_statistics(top_k)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Snowflake query error: {str(e)}")
+
+
+@router.get("/writer")
+async def writer_status():
+    """
+    Write-behind buffer metrics: queue depth, flush counts and latency
+    """
+    return await get_writer_stats()
@@ -2,14 +2,18 @@
 Router for STL file management
 """
 from fastapi import APIRouter, HTTPException
-from app.models.schemas import STLListResponse, STLFileInfo
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, RedirectResponse
+from app.models.schemas import RegionStatus, STLListResponse, STLFileInfo
+from app.services.artifact_store import get_artifact_store
+from app.services.object_store import data_path
+from app.services.storage_manager import get_storage_manager
 from typing import List
 import os
-import glob
 
 router = APIRouter()
 
-STL_BASE_DIR = "stl"
+STL_BASE_DIR = data_path("stl")
 os.makedirs(STL_BASE_DIR, exist_ok=True)
 
 
@@ -17,22 +21,37 @@ os.makedirs(STL_BASE_DIR, exist_ok=True)
 async def list_stl_files(case_id: str):
     """
     List all STL files for a given case ID.
+    While a case is still being meshed this lists the regions finished so
+    far (status "partial"), and `regions` gives every region's status.
     """
-    case_stl_dir = os.path.join(STL_BASE_DIR, case_id)
+    # The artifact store may be a remote bucket, so this runs off the event loop
+    return await run_in_threadpool(stl_listing, case_id)
+
+
+def stl_listing(case_id: str) -> STLListResponse:
+    """The STL listing for a case (blocking; see list_stl_files)"""
+    store = get_artifact_store()
+    stl_filenames = store.case_stl_files(case_id, STL_BASE_DIR)
     
-    if not os.path.exists(case_stl_dir):
+    if stl_filenames is None:
         return STLListResponse(
             case_id=case_id,
             stl_files=[],
             status="no_stl_files_found"
         )
     
-    # Find all STL files
-    stl_files = glob.glob(os.path.join(case_stl_dir, "*.stl"))
+    regions = [RegionStatus(**region) for region in store.case_regions(case_id, STL_BASE_DIR) or []]
+    known = {region.filename: region for region in regions}
     
     stl_info_list = []
-    for stl_path in stl_files:
-        filename = os.path.basename(stl_path)
+    for filename in stl_filenames:
+        if filename in known:
+            region = known[filename]
+            stl_info_list.append(STLFileInfo(
+                filename=filename, name=region.name, label=region.label, voxels=region.voxels
+            ))
+            continue
+        
         # Extract region name from filename (remove .stl and label suffix if present)
         name = filename.replace(".stl", "")
         # Remove trailing _number pattern if present
@@ -56,10 +75,16 @@ async def list_stl_files(case_id: str):
             voxels=0  # We don't store voxel count in STL files
         ))
     
+    if any(region.status in ("pending", "meshing") for region in regions):
+        status = "partial" if stl_info_list else "processing"
+    else:
+        status = "ready" if stl_info_list else "processing"
+    
     return STLListResponse(
         case_id=case_id,
         stl_files=stl_info_list,
-        status="ready" if stl_info_list else "processing"
+        status=status,
+        regions=regions
     )
 
 
@@ -67,17 +92,32 @@ async def list_stl_files(case_id: str):
 async def get_stl_file(case_id: str, filename: str):
     """
     Serve STL file for download/viewing.
+    With a remote object store this redirects to a presigned URL, so the
+    client downloads straight from the store.
     """
-    case_stl_dir = os.path.join(STL_BASE_DIR, case_id)
-    stl_path = os.path.join(case_stl_dir, filename)
-    
-    if not os.path.exists(stl_path):
+    url, stl_path = await run_in_threadpool(_locate_stl_file, case_id, filename)
+    if url is not None:
+        return RedirectResponse(url, status_code=307)
+    if stl_path is None:
         raise HTTPException(status_code=404, detail="STL file not found")
     
-    from fastapi.responses import FileResponse
     return FileResponse(
         stl_path,
         media_type="application/octet-stream",
         filename=filename
     )
 
+
+def _locate_stl_file(case_id: str, filename: str):
+    """
+    (presigned URL, None) or (None, local path) for one STL file, or
+    (None, None) if there is no such file. Blocking: a remote store may be
+    asked for the case's link and the object itself.
+    """
+    store = get_artifact_store()
+    url = store.case_stl_url(case_id, filename)
+    stl_path = None if url is not None else store.case_stl_path(case_id, filename, STL_BASE_DIR)
+    if url is not None or stl_path is not None:
+        get_storage_manager().touch(case_id)
+    return url, stl_path
+
@@ -0,0 +1,27 @@
+"""
+Router for disk usage of case data
+"""
+from fastapi import APIRouter, HTTPException
+from app.services.storage_manager import get_storage_manager
+
+router = APIRouter()
+
+
+@router.get("/usage")
+def storage_usage():
+    """
+    Bytes on disk per area (uploads, temp_seg, stl, artifacts), case
+    counts, pinned cases and garbage collection statistics
+    """
+    return get_storage_manager().usage()
+
+
+@router.get("/cases/{case_id}")
+def case_footprint(case_id: str):
+    """
+    Bytes a case uses per area, plus the content-addressed outputs it links to
+    """
+    footprint = get_storage_manager().case_footprint(case_id)
+    if footprint is None:
+        raise HTTPException(status_code=404, detail=f"No stored data for case {case_id}")
+    return footprint
@@ -1,20 +1,122 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from app.models.schemas import UploadResponse
-from app.services.nifti_to_stl import process_nifti_to_stl_files
+from fastapi import APIRouter, UploadFile, File, HTTPException, Header, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from app.models.schemas import UploadResponse, UploadedFile, UploadSessionCreate, UploadProgress
+from app.services.artifact_store import fileset_digest, get_artifact_store
+from app.services.job_queue import FAILED, QUEUED, SUCCEEDED, get_event_log, get_job_queue
+from app.services.nifti_to_stl import publish_done
+from app.services.object_store import data_path
+from app.services.storage_manager import get_storage_manager
+from app.services.upload_stream import (
+    MAX_UPLOAD_FILE_BYTES, MAX_UPLOAD_TOTAL_BYTES, UploadTooLarge, stream_to_disk
+)
+from app.services.upload_sessions import (
+    UploadIncomplete, UploadOffsetMismatch, UploadSessionNotFound,
+    abort_session, create_session, finalize_session, get_progress, load_session, write_chunk
+)
 from typing import List
 import uuid
+import logging
 import os
-import aiofiles
-import asyncio
+import shutil
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-UPLOAD_DIR = "uploads"
+UPLOAD_DIR = data_path("uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+ALLOWED_EXTENSIONS = {'.nii', '.nii.gz', '.dcm', '.png', '.jpg', '.jpeg'}
+
+
+def _check_extension(filename: str):
+    """Raise a 400 unless the file is a supported scan format"""
+    file_ext = os.path.splitext(filename)[1].lower()
+
+    if file_ext == '.gz':
+        # Handle .nii.gz
+        if not filename.lower().endswith('.nii.gz'):
+            raise HTTPException(status_code=400, detail=f"Invalid file format: {filename}")
+        file_ext = '.nii.gz'
+
+    if file_ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File format not supported: {filename}. Allowed: {ALLOWED_EXTENSIONS}"
+        )
+
+
+def _start_processing(
+    case_id: str,
+    case_dir: str,
+    files: List[UploadedFile]
+) -> str:
+    """
+    Kick off segmentation for a complete upload and return its status.
+    Blocking (SQLite, object store, possibly waiting out an eviction);
+    call it through run_in_threadpool from request handlers.
+    """
+    content_digest = fileset_digest(f.sha256 for f in files)
+    uploaded_files = [f.filename for f in files]
+
+    # Determine file type for status message
+    file_types = set([os.path.splitext(f)[1].lower() for f in uploaded_files])
+    if '.dcm' in file_types:
+        status = f"uploaded_{len(uploaded_files)}_dicom_slices"
+    else:
+        status = "uploaded"
+    
+    # If .nii.gz file uploaded, queue automatic segmentation for the workers
+    has_nifti = any(f.lower().endswith('.nii.gz') or f.lower().endswith('.nii') for f in uploaded_files)
+    # Pinned before the lookup, so the outputs can't be evicted between checking and linking them
+    with get_storage_manager().pin(case_id, content_digest):
+        if has_nifti:
+            # Find the NIfTI file
+            nifti_file = None
+            for f in uploaded_files:
+                if f.lower().endswith('.nii.gz') or f.lower().endswith('.nii'):
+                    nifti_file = os.path.join(case_dir, f)
+                    break
+        
+            store = get_artifact_store()
+            manifest = None
+            # Eviction in any process takes this lock, so the outputs outlive the lookup.
+            # If a build holds it, the outputs aren't complete yet: the queued job reuses them
+            lock = store.build_lock(content_digest)
+            if lock.acquire(blocking=False):
+                try:
+                    manifest = store.lookup(content_digest)
+                    if manifest is not None:
+                        store.link_case(case_id, content_digest)
+                finally:
+                    lock.release()
+            if manifest is not None:
+                # Same scans were processed before; reuse their outputs
+                publish_done(case_id, manifest["stl_files"])
+                status = "uploaded_and_segmented"
+            elif nifti_file and os.path.exists(nifti_file):
+                try:
+                    # Keyed by case, so finalizing the same upload twice queues one job
+                    job = get_job_queue().enqueue(
+                        "segment", case_id, {"input_file": nifti_file, "content_digest": content_digest}
+                    )
+                    if job["state"] == QUEUED and job["attempts"] == 0:
+                        get_event_log().publish(case_id, "stage", {"stage": "queued"})
+                    if job["state"] == SUCCEEDED:
+                        status = "uploaded_and_segmented"
+                    elif job["state"] == FAILED:
+                        status = "segmentation_failed"
+                    else:
+                        status = "uploaded_and_segmenting"
+                except Exception as e:
+                    logger.warning(f"Could not queue segmentation: {e}")
+                    status = "uploaded"
+
+    return status
+
 
 @router.post("/upload", response_model=UploadResponse)
-async def upload_scan(files: List[UploadFile] = File(...), background_tasks: BackgroundTasks = BackgroundTasks()):
+async def upload_scan(files: List[UploadFile] = File(...)):
     """
     Upload brain scan file(s) - supports single file or multiple DICOM slices
     For DICOM: Upload multiple .dcm files representing 2D slices
@@ -27,68 +129,137 @@ async def upload_scan(files: List[UploadFile] = File(...), background_tasks: Bac
     case_dir = os.path.join(UPLOAD_DIR, case_id)
     os.makedirs(case_dir, exist_ok=True)
 
-    # Validate file types
-    allowed_extensions = {'.nii', '.nii.gz', '.dcm', '.png', '.jpg', '.jpeg'}
     uploaded_files = []
+    file_info = []
+    total_bytes = 0
 
-    for file in files:
-        file_ext = os.path.splitext(file.filename)[1].lower()
-
-        if file_ext == '.gz':
-            # Handle .nii.gz
-            if not file.filename.lower().endswith('.nii.gz'):
-                raise HTTPException(status_code=400, detail=f"Invalid file format: {file.filename}")
-            file_ext = '.nii.gz'
-
-        if file_ext not in allowed_extensions:
-            raise HTTPException(
-                status_code=400,
-                detail=f"File format not supported: {file.filename}. Allowed: {allowed_extensions}"
-            )
+    # Pinned while the files are still arriving
+    receiving = get_storage_manager().pin(case_id)
+    try:
+        for file in files:
+            _check_extension(file.filename)
 
-        # Save file in case directory
-        file_path = os.path.join(case_dir, file.filename)
+            # Save file in case directory
+            file_path = os.path.join(case_dir, file.filename)
 
-        try:
-            async with aiofiles.open(file_path, 'wb') as f:
-                content = await file.read()
-                await f.write(content)
-            uploaded_files.append(file.filename)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Error saving file {file.filename}: {str(e)}")
-
-    # Determine file type for status message
-    file_types = set([os.path.splitext(f)[1].lower() for f in uploaded_files])
-    if '.dcm' in file_types:
-        status = f"uploaded_{len(uploaded_files)}_dicom_slices"
-    else:
-        status = "uploaded"
-    
-    # If .nii.gz file uploaded, trigger automatic segmentation in background
-    has_nifti = any(f.lower().endswith('.nii.gz') or f.lower().endswith('.nii') for f in uploaded_files)
-    if has_nifti:
-        # Find the NIfTI file
-        nifti_file = None
-        for f in uploaded_files:
-            if f.lower().endswith('.nii.gz') or f.lower().endswith('.nii'):
-                nifti_file = os.path.join(case_dir, f)
-                break
-        
-        if nifti_file and os.path.exists(nifti_file):
-            # Run segmentation in background
             try:
-                background_tasks.add_task(
-                    process_nifti_to_stl_files,
-                    nifti_file,
-                    case_id
+                # Streamed in chunks; the limit is whatever is left of the per-request budget
+                size, sha256 = await stream_to_disk(
+                    file, file_path, max_bytes=min(MAX_UPLOAD_FILE_BYTES, MAX_UPLOAD_TOTAL_BYTES - total_bytes)
                 )
-                status = "uploaded_and_segmenting"
+                total_bytes += size
+                uploaded_files.append(file.filename)
+                file_info.append(UploadedFile(filename=file.filename, size=size, sha256=sha256))
+            except UploadTooLarge as e:
+                shutil.rmtree(case_dir, ignore_errors=True)
+                raise HTTPException(status_code=413, detail=str(e))
             except Exception as e:
-                print(f"Warning: Could not start background segmentation: {e}")
-                status = "uploaded"
+                raise HTTPException(status_code=500, detail=f"Error saving file {file.filename}: {str(e)}")
+
+        status = await run_in_threadpool(_start_processing, case_id, case_dir, file_info)
+    finally:
+        receiving.release()
 
     return UploadResponse(
         case_id=case_id,
         filename=f"{len(uploaded_files)} files" if len(uploaded_files) > 1 else uploaded_files[0],
-        status=status
+        status=status,
+        files=file_info
+    )
+
+
+@router.post("/uploads", response_model=UploadProgress, status_code=201)
+async def create_upload(request: UploadSessionCreate):
+    """
+    Start a resumable upload by declaring the files to be sent.
+    Returns the case_id used for every following call.
+    """
+    for file in request.files:
+        _check_extension(file.filename)
+    try:
+        progress = create_session(UPLOAD_DIR, [file.model_dump() for file in request.files])
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return progress
+
+
+@router.get("/uploads/{case_id}", response_model=UploadProgress)
+async def get_upload_progress(case_id: str):
+    """
+    Bytes received so far for each file; resume each file from its offset
+    """
+    try:
+        return get_progress(UPLOAD_DIR, case_id)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail=f"No upload in progress for case {case_id}")
+
+
+@router.put("/uploads/{case_id}/files/{filename}")
+async def upload_chunk(
+    case_id: str,
+    filename: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset")
+):
+    """
+    Append the request body to a file, starting at the Upload-Offset header.
+    A mismatched offset gets a 409 carrying the offset to resume from.
+    """
+    try:
+        # An upload that is still receiving chunks counts as in use; unknown
+        # case ids 404 before they can reach the LRU table
+        load_session(UPLOAD_DIR, case_id)
+        get_storage_manager().touch(case_id)
+        offset = await write_chunk(UPLOAD_DIR, case_id, filename, upload_offset, request.stream())
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail=f"No upload in progress for case {case_id}")
+    except UploadOffsetMismatch as e:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": str(e), "offset": e.expected},
+            headers={"Upload-Offset": str(e.expected)}
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse({"filename": filename, "offset": offset}, headers={"Upload-Offset": str(offset)})
+
+
+@router.post("/uploads/{case_id}/finalize", response_model=UploadResponse)
+async def finalize_upload(case_id: str):
+    """
+    Complete a resumable upload and start processing, exactly as /upload does
+    """
+    try:
+        files = await finalize_session(UPLOAD_DIR, case_id)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail=f"No upload in progress for case {case_id}")
+    except UploadIncomplete as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    file_info = [UploadedFile(**f) for f in files]
+    status = await run_in_threadpool(_start_processing, case_id, os.path.join(UPLOAD_DIR, case_id), file_info)
+    return UploadResponse(
+        case_id=case_id,
+        filename=f"{len(files)} files" if len(files) > 1 else files[0]["filename"],
+        status=status,
+        files=file_info
     )
+
+
+@router.delete("/uploads/{case_id}", status_code=204)
+async def abort_upload(case_id: str):
+    """
+    Abandon an unfinished upload and delete what was received
+    """
+    try:
+        abort_session(UPLOAD_DIR, case_id)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail=f"No upload in progress for case {case_id}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,323 @@
+"""
+Content-addressed store for segmentation outputs.
+
+Uploads are identified by the SHA-256 of their file set (the sorted SHA-256
+digests of the files, so names and upload order don't matter). Pipeline
+outputs for a file set live under artifacts/<digest>/:
+
+    segmentation/   segmented volume and per-region NIfTI files
+    stl/            one STL per region
+    regions.json    per-region build status, rewritten as each region is meshed
+    manifest.json   STL file list, written last to mark the outputs complete
+
+Each case records which digest it belongs to (cases/<case_id>), so a
+re-upload of the same scans is linked to the existing outputs with one
+small write instead of running segmentation and meshing again.
+
+Builds of one digest are serialized across processes on the node by a
+file lock (artifacts/<digest>.lock), so two workers, or a worker whose job
+lease expired while it was still running and the worker that took the job
+over, never build the same outputs at once. Linking a re-upload to
+existing outputs and evicting outputs take the same lock, so outputs are
+never deleted between a lookup and the link that reuses them. Each build writes into its own
+scratch directory (artifacts/.build/<digest>-<id>/) rather than the shared
+one, and only finished files are moved into place: publish_region() moves
+each STL file as soon as it is meshed, and publish() writes the manifest
+and moves the segmentation volumes. Scratch left by an interrupted build
+is dropped by the next build of the same digest.
+
+Published outputs and case links go through the configured ObjectStore
+(see object_store). With the local backend "moving into place" is a
+rename under the artifacts directory. With a remote backend it is an
+upload, the scratch directory is dropped after publish(), and reads come
+back through the node-local cache or as presigned URLs.
+
+Regions marked ready in regions.json can be listed and downloaded before
+the manifest exists, so clients see the first structures while the rest
+are still being meshed.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from app.services.file_lock import FileLock
+from app.services.object_store import ObjectNotFound, ObjectStore, data_path, make_object_store
+
+ARTIFACT_DIR = os.path.abspath(os.getenv("ARTIFACT_DIR") or data_path("artifacts"))
+MANIFEST_FILE = "manifest.json"
+REGIONS_FILE = "regions.json"
+READY = "ready"
+# Per-build scratch directories, under the artifacts directory so moves into place are renames
+BUILD_DIR = ".build"
+# Remote case links kept in memory, least recently used dropped first
+CASE_LINK_CACHE_SIZE = 4096
+
+
+def fileset_digest(file_hashes: Iterable[str]) -> str:
+    """Digest of a set of files, given each file's SHA-256 hex digest"""
+    hasher = hashlib.sha256()
+    for file_hash in sorted(file_hashes):
+        hasher.update(bytes.fromhex(file_hash))
+    return hasher.hexdigest()
+
+
+class ArtifactStore:
+    """
+    Digest-keyed pipeline outputs plus the case -> digest mapping.
+    build_lock(digest) serializes pipeline runs for the same content across
+    threads and processes, so concurrent duplicate uploads compute it only once.
+    """
+
+    def __init__(self, root: str = ARTIFACT_DIR, objects: Optional[ObjectStore] = None):
+        self.root = root
+        self.objects = objects or make_object_store("artifacts", root)
+        self._cases_dir = os.path.join(root, "cases")
+        os.makedirs(self._cases_dir, exist_ok=True)
+        # Remote case links are cached (LRU). Another process may unlink a
+        # case, so an entry is dropped when its digest's objects are missing
+        self._case_digests: "OrderedDict[str, str]" = OrderedDict()
+        self._case_digests_lock = threading.Lock()
+
+    @property
+    def remote(self) -> bool:
+        return self.objects.remote
+
+    def artifact_dir(self, digest: str) -> str:
+        return os.path.join(self.root, digest)
+
+    def segmentation_dir(self, digest: str) -> str:
+        return os.path.join(self.artifact_dir(digest), "segmentation")
+
+    def stl_dir(self, digest: str) -> str:
+        return os.path.join(self.artifact_dir(digest), "stl")
+
+    def stl_key(self, digest: str, filename: str) -> str:
+        return f"{digest}/stl/{filename}"
+
+    def build_lock(self, digest: str) -> FileLock:
+        """Exclusive right to build digest's outputs; use as a context manager"""
+        return FileLock(os.path.join(self.root, f"{digest}.lock"))
+
+    def lookup(self, digest: str) -> Optional[Dict[str, Any]]:
+        """The manifest for a digest, or None if no complete outputs exist"""
+        try:
+            # Manifests are immutable once published, so remote ones are read through the cache
+            path = self.objects.local_path(f"{digest}/{MANIFEST_FILE}")
+        except ObjectNotFound:
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def start_build(self, digest: str) -> str:
+        """
+        A fresh scratch directory for one build of digest, with segmentation/
+        and stl/ inside (caller holds build_lock). Scratch of earlier builds
+        of the digest is dropped: their builders are gone, or they would
+        still hold the lock.
+        """
+        builds = os.path.join(self.root, BUILD_DIR)
+        os.makedirs(builds, exist_ok=True)
+        for name in os.listdir(builds):
+            if name.startswith(f"{digest}-"):
+                shutil.rmtree(os.path.join(builds, name), ignore_errors=True)
+        build_dir = os.path.join(builds, f"{digest}-{uuid.uuid4().hex[:8]}")
+        os.makedirs(os.path.join(build_dir, "segmentation"))
+        os.makedirs(os.path.join(build_dir, "stl"))
+        return build_dir
+
+    def discard_build(self, build_dir: str):
+        """Drop a build's scratch directory (after a failure, or once published)"""
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+    def publish_region(self, digest: str, info: Dict[str, Any]):
+        """
+        Move one STL file from the build into place as soon as it is built.
+        On the local backend info["path"] is updated to the stored file.
+        """
+        self.objects.move_file(self.stl_key(digest, info["filename"]), info["path"])
+        if not self.remote:
+            info["path"] = os.path.join(self.stl_dir(digest), info["filename"])
+
+    def write_regions(self, digest: str, regions: Dict[str, Any]):
+        """Replace the digest's per-region build status"""
+        self.objects.write(f"{digest}/{REGIONS_FILE}", [json.dumps(regions).encode("utf-8")])
+
+    def regions(self, digest: str) -> Optional[List[Dict[str, Any]]]:
+        """Per-region build status, or None for outputs built before it was recorded"""
+        try:
+            # Rewritten during a build, so never read through the cache
+            return json.loads(self.objects.read_bytes(f"{digest}/{REGIONS_FILE}"))["regions"]
+        except ObjectNotFound:
+            return None
+
+    def publish(self, digest: str, stl_files: List[Dict[str, Any]], build_dir: str):
+        """
+        Write the manifest, marking the digest's outputs complete, and retire
+        the build directory. The STL files were already stored one by one
+        with publish_region(). Locally the segmentation volumes are renamed
+        into place (purge_intermediates may drop them next); with a remote
+        backend they were only scratch.
+        """
+        manifest = {
+            "digest": digest,
+            "stl_files": [
+                {key: value for key, value in info.items() if key != "path"} for info in stl_files
+            ]
+        }
+        self.objects.write(f"{digest}/{MANIFEST_FILE}", [json.dumps(manifest).encode("utf-8")])
+        if not self.remote:
+            segmentation_dir = self.segmentation_dir(digest)
+            # Left by an older build of the digest; only the lock holder touches it
+            shutil.rmtree(segmentation_dir, ignore_errors=True)
+            os.makedirs(self.artifact_dir(digest), exist_ok=True)
+            os.replace(os.path.join(build_dir, "segmentation"), segmentation_dir)
+        self.discard_build(build_dir)
+
+    def case_link_path(self, case_id: str) -> str:
+        """The local file holding a case's link (local backend only)"""
+        return os.path.join(self._cases_dir, os.path.basename(case_id))
+
+    def _case_key(self, case_id: str) -> str:
+        return f"cases/{os.path.basename(case_id)}"
+
+    def _remember_case(self, case_id: str, digest: str):
+        with self._case_digests_lock:
+            self._case_digests[case_id] = digest
+            self._case_digests.move_to_end(case_id)
+            while len(self._case_digests) > CASE_LINK_CACHE_SIZE:
+                self._case_digests.popitem(last=False)
+
+    def _forget_case(self, case_id: str):
+        with self._case_digests_lock:
+            self._case_digests.pop(case_id, None)
+
+    def link_case(self, case_id: str, digest: str):
+        """Point a case at the outputs for its content"""
+        self.objects.write(self._case_key(case_id), [digest.encode("utf-8")])
+        if self.remote:
+            self._remember_case(case_id, digest)
+
+    def unlink_case(self, case_id: str):
+        self.objects.delete(self._case_key(case_id))
+        self._forget_case(case_id)
+
+    def case_digest(self, case_id: str) -> Optional[str]:
+        with self._case_digests_lock:
+            digest = self._case_digests.get(case_id)
+            if digest is not None:
+                self._case_digests.move_to_end(case_id)
+                return digest
+        try:
+            digest = self.objects.read_bytes(self._case_key(case_id)).decode("utf-8").strip()
+        except ObjectNotFound:
+            return None
+        if self.remote:
+            self._remember_case(case_id, digest)
+        return digest
+
+    def case_ids(self) -> List[str]:
+        """Cases linked to a digest"""
+        return [key[len("cases/"):] for key in self.objects.list("cases/")]
+
+    def linked_cases(self, digest: str, known: Optional[Dict[str, str]] = None) -> List[str]:
+        """
+        Cases linked to digest. known maps case IDs to digests already read
+        (e.g. during a GC scan); only links missing from it are read.
+        """
+        known = known or {}
+        return [
+            case_id for case_id in self.case_ids()
+            if (known[case_id] if case_id in known else self.case_digest(case_id)) == digest
+        ]
+
+    def case_stl_dir(self, case_id: str, stl_base_dir: str) -> str:
+        """Where a case's STL files are built: its digest's outputs, or the legacy per-case dir"""
+        digest = self.case_digest(case_id)
+        if digest is not None:
+            return self.stl_dir(digest)
+        return os.path.join(stl_base_dir, case_id)
+
+    def case_regions(self, case_id: str, stl_base_dir: str) -> Optional[List[Dict[str, Any]]]:
+        """Per-region build status of a case's outputs, or None if none was recorded"""
+        digest = self.case_digest(case_id)
+        if digest is not None:
+            return self.regions(digest)
+        try:
+            with open(os.path.join(stl_base_dir, case_id, REGIONS_FILE), encoding="utf-8") as f:
+                return json.load(f)["regions"]
+        except FileNotFoundError:
+            return None
+
+    def _ready_files(self, digest: str) -> Optional[List[str]]:
+        """Filenames of the digest's finished STL files: all of them once published, else the ready regions"""
+        manifest = self.lookup(digest)
+        if manifest is not None:
+            return [info["filename"] for info in manifest["stl_files"]]
+        regions = self.regions(digest)
+        if regions is not None:
+            return [region["filename"] for region in regions if region["status"] == READY]
+        return None
+
+    def case_stl_files(self, case_id: str, stl_base_dir: str) -> Optional[List[str]]:
+        """
+        Filenames of a case's STL files so far: the published list, the
+        regions meshed so far, or what a build on this node has written.
+        None if nothing is there yet.
+        """
+        digest = self.case_digest(case_id)
+        if digest is not None:
+            ready = self._ready_files(digest)
+            if ready is None:
+                # The cached link may be stale (outputs evicted elsewhere)
+                self._forget_case(case_id)
+        else:
+            regions = self.case_regions(case_id, stl_base_dir)
+            ready = None if regions is None else [r["filename"] for r in regions if r["status"] == READY]
+        if ready is not None:
+            return ready
+        stl_dir = self.case_stl_dir(case_id, stl_base_dir)
+        if not os.path.isdir(stl_dir):
+            return None
+        return sorted(name for name in os.listdir(stl_dir) if name.endswith(".stl"))
+
+    def case_stl_path(self, case_id: str, filename: str, stl_base_dir: str) -> Optional[str]:
+        """A local file holding one of a case's STL files, or None"""
+        path = os.path.join(self.case_stl_dir(case_id, stl_base_dir), filename)
+        if os.path.isfile(path):
+            return path
+        digest = self.case_digest(case_id)
+        if digest is None or not self.remote:
+            return None
+        try:
+            return self.objects.local_path(self.stl_key(digest, filename))
+        except ObjectNotFound:
+            self._forget_case(case_id)
+            return None
+
+    def case_stl_url(self, case_id: str, filename: str) -> Optional[str]:
+        """A presigned URL for a stored STL file, if the backend hands them out"""
+        digest = self.case_digest(case_id)
+        if digest is None or not self.remote:
+            return None
+        if filename not in (self._ready_files(digest) or ()):
+            return None
+        return self.objects.url(self.stl_key(digest, filename))
+
+
+_store: Optional[ArtifactStore] = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    """Return the process-wide artifact store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ArtifactStore(ARTIFACT_DIR)
+    return _store
@@ -0,0 +1,149 @@
+"""
+Block-wise morphology and meshing for full-resolution volumes.
+
+Volumes are split into slabs along axis 0 and the slabs are processed in a
+thread pool, so working memory is bounded by BLOCK_SLAB_DEPTH slices per
+worker rather than by the whole volume.
+
+Morphology reads each slab with a halo of extra slices on both sides, as
+wide as the operation's reach (one voxel per erosion or dilation
+iteration with the default cross structuring element). Every output voxel
+then sees exactly the neighbourhood it would in a whole-volume call, so
+results are identical. Meshing gives neighbouring slabs one shared plane,
+so each cube is meshed exactly once. Slabs are meshed in voxel units, where
+the seam vertices land exactly on the shared planes, so the duplicates
+can be welded with exact comparisons before spacing is applied.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+BLOCK_SLAB_DEPTH = int(os.getenv("BLOCK_SLAB_DEPTH", "64"))
+BLOCK_WORKERS = int(os.getenv("BLOCK_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+def _slab_ranges(depth: int, slab_depth: int) -> Iterator[Tuple[int, int]]:
+    for start in range(0, depth, slab_depth):
+        yield start, min(start + slab_depth, depth)
+
+
+def erode_dilate(
+    mask: np.ndarray,
+    erosion_iterations: int = 0,
+    dilation_iterations: int = 0,
+    slab_depth: int = BLOCK_SLAB_DEPTH,
+    workers: int = BLOCK_WORKERS
+) -> np.ndarray:
+    """
+    binary_erosion(iterations=erosion_iterations) followed by
+    binary_dilation(iterations=dilation_iterations), slab by slab
+    """
+    from scipy.ndimage import binary_dilation, binary_erosion
+
+    halo = erosion_iterations + dilation_iterations
+    out = np.empty(mask.shape, dtype=bool)
+
+    def process(bounds):
+        start, stop = bounds
+        lo, hi = max(start - halo, 0), min(stop + halo, mask.shape[0])
+        block = np.asarray(mask[lo:hi], dtype=bool)
+        if erosion_iterations:
+            block = binary_erosion(block, iterations=erosion_iterations)
+        if dilation_iterations:
+            block = binary_dilation(block, iterations=dilation_iterations)
+        out[start:stop] = block[start - lo:stop - lo]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(process, _slab_ranges(mask.shape[0], slab_depth)))
+    return out
+
+
+def boundary_faces(mask: np.ndarray, slab_depth: int = BLOCK_SLAB_DEPTH) -> int:
+    """
+    Number of voxel faces between a set and an unset voxel. Marching cubes
+    on a mask makes about two triangles per face at step_size=1, and
+    1/step_size**2 as many at larger steps.
+    """
+    depth = mask.shape[0]
+    total = 0
+    for start, stop in _slab_ranges(depth, slab_depth):
+        # One extra slice to count the faces shared with the next slab
+        block = np.asarray(mask[start:min(stop + 1, depth)], dtype=bool)
+        body = block[:stop - start]
+        total += np.count_nonzero(block[1:] != block[:-1])
+        total += np.count_nonzero(body[:, 1:] != body[:, :-1])
+        total += np.count_nonzero(body[:, :, 1:] != body[:, :, :-1])
+    return int(total)
+
+
+def marching_cubes(
+    volume: np.ndarray,
+    level: float,
+    spacing: Sequence[float] = (1.0, 1.0, 1.0),
+    step_size: int = 1,
+    slab_depth: int = BLOCK_SLAB_DEPTH,
+    workers: int = BLOCK_WORKERS,
+    **kwargs
+) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    skimage.measure.marching_cubes over slabs; returns (verts, faces,
+    normals, values) like the original, or None if no surface crosses level
+    """
+    from skimage import measure
+
+    # Slab boundaries have to land on the step grid for the cubes to line up
+    slab_depth = max(step_size, slab_depth - slab_depth % step_size)
+    depth = volume.shape[0]
+
+    def process(bounds):
+        start, stop = bounds
+        # One shared plane with the next slab
+        block = volume[start:min(stop + 1, depth)]
+        if block.shape[0] < 2:
+            return None
+        try:
+            verts, faces, normals, values = measure.marching_cubes(
+                block, level=level, step_size=step_size, **kwargs
+            )
+        except (ValueError, RuntimeError):
+            # No surface in this slab
+            return None
+        verts[:, 0] += start
+        return [verts, faces, normals, values]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        parts = [p for p in pool.map(process, _slab_ranges(depth, slab_depth)) if p is not None and len(p[0])]
+    if not parts:
+        return None
+
+    offset = 0
+    for part in parts:
+        part[1] += offset
+        offset += len(part[0])
+
+    def gather(field):
+        # Each slab's arrays are released as soon as they've been copied out
+        merged = np.concatenate([part[field] for part in parts])
+        for part in parts:
+            part[field] = None
+        return merged
+
+    verts, faces, normals, values = (gather(field) for field in range(4))
+
+    if len(parts) > 1:
+        # Vertices on a shared plane come out of both slabs; keep the first of each pair
+        seam = np.flatnonzero(np.isin(verts[:, 0], np.arange(slab_depth, depth - 1, slab_depth)))
+        _, first, inverse = np.unique(verts[seam], axis=0, return_index=True, return_inverse=True)
+        canonical = np.arange(len(verts))
+        canonical[seam] = seam[first][inverse.reshape(-1)]
+        keep = canonical == np.arange(len(verts))
+        new_index = np.cumsum(keep) - 1
+        np.take(canonical, faces, out=faces)
+        np.take(new_index, faces, out=faces)
+        verts, normals, values = verts[keep], normals[keep], values[keep]
+
+    if not np.array_equal(spacing, (1, 1, 1)):
+        verts = (verts * np.r_[spacing]).astype(np.float32)
+    return verts, faces, normals, values
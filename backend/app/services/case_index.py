@@ -0,0 +1,200 @@
+"""
+Vector similarity index over saved simulation cases.
+
+Each case is embedded as a small float32 vector: scaled tumor volume,
+displacement and stress, plus hashed multi-hot blocks for the tumor location
+and affected regions. Small collections are searched exhaustively with one
+matrix-vector product; once a collection is large, an IVF (inverted file)
+index restricts the search to the few clusters nearest to the query.
+"""
+import re
+import threading
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Typical magnitudes, used to bring numeric features onto a common scale
+TUMOR_VOLUME_SCALE = 10.0      # cm³
+DISPLACEMENT_SCALE = 5.0       # mm
+STRESS_SCALE = 1.5             # kPa
+
+LOCATION_BUCKETS = 32
+REGION_BUCKETS = 64
+LOCATION_WEIGHT = 1.0
+REGION_WEIGHT = 0.5
+
+NUMERIC_DIMS = 3
+FEATURE_DIMS = NUMERIC_DIMS + LOCATION_BUCKETS + REGION_BUCKETS
+
+# Exhaustive search below this many vectors, IVF above it
+IVF_MIN_VECTORS = 50_000
+IVF_NPROBE = 8
+IVF_SAMPLES_PER_LIST = 64
+IVF_TRAIN_ITERATIONS = 10
+ASSIGN_CHUNK = 65_536
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _hashed_multi_hot(texts: Iterable[str], buckets: int, weight: float) -> np.ndarray:
+    """Hash the words of texts into buckets; the block has L2 norm `weight`"""
+    block = np.zeros(buckets, dtype=np.float32)
+    for text in texts:
+        for token in _TOKEN_RE.findall(text.lower()):
+            block[zlib.crc32(token.encode()) % buckets] += 1.0
+    norm = np.linalg.norm(block)
+    if norm > 0:
+        block *= weight / norm
+    return block
+
+
+def embed_case(
+    tumor_location: str,
+    tumor_volume: Optional[float],
+    max_displacement: Optional[float],
+    avg_stress: Optional[float],
+    affected_regions: Optional[List[str]] = None,
+    defaults: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Feature vector for one case. Missing numeric values are filled from
+    `defaults` (already scaled), so a query can give any subset of features.
+    """
+    numeric = np.zeros(NUMERIC_DIMS, dtype=np.float32) if defaults is None else defaults.astype(np.float32)
+    for i, (value, scale) in enumerate((
+        (tumor_volume, TUMOR_VOLUME_SCALE),
+        (max_displacement, DISPLACEMENT_SCALE),
+        (avg_stress, STRESS_SCALE)
+    )):
+        if value is not None:
+            numeric[i] = value / scale
+
+    return np.concatenate([
+        numeric,
+        _hashed_multi_hot([tumor_location], LOCATION_BUCKETS, LOCATION_WEIGHT),
+        _hashed_multi_hot(affected_regions or [], REGION_BUCKETS, REGION_WEIGHT)
+    ])
+
+
+def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid for each vector, computed in chunks"""
+    centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        chunk = vectors[start:start + ASSIGN_CHUNK]
+        # |x - c|² = |x|² - 2x·c + |c|², and |x|² doesn't change the argmin
+        distances = centroid_norms - 2.0 * (chunk @ centroids.T)
+        assignments[start:start + ASSIGN_CHUNK] = np.argmin(distances, axis=1)
+    return assignments
+
+
+class CaseVectorIndex:
+    """
+    Append-only nearest-neighbour index keyed by case store row id.
+    Thread-safe; searches return (row_ids, squared_distances) nearest first.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((1024, FEATURE_DIMS), dtype=np.float32)
+        self._ids = np.zeros(1024, dtype=np.int64)
+        self._size = 0
+        self._numeric_sum = np.zeros(NUMERIC_DIMS, dtype=np.float64)
+        # IVF state: centroids plus, per centroid, the positions of its members
+        self._centroids = None
+        self._lists = []
+        self._pending = []
+        self._trained_size = 0
+
+    def __len__(self):
+        return self._size
+
+    def numeric_means(self) -> np.ndarray:
+        """Mean scaled numeric features, used to fill in partial queries"""
+        if self._size == 0:
+            return np.zeros(NUMERIC_DIMS, dtype=np.float32)
+        return (self._numeric_sum / self._size).astype(np.float32)
+
+    def add(self, row_id: int, vector: np.ndarray):
+        self.add_many(np.array([row_id], dtype=np.int64), vector[np.newaxis, :])
+
+    def add_many(self, row_ids: np.ndarray, vectors: np.ndarray):
+        with self._lock:
+            count = len(row_ids)
+            if self._size + count > len(self._ids):
+                capacity = max(len(self._ids) * 2, self._size + count)
+                self._vectors = np.resize(self._vectors, (capacity, FEATURE_DIMS))
+                self._ids = np.resize(self._ids, capacity)
+            start = self._size
+            self._vectors[start:start + count] = vectors
+            self._ids[start:start + count] = row_ids
+            self._size += count
+            self._numeric_sum += vectors[:, :NUMERIC_DIMS].sum(axis=0)
+
+            if self._centroids is not None:
+                assignments = _nearest_centroids(vectors.astype(np.float32), self._centroids)
+                for offset, cluster in enumerate(assignments):
+                    self._pending[cluster].append(start + offset)
+
+    def search(self, query: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            if self._size == 0:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            self._maybe_train()
+
+            if self._centroids is None:
+                candidates = None
+                vectors = self._vectors[:self._size]
+            else:
+                probe = np.argsort(
+                    np.einsum("ij,ij->i", self._centroids - query, self._centroids - query)
+                )[:IVF_NPROBE]
+                candidates = np.concatenate(
+                    [self._lists[c] for c in probe] +
+                    [np.asarray(self._pending[c], dtype=np.int64) for c in probe]
+                )
+                vectors = self._vectors[candidates]
+
+            distances = np.einsum("ij,ij->i", vectors, vectors) - 2.0 * (vectors @ query) + float(query @ query)
+            k = min(k, len(distances))
+            if k == 0:
+                return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            top = np.argpartition(distances, k - 1)[:k]
+            top = top[np.argsort(distances[top])]
+            positions = top if candidates is None else candidates[top]
+            return self._ids[positions].copy(), np.maximum(distances[top], 0.0)
+
+    def prepare(self):
+        """Build the IVF lists ahead of the first search if they're needed"""
+        with self._lock:
+            self._maybe_train()
+
+    def _maybe_train(self):
+        """(Re)build the IVF lists when the index has grown enough to need them"""
+        if self._size < IVF_MIN_VECTORS or self._size < 2 * self._trained_size:
+            return
+
+        vectors = self._vectors[:self._size]
+        n_lists = int(np.sqrt(self._size) / 2)
+        rng = np.random.default_rng(0)
+        sample_size = min(self._size, n_lists * IVF_SAMPLES_PER_LIST)
+        sample = vectors[rng.choice(self._size, sample_size, replace=False)]
+
+        # Plain k-means on a sample
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(IVF_TRAIN_ITERATIONS):
+            assignments = _nearest_centroids(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=n_lists)
+            nonempty = counts > 0
+            centroids[nonempty] = sums[nonempty] / counts[nonempty, np.newaxis]
+
+        assignments = _nearest_centroids(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        boundaries = np.searchsorted(assignments[order], np.arange(n_lists + 1))
+        self._lists = [order[boundaries[c]:boundaries[c + 1]].astype(np.int64) for c in range(n_lists)]
+        self._pending = [[] for _ in range(n_lists)]
+        self._centroids = centroids
+        self._trained_size = self._size
@@ -0,0 +1,93 @@
+"""
+Running aggregates over saved simulation cases.
+
+The case store keeps count, mean and M2 (sum of squared deviations) for each
+tracked metric in the `case_stats` table and folds every inserted batch in
+with Chan's parallel update, so statistics never need a scan over the
+simulations table.
+"""
+import math
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+# Metrics tracked per case: name in the stats table -> simulations column
+TRACKED_METRICS = {
+    "displacement": "max_displacement",
+    "stress": "avg_stress"
+}
+
+# Folds a batch's moments into the stored ones in a single statement, so
+# concurrent writers can't interleave a read-modify-write. SQLite evaluates
+# every SET expression against the old row. With n = count + excluded.count
+# and d = excluded.mean - mean:
+#   mean' = mean + d * excluded.count / n
+#   m2'   = m2 + excluded.m2 + d² * count * excluded.count / n
+MERGE_STATS_SQL = """
+INSERT INTO case_stats (metric, count, mean, m2, min_value, max_value) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (metric) DO UPDATE SET
+    count = count + excluded.count,
+    mean = mean + (excluded.mean - mean) * excluded.count / CAST(count + excluded.count AS REAL),
+    m2 = m2 + excluded.m2
+        + (excluded.mean - mean) * (excluded.mean - mean) * count * excluded.count
+        / CAST(count + excluded.count AS REAL),
+    min_value = MIN(min_value, excluded.min_value),
+    max_value = MAX(max_value, excluded.max_value)
+"""
+
+
+class RunningMoments:
+    """Count, mean, variance and range of a stream of values"""
+
+    __slots__ = ("count", "mean", "m2", "minimum", "maximum")
+
+    def __init__(
+        self,
+        count: int = 0,
+        mean: float = 0.0,
+        m2: float = 0.0,
+        minimum: Optional[float] = None,
+        maximum: Optional[float] = None
+    ):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @classmethod
+    def from_row(cls, row) -> "RunningMoments":
+        """Build from a (count, mean, m2, min_value, max_value) case_stats row"""
+        return cls(*row)
+
+    @classmethod
+    def from_values(cls, values: Iterable[float]) -> "RunningMoments":
+        values = np.fromiter(values, dtype=np.float64)
+        if len(values) == 0:
+            return cls()
+        mean = float(values.mean())
+        return cls(
+            count=len(values),
+            mean=mean,
+            m2=float(np.square(values - mean).sum()),
+            minimum=float(values.min()),
+            maximum=float(values.max())
+        )
+
+    def as_row(self, metric: str):
+        return (metric, self.count, self.mean, self.m2, self.minimum, self.maximum)
+
+    @property
+    def variance(self) -> float:
+        """Sample variance (n - 1 denominator); 0 for fewer than two values"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "variance": self.variance,
+            "std": math.sqrt(self.variance),
+            "min": self.minimum,
+            "max": self.maximum
+        }
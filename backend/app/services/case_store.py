@@ -0,0 +1,380 @@
+"""
+Embedded case store for saved simulations.
+SQLite-backed stand-in for the Snowflake `simulations` table, so saved cases
+survive restarts and lookups stay indexed as the table grows.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.models.schemas import SnowflakeSimulationData
+from app.services.case_index import FEATURE_DIMS, CaseVectorIndex, embed_case
+from app.services.case_stats import MERGE_STATS_SQL, TRACKED_METRICS, RunningMoments
+from app.services.object_store import data_path
+
+CASE_STORE_BACKEND = os.getenv("CASE_STORE_BACKEND", "sqlite")
+CASE_STORE_PATH = os.getenv("CASE_STORE_PATH") or data_path("cases.db")
+CASE_STORE_POOL_SIZE = int(os.getenv("CASE_STORE_POOL_SIZE", "4"))
+
+# SQLite caps bound parameters per statement; stay well under the limit
+MAX_ROWS_PER_INSERT = 500
+
+# Columns returned by similar-case lookups
+SUMMARY_COLUMNS = ["case_id", "tumor_location", "tumor_volume", "max_displacement", "avg_stress"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS simulations (
+    id INTEGER PRIMARY KEY,
+    record_id TEXT,
+    case_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    tumor_location TEXT NOT NULL,
+    tumor_volume REAL NOT NULL,
+    max_displacement REAL NOT NULL,
+    avg_stress REAL NOT NULL,
+    affected_regions TEXT NOT NULL,
+    simulation_json TEXT NOT NULL,
+    features BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_simulations_location_ts ON simulations (tumor_location, timestamp);
+CREATE INDEX IF NOT EXISTS idx_simulations_ts ON simulations (timestamp);
+CREATE INDEX IF NOT EXISTS idx_simulations_case_id ON simulations (case_id);
+
+-- One row per distinct location with its case count
+CREATE TABLE IF NOT EXISTS locations (
+    tumor_location TEXT PRIMARY KEY,
+    location_key TEXT NOT NULL,
+    case_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_locations_count ON locations (case_count DESC);
+
+-- Running count / mean / M2 / range per tracked metric, see case_stats.py
+CREATE TABLE IF NOT EXISTS case_stats (
+    metric TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    mean REAL NOT NULL,
+    m2 REAL NOT NULL,
+    min_value REAL,
+    max_value REAL
+);
+"""
+
+
+# Columns added after the first release, created on open if missing
+MIGRATIONS = {
+    "simulations": [("features", "BLOB"), ("record_id", "TEXT")]
+}
+
+# Indexes on migrated columns, created once the columns exist
+POST_MIGRATION_SCHEMA = """
+CREATE UNIQUE INDEX IF NOT EXISTS idx_simulations_record_id ON simulations (record_id);
+"""
+
+INSERT_COLUMNS = [
+    "record_id", "case_id", "timestamp", "tumor_location", "tumor_volume", "max_displacement",
+    "avg_stress", "affected_regions", "simulation_json", "features"
+]
+
+
+def _timestamp_key(ts: datetime) -> str:
+    """ISO timestamp in UTC so stored values sort chronologically as text"""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts.isoformat(timespec="microseconds")
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of DB-API connections, opened on demand and reused.
+    Callers block when all connections are checked out.
+    """
+
+    def __init__(self, connect: Callable[[], Any], size: int = CASE_STORE_POOL_SIZE):
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class SQLiteCaseStore:
+    """
+    Simulation case store backed by a single SQLite file.
+    Connections come from a small pool; WAL mode lets readers keep going
+    while a write commits.
+    """
+
+    def __init__(self, path: str = CASE_STORE_PATH, pool_size: int = CASE_STORE_POOL_SIZE):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._pool = ConnectionPool(self._connect, pool_size)
+        with self._pool.connection() as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+            conn.executescript(POST_MIGRATION_SCHEMA)
+            self._backfill_stats(conn)
+        # Serializes topping up the vector index; _index_high_water is the highest row id in it
+        self._index_lock = threading.Lock()
+        self._index = None
+        self._index_high_water = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _migrate(self, conn: sqlite3.Connection):
+        for table, columns in MIGRATIONS.items():
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for name, column_type in columns:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
+    def _backfill_stats(self, conn: sqlite3.Connection):
+        """Seed case_stats from existing rows for stores created before it existed"""
+        if conn.execute("SELECT 1 FROM case_stats LIMIT 1").fetchone():
+            return
+        for metric, column in TRACKED_METRICS.items():
+            count, mean, minimum, maximum = conn.execute(
+                f"SELECT COUNT(*), AVG({column}), MIN({column}), MAX({column}) FROM simulations"
+            ).fetchone()
+            if not count:
+                return
+            m2 = conn.execute(
+                f"SELECT SUM(({column} - ?) * ({column} - ?)) FROM simulations", (mean, mean)
+            ).fetchone()[0]
+            conn.execute(MERGE_STATS_SQL, RunningMoments(count, mean, m2, minimum, maximum).as_row(metric))
+
+    def insert(self, data: SnowflakeSimulationData, record_id: Optional[str] = None) -> int:
+        """Insert one simulation and return the number of rows written"""
+        return self.insert_many([data], [record_id] if record_id else None)
+
+    def insert_many(self, rows: List[SnowflakeSimulationData], record_ids: Optional[List[str]] = None) -> int:
+        """
+        Insert simulations in one transaction, using multi-row INSERT statements.
+        Rows whose record_id is already stored, or repeated within the batch,
+        are skipped, so replaying a batch is safe. Returns the number of rows
+        written.
+        """
+        if not rows:
+            return 0
+        record_ids = record_ids or [None] * len(rows)
+        # First occurrence of each record_id only; rows without one are always new
+        seen = set()
+        keep = []
+        for i, record_id in enumerate(record_ids):
+            if record_id is None or record_id not in seen:
+                seen.add(record_id)
+                keep.append(i)
+        features = [
+            embed_case(d.tumor_location, d.tumor_volume, d.max_displacement, d.avg_stress, d.affected_regions)
+            for d in rows
+        ]
+
+        with self._pool.connection() as conn, conn:
+            values = [
+                (
+                    record_ids[i],
+                    rows[i].case_id,
+                    _timestamp_key(rows[i].timestamp),
+                    rows[i].tumor_location,
+                    rows[i].tumor_volume,
+                    rows[i].max_displacement,
+                    rows[i].avg_stress,
+                    json.dumps(rows[i].affected_regions),
+                    json.dumps(rows[i].simulation_json),
+                    features[i].tobytes()
+                )
+                for i in keep
+            ]
+
+            # Rows already stored (by this or another process) are skipped by the
+            # conflict clause; RETURNING reports which keyed rows were written
+            written = []
+            placeholder = "(" + ", ".join("?" * len(INSERT_COLUMNS)) + ")"
+            for start in range(0, len(values), MAX_ROWS_PER_INSERT):
+                chunk = values[start:start + MAX_ROWS_PER_INSERT]
+                returned = {record_id for (record_id,) in conn.execute(
+                    f"INSERT INTO simulations ({', '.join(INSERT_COLUMNS)}) VALUES "
+                    + ", ".join([placeholder] * len(chunk))
+                    + " ON CONFLICT (record_id) DO NOTHING RETURNING record_id",
+                    [value for row in chunk for value in row]
+                )}
+                # Rows without a record_id can't conflict
+                written.extend(
+                    start + offset for offset, row in enumerate(chunk) if row[0] is None or row[0] in returned
+                )
+            values = [values[position] for position in written]
+            keep = [keep[position] for position in written]
+
+            location_counts = {}
+            for row in values:
+                location_counts[row[3]] = location_counts.get(row[3], 0) + 1
+            conn.executemany(
+                """
+                INSERT INTO locations (tumor_location, location_key, case_count) VALUES (?, ?, ?)
+                ON CONFLICT (tumor_location) DO UPDATE SET case_count = case_count + excluded.case_count
+                """,
+                [(location, location.lower(), count) for location, count in location_counts.items()]
+            )
+
+            if values:
+                conn.executemany(MERGE_STATS_SQL, [
+                    RunningMoments.from_values(getattr(rows[i], column) for i in keep).as_row(metric)
+                    for metric, column in TRACKED_METRICS.items()
+                ])
+        return len(values)
+
+    def _vector_index(self) -> CaseVectorIndex:
+        """
+        The similarity index, loaded in full on first use and then topped up
+        on every call with the rows committed since, by any process. Row ids
+        only grow (SQLite has one writer at a time and rows are never
+        deleted), so the new rows are those above the highest id loaded.
+        """
+        with self._index_lock, self._pool.connection() as conn:
+            first_load = self._index is None
+            if first_load:
+                self._index = CaseVectorIndex()
+            index = self._index
+            cursor = conn.execute(
+                """
+                SELECT id, features, tumor_location, tumor_volume, max_displacement, avg_stress, affected_regions
+                FROM simulations WHERE id > ? ORDER BY id
+                """,
+                (self._index_high_water,)
+            )
+            while True:
+                rows = cursor.fetchmany(50_000)
+                if not rows:
+                    break
+                # Rows saved before features were stored get embedded on the fly
+                blobs = [
+                    features if features is not None
+                    else embed_case(location, volume, displacement, stress, json.loads(regions)).tobytes()
+                    for _, features, location, volume, displacement, stress, regions in rows
+                ]
+                vectors = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(rows), FEATURE_DIMS)
+                index.add_many(np.array([row[0] for row in rows], dtype=np.int64), vectors)
+                self._index_high_water = rows[-1][0]
+            if first_load:
+                index.prepare()
+        return index
+
+    def find_similar(
+        self,
+        tumor_location: str,
+        limit: int = 5,
+        tumor_volume: Optional[float] = None,
+        max_displacement: Optional[float] = None,
+        avg_stress: Optional[float] = None,
+        affected_regions: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Nearest cases in feature space, each with a `similarity` score in (0, 1].
+        Features that aren't given are filled with the store-wide mean.
+        """
+        index = self._vector_index()
+        query = embed_case(
+            tumor_location, tumor_volume, max_displacement, avg_stress, affected_regions,
+            defaults=index.numeric_means()
+        )
+        row_ids, distances = index.search(query, limit)
+        if len(row_ids) == 0:
+            return []
+        placeholders = ", ".join("?" for _ in row_ids)
+        with self._pool.connection() as conn:
+            rows = {
+                row[0]: row[1:] for row in conn.execute(
+                    f"SELECT id, {', '.join(SUMMARY_COLUMNS)} FROM simulations WHERE id IN ({placeholders})",
+                    [int(row_id) for row_id in row_ids]
+                )
+            }
+
+        cases = []
+        for row_id, distance in zip(row_ids, distances):
+            case = dict(zip(SUMMARY_COLUMNS, rows[int(row_id)]))
+            case["similarity"] = round(1.0 / (1.0 + float(np.sqrt(distance))), 4)
+            cases.append(case)
+        return cases
+
+    def statistics(self, top_k: int = 5) -> Optional[Dict[str, Any]]:
+        """
+        Aggregate statistics across all cases, or None if the store is empty.
+        Reads the running aggregates and the top of the location index, so
+        the cost doesn't depend on how many cases are stored.
+        """
+        with self._pool.connection() as conn:
+            moments = {
+                row[0]: RunningMoments.from_row(row[1:]) for row in conn.execute(
+                    "SELECT metric, count, mean, m2, min_value, max_value FROM case_stats"
+                )
+            }
+            if not moments:
+                return None
+            top_locations = conn.execute(
+                "SELECT tumor_location, case_count FROM locations ORDER BY case_count DESC LIMIT ?",
+                (top_k,)
+            ).fetchall()
+
+        displacement = moments.get("displacement", RunningMoments())
+        stress = moments.get("stress", RunningMoments())
+        return {
+            "total_cases": displacement.count,
+            "avg_displacement": displacement.mean,
+            "avg_stress": stress.mean,
+            "common_locations": [location for location, _ in top_locations],
+            "displacement": displacement.to_dict(),
+            "stress": stress.to_dict(),
+            "top_locations": [
+                {"tumor_location": location, "case_count": count} for location, count in top_locations
+            ]
+        }
+
+    def close(self):
+        self._pool.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_case_store():
+    """Return the process-wide case store, opening it on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if CASE_STORE_BACKEND != "sqlite":
+                    raise ValueError(f"Unsupported CASE_STORE_BACKEND: {CASE_STORE_BACKEND}")
+                _store = SQLiteCaseStore(CASE_STORE_PATH)
+    return _store
@@ -1,8 +1,10 @@
 import numpy as np
 from app.models.schemas import SimulationResponse, SimulationMetrics, MeshData
 from app.services.segmentation_engine import generate_mock_brain_mesh
+from app.services.tracing import span
 
 
+@span("simulation.fea")
 def perform_tumor_removal_simulation(case_id: str, remove_region: str, skull_opening_size: float):
     """
     Simulate the biomechanical effects of tumor removal
@@ -91,16 +93,17 @@ def perform_tumor_removal_simulation(case_id: str, remove_region: str, skull_ope
         vulnerable_regions=vulnerable_regions
     )
 
-    deformed_mesh = MeshData(
-        vertices=deformed_vertices.tolist(),
+    # Built from our own arrays, so skip validation; FastJSONResponse encodes the arrays directly
+    deformed_mesh = MeshData.model_construct(
+        vertices=deformed_vertices,
         faces=faces,
-        labels=labels.tolist(),
-        colors=new_colors.tolist()
+        labels=labels,
+        colors=new_colors
     )
 
-    return SimulationResponse(
+    return SimulationResponse.model_construct(
         deformed_mesh=deformed_mesh,
         metrics=metrics,
-        heatmap_data=stress_values,
+        heatmap_data=np.asarray(stress_values),
         case_id=case_id
     )
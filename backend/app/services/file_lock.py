@@ -0,0 +1,73 @@
+"""
+Advisory locks on files, shared by every process on a host.
+
+Uses fcntl.flock, or msvcrt.locking on Windows. The operating system drops
+a lock when its holder exits, so a crashed process never leaves a stale
+lock behind. Locks are advisory: they only exclude other FileLock users.
+Like any flock, they are not reliable on network filesystems shared
+between hosts.
+"""
+import os
+import time
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Exclusive lock on path (created if missing); also a context manager"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self, blocking: bool = True, timeout: Optional[float] = None) -> bool:
+        """Take the lock; returns False if it is held elsewhere and blocking is off or timeout passes"""
+        if self._file is not None:
+            raise RuntimeError(f"Lock already held: {self.path}")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        f = open(self.path, "a+b")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                if fcntl is not None:
+                    flags = fcntl.LOCK_EX if blocking and deadline is None else fcntl.LOCK_EX | fcntl.LOCK_NB
+                    fcntl.flock(f.fileno(), flags)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                self._file = f
+                return True
+            except OSError:
+                if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                    f.close()
+                    return False
+                time.sleep(0.05)
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
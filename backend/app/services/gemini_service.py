@@ -1,9 +1,23 @@
+import logging
 import os
+from functools import lru_cache
 from typing import Tuple, Dict, Any, Optional
-import google.generativeai as genai
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY", ""))
+from app.services.tracing import span
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_model():
+    """
+    The Gemini model, configured on first use; google.generativeai takes
+    most of a second to import, so it stays out of API startup
+    """
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY", ""))
+    return genai.GenerativeModel('gemini-pro')
 
 # Conversation storage (in-memory for demo, use database in production)
 conversation_history = {}
@@ -61,8 +75,7 @@ Be precise, professional, and reassuring where appropriate."""
         full_prompt = base_prompt
 
     try:
-        # Initialize model
-        model = genai.GenerativeModel('gemini-pro')
+        model = get_model()
 
         # Get or create conversation
         if conversation_id in conversation_history:
@@ -72,7 +85,8 @@ Be precise, professional, and reassuring where appropriate."""
             conversation_history[conversation_id] = chat
 
         # Generate response
-        response = chat.send_message(full_prompt)
+        with span("llm.gemini"):
+            response = chat.send_message(full_prompt)
         full_response = response.text
 
         # Parse response into technical and patient summaries
@@ -95,7 +109,7 @@ Be precise, professional, and reassuring where appropriate."""
 
     except Exception as e:
         # Fallback responses if Gemini API fails
-        print(f"Gemini API error: {e}")
+        logger.error(f"Gemini API error: {e}")
 
         technical_fallback = f"""**Biomechanical Analysis**
 
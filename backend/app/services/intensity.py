@@ -0,0 +1,102 @@
+"""
+Intensity statistics and thresholding over whole volumes.
+
+Everything here walks the volume in slabs of whole slices, so temporaries
+stay at slab size (SLAB_VOXELS) however large the volume is, and works on
+the volume's stored dtype; nothing makes a full-size float copy.
+
+Quantiles come from one histogram pass: exact for integer volumes (one
+bin per intensity value, matching np.percentile's linear interpolation),
+and within 1/QUANTILE_BINS of the intensity range for float volumes.
+"""
+import math
+from typing import Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+SLAB_VOXELS = 1 << 22
+QUANTILE_BINS = 1 << 16
+# Integer volumes with a wider range than this fall back to binned quantiles
+MAX_EXACT_RANGE = 1 << 20
+
+
+def slabs(volume: np.ndarray) -> Iterator[slice]:
+    """Slices along axis 0 covering the volume, about SLAB_VOXELS voxels each"""
+    slice_voxels = max(1, int(np.prod(volume.shape[1:])))
+    step = max(1, SLAB_VOXELS // slice_voxels)
+    for start in range(0, volume.shape[0], step):
+        yield slice(start, min(start + step, volume.shape[0]))
+
+
+def intensity_range(volume: np.ndarray) -> Tuple[float, float]:
+    return float(volume.min()), float(volume.max())
+
+
+def quantiles(volume: np.ndarray, qs: Sequence[float], value_range: Tuple[float, float] = None) -> List[float]:
+    """Quantiles (0-1) of all voxel values, like np.percentile(volume, 100 * q)"""
+    lo, hi = value_range or intensity_range(volume)
+    if lo == hi:
+        return [lo] * len(qs)
+
+    exact = volume.dtype.kind in "iub" and hi - lo < MAX_EXACT_RANGE
+    n_bins = int(hi - lo) + 1 if exact else QUANTILE_BINS
+    counts = np.zeros(n_bins, dtype=np.int64)
+    for sl in slabs(volume):
+        chunk = volume[sl].ravel()
+        if exact:
+            counts += np.bincount(chunk.astype(np.int64) - int(lo), minlength=n_bins)
+        else:
+            counts += np.histogram(chunk, bins=n_bins, range=(lo, hi))[0]
+
+    cdf = np.cumsum(counts)
+    total = int(cdf[-1])
+    width = (hi - lo) / n_bins
+
+    def value_at(rank: int) -> float:
+        # Value of the rank-th smallest voxel (0-based)
+        b = int(np.searchsorted(cdf, rank, side="right"))
+        return lo + b if exact else lo + (b + 0.5) * width
+
+    results = []
+    for q in qs:
+        position = q * (total - 1)
+        k = math.floor(position)
+        below = value_at(k)
+        above = value_at(min(k + 1, total - 1))
+        results.append(below + (position - k) * (above - below))
+    return results
+
+
+def digitize(volume: np.ndarray, edges: Sequence[float], out: np.ndarray = None) -> np.ndarray:
+    """
+    Class index of every voxel, as np.digitize(volume, edges) would give
+    (bins are [edges[i-1], edges[i])), written into a uint8 array slab by slab
+    """
+    if len(edges) > 255:
+        raise ValueError("At most 255 edges fit a uint8 label")
+    if out is None:
+        out = np.empty(volume.shape, dtype=np.uint8)
+    edges = np.asarray(edges, dtype=np.float64)
+    for sl in slabs(volume):
+        out[sl] = np.digitize(volume[sl], edges)
+    return out
+
+
+def normalized(volume: np.ndarray, value_range: Tuple[float, float] = None, out: np.ndarray = None) -> np.ndarray:
+    """Volume rescaled to 0-1 as float32, built in place slab by slab"""
+    lo, hi = value_range or intensity_range(volume)
+    if out is None:
+        out = np.empty(volume.shape, dtype=np.float32)
+    scale = np.float32(1.0 / (hi - lo + 1e-8))
+    for sl in slabs(volume):
+        view = out[sl]
+        view[...] = volume[sl]
+        view -= np.float32(lo)
+        view *= scale
+    return out
+
+
+def normalized_edges(edges: Sequence[float], value_range: Tuple[float, float]) -> List[float]:
+    """Map thresholds on the 0-1 normalized scale back to raw intensities"""
+    lo, hi = value_range
+    return [lo + e * (hi - lo + 1e-8) for e in edges]
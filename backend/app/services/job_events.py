@@ -0,0 +1,202 @@
+"""
+Progress events for segmentation jobs, pushed to clients over SSE.
+
+The pipeline publishes stage transitions and a "mesh_ready" event per
+region as each STL file is written; "done" and "failed" end a job's
+stream. Events go to a table in a SQLite file, so an API process sees
+events published by workers in other processes, and a client that
+reconnects with Last-Event-ID resumes where it left off.
+
+Each API process runs one tailer thread, only while clients are
+connected, that reads new events for all of them with a single indexed
+query and hands them to their streams. Publishing in the same process
+wakes the tailer at once; events from other processes arrive within
+JOB_EVENTS_POLL_SECONDS. Events older than JOB_EVENTS_RETENTION_SECONDS
+are pruned.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+JOB_EVENTS_POLL_SECONDS = float(os.getenv("JOB_EVENTS_POLL_SECONDS", "0.5"))
+JOB_EVENTS_RETENTION_SECONDS = float(os.getenv("JOB_EVENTS_RETENTION_SECONDS", str(24 * 3600)))
+SSE_KEEPALIVE_SECONDS = 15.0
+
+TERMINAL_EVENTS = {"done", "failed"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS job_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    case_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_job_events_case_id ON job_events (case_id, id);
+CREATE INDEX IF NOT EXISTS idx_job_events_created ON job_events (created);
+"""
+
+Event = Dict[str, Any]
+
+
+def _event(row) -> Event:
+    return {"id": row[0], "case_id": row[1], "event": row[2], "data": json.loads(row[3]), "created": row[4]}
+
+
+def format_sse(event: Event) -> str:
+    """One server-sent event; events without an id (snapshots) don't move Last-Event-ID"""
+    lines = [f"id: {event['id']}"] if event.get("id") else []
+    lines.append(f"event: {event['event']}")
+    lines.append(f"data: {json.dumps(event['data'])}")
+    return "\n".join(lines) + "\n\n"
+
+
+class EventLog:
+    def __init__(
+        self,
+        path: str,
+        poll_seconds: float = JOB_EVENTS_POLL_SECONDS,
+        retention_seconds: float = JOB_EVENTS_RETENTION_SECONDS
+    ):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+        self._lock = threading.Lock()
+        self._subscribers: Dict[str, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_prune = 0.0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def publish(self, case_id: str, event: str, data: Optional[Dict[str, Any]] = None) -> int:
+        """Record an event for a case; returns its id"""
+        try:
+            cursor = self._conn().execute(
+                "INSERT INTO job_events (case_id, event, data, created) VALUES (?, ?, ?, ?)",
+                (case_id, event, json.dumps(data or {}), time.time())
+            )
+        except sqlite3.Error as e:
+            # Progress events are best effort; never fail the job over one
+            logger.warning(f"Could not publish {event} for case {case_id}: {e}")
+            return 0
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    def history(self, case_id: str, after_id: int = 0) -> List[Event]:
+        rows = self._conn().execute(
+            "SELECT id, case_id, event, data, created FROM job_events WHERE case_id = ? AND id > ? ORDER BY id",
+            (case_id, after_id)
+        ).fetchall()
+        return [_event(row) for row in rows]
+
+    # Live delivery
+
+    def subscribe(self, case_id: str) -> asyncio.Queue:
+        """A queue receiving the case's new events; call from the event loop"""
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(case_id, set()).add((asyncio.get_running_loop(), queue))
+            if self._thread is None:
+                last_id = self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM job_events").fetchone()[0]
+                self._thread = threading.Thread(target=self._tail, args=(last_id,), name="job-events", daemon=True)
+                self._thread.start()
+        return queue
+
+    def unsubscribe(self, case_id: str, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(case_id, set())
+            subscribers.discard(next((s for s in subscribers if s[1] is queue), None))
+            if not subscribers:
+                self._subscribers.pop(case_id, None)
+
+    def _tail(self, last_id: int):
+        while True:
+            self._wakeup.wait(self.poll_seconds)
+            self._wakeup.clear()
+            with self._lock:
+                if not self._subscribers:
+                    # Nobody is listening; the next subscribe() starts a fresh tailer
+                    self._thread = None
+                    return
+            try:
+                rows = self._conn().execute(
+                    "SELECT id, case_id, event, data, created FROM job_events WHERE id > ? ORDER BY id", (last_id,)
+                ).fetchall()
+                self._prune()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not read job events: {e}")
+                continue
+            for row in rows:
+                event = _event(row)
+                last_id = event["id"]
+                with self._lock:
+                    subscribers = list(self._subscribers.get(event["case_id"], ()))
+                for loop, queue in subscribers:
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def _prune(self):
+        now = time.time()
+        if now - self._last_prune < 600:
+            return
+        self._last_prune = now
+        self._conn().execute("DELETE FROM job_events WHERE created < ?", (now - self.retention_seconds,))
+
+    async def stream(
+        self,
+        case_id: str,
+        last_event_id: int = 0,
+        snapshot: Optional[Callable[[], Awaitable[List[Event]]]] = None,
+        keepalive: float = SSE_KEEPALIVE_SECONDS
+    ) -> AsyncIterator[str]:
+        """
+        Server-sent events for a case: the events after last_event_id, then
+        live ones until the job is done or failed. For a case with no
+        recorded events, snapshot() supplies its current state instead
+        (outputs built before events existed, or reused from another case).
+        """
+        queue = self.subscribe(case_id)
+        try:
+            loop = asyncio.get_running_loop()
+            backlog = await loop.run_in_executor(None, self.history, case_id, last_event_id)
+            if not backlog and not last_event_id and snapshot is not None:
+                backlog = await snapshot()
+            seen = last_event_id
+            for event in backlog:
+                yield format_sse(event)
+                seen = max(seen, event.get("id") or 0)
+                if event["event"] in TERMINAL_EVENTS:
+                    return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event["id"] <= seen:
+                    continue
+                seen = event["id"]
+                yield format_sse(event)
+                if event["event"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            self.unsubscribe(case_id, queue)
@@ -0,0 +1,401 @@
+"""
+Shared job queue for segmentation and meshing, and the workers that run it.
+
+API nodes only enqueue. Workers (threads started by the API in inline mode,
+or `python -m app.worker` processes on dedicated nodes) claim jobs from one
+SQLite file under DATA_ROOT, so every node pointing at the same file shares
+the queue and throughput grows with the number of workers.
+
+- Jobs are keyed "<kind>:<case_id>". Enqueueing a key that already exists
+  returns the existing job, so a retried upload or finalize never runs the
+  same case twice.
+- A claimed job is leased to one worker for JOB_LEASE_SECONDS. The worker
+  renews the lease with every heartbeat while the job runs; if it dies, the
+  lease runs out and another worker picks the job up.
+- A failed attempt is retried after an exponential backoff, up to
+  JOB_MAX_ATTEMPTS attempts, then the job is marked failed.
+- Workers record a heartbeat in the workers table, idle or busy, so
+  stats() can tell live workers from dead ones.
+
+Progress events for clients (see job_events) are kept in the same file.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.services.case_store import ConnectionPool
+from app.services.job_events import EventLog
+from app.services.object_store import data_path
+from app.services.tracing import span
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH") or data_path("jobs.db")
+# Worker threads started inside each API process; 0 makes API nodes enqueue only
+JOB_INLINE_WORKERS = int(os.getenv("JOB_INLINE_WORKERS", "1"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "10"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "5"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+STATES = [QUEUED, RUNNING, SUCCEEDED, FAILED]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    case_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state_run_after ON jobs (state, run_after);
+CREATE INDEX IF NOT EXISTS idx_jobs_case_id ON jobs (case_id);
+
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    started REAL NOT NULL,
+    heartbeat REAL NOT NULL,
+    current_job TEXT,
+    jobs_done INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+JOB_COLUMNS = [
+    "job_key", "kind", "case_id", "payload", "state", "attempts", "max_attempts", "run_after",
+    "lease_owner", "lease_expires", "created", "updated", "result", "error"
+]
+
+
+def job_key(kind: str, case_id: str) -> str:
+    return f"{kind}:{case_id}"
+
+
+def _job(row) -> Dict[str, Any]:
+    job = dict(zip(JOB_COLUMNS, row))
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+    return job
+
+
+class JobQueue:
+    """
+    Leased job queue in a SQLite file. Safe to share between threads and
+    between processes on hosts that see the same file.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, lease_seconds: float = JOB_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._pool = ConnectionPool(self._connect)
+        with self._pool.connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit; claims take the write lock up front with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # Producers
+
+    def enqueue(
+        self,
+        kind: str,
+        case_id: str,
+        payload: Dict[str, Any],
+        max_attempts: int = JOB_MAX_ATTEMPTS
+    ) -> Dict[str, Any]:
+        """Queue a job for a case; returns the existing job if the key is already queued or done"""
+        key = job_key(kind, case_id)
+        now = time.time()
+        with self._pool.connection() as conn:
+            conn.execute(
+                f"INSERT OR IGNORE INTO jobs (job_key, kind, case_id, payload, state, max_attempts, run_after, "
+                f"created, updated) VALUES (?, ?, ?, ?, '{QUEUED}', ?, ?, ?, ?)",
+                (key, kind, case_id, json.dumps(payload), max_attempts, now, now, now)
+            )
+        return self.get(key)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._pool.connection() as conn:
+            row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE job_key = ?", (key,)).fetchone()
+        return _job(row) if row else None
+
+    def jobs_for_case(self, case_id: str) -> List[Dict[str, Any]]:
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE case_id = ? ORDER BY created", (case_id,)
+            ).fetchall()
+        return [_job(row) for row in rows]
+
+    def active_cases(self) -> Dict[str, Optional[str]]:
+        """case_id -> content digest (or None) of every case with a queued or running job"""
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT case_id, payload FROM jobs WHERE state IN ('{QUEUED}', '{RUNNING}')"
+            ).fetchall()
+        return {case_id: json.loads(payload).get("content_digest") for case_id, payload in rows}
+
+    # Workers
+
+    def claim(self, worker_id: str, kinds: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        """Lease the oldest runnable job (queued and due, or with an expired lease) to a worker"""
+        now = time.time()
+        kind_filter, params = "", [now, now]
+        if kinds:
+            kinds = list(kinds)
+            kind_filter = f" AND kind IN ({', '.join('?' * len(kinds))})"
+            params += kinds
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._fail_exhausted(conn, now)
+                row = conn.execute(
+                    f"SELECT job_key FROM jobs WHERE ((state = '{QUEUED}' AND run_after <= ?) "
+                    f"OR (state = '{RUNNING}' AND lease_expires < ?)){kind_filter} ORDER BY created LIMIT 1",
+                    params
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        f"UPDATE jobs SET state = '{RUNNING}', attempts = attempts + 1, lease_owner = ?, "
+                        "lease_expires = ?, updated = ? WHERE job_key = ?",
+                        (worker_id, now + self.lease_seconds, now, row[0])
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0]) if row else None
+
+    def _fail_exhausted(self, conn: sqlite3.Connection, now: float):
+        """Jobs whose worker died on their last attempt are failed rather than reclaimed"""
+        conn.execute(
+            f"UPDATE jobs SET state = '{FAILED}', error = 'Lease expired on the last attempt', "
+            f"lease_owner = NULL, updated = ? WHERE state = '{RUNNING}' AND lease_expires < ? "
+            "AND attempts >= max_attempts",
+            (now, now)
+        )
+
+    def renew(self, key: str, worker_id: str) -> bool:
+        """Extend a running job's lease; False if the worker no longer holds it"""
+        now = time.time()
+        with self._pool.connection() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET lease_expires = ?, updated = ? WHERE job_key = ? AND lease_owner = ? "
+                f"AND state = '{RUNNING}'",
+                (now + self.lease_seconds, now, key, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, key: str, worker_id: str, result: Any = None) -> bool:
+        now = time.time()
+        with self._pool.connection() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET state = '{SUCCEEDED}', result = ?, error = NULL, lease_owner = NULL, "
+                f"lease_expires = NULL, updated = ? WHERE job_key = ? AND lease_owner = ? AND state = '{RUNNING}'",
+                (json.dumps(result), now, key, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, key: str, worker_id: str, error: str, backoff: float = JOB_RETRY_BACKOFF) -> bool:
+        """Record a failed attempt: requeue with backoff, or fail the job for good"""
+        now = time.time()
+        with self._pool.connection() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET state = CASE WHEN attempts < max_attempts THEN '{QUEUED}' ELSE '{FAILED}' END, "
+                "run_after = ? * (1 << (attempts - 1)) + ?, error = ?, lease_owner = NULL, lease_expires = NULL, "
+                f"updated = ? WHERE job_key = ? AND lease_owner = ? AND state = '{RUNNING}'",
+                (backoff, now, error, now, key, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def heartbeat(self, worker_id: str, current_job: Optional[str] = None, jobs_done: int = 0):
+        now = time.time()
+        with self._pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO workers (worker_id, host, pid, started, heartbeat, current_job, jobs_done) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (worker_id) DO UPDATE SET "
+                "heartbeat = excluded.heartbeat, current_job = excluded.current_job, jobs_done = excluded.jobs_done",
+                (worker_id, socket.gethostname(), os.getpid(), now, now, current_job, jobs_done)
+            )
+
+    def remove_worker(self, worker_id: str):
+        with self._pool.connection() as conn:
+            conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    # Reporting
+
+    def stats(self, heartbeat_seconds: float = JOB_HEARTBEAT_SECONDS) -> Dict[str, Any]:
+        """Job counts per state and the workers seen recently"""
+        live_after = time.time() - 3 * heartbeat_seconds
+        with self._pool.connection() as conn:
+            counts = dict(conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+            workers = conn.execute(
+                "SELECT worker_id, host, pid, started, heartbeat, current_job, jobs_done FROM workers "
+                "WHERE heartbeat >= ? ORDER BY started",
+                (live_after,)
+            ).fetchall()
+        return {
+            "jobs": {state: counts.get(state, 0) for state in STATES},
+            "workers": [
+                dict(zip(["worker_id", "host", "pid", "started", "heartbeat", "current_job", "jobs_done"], row))
+                for row in workers
+            ]
+        }
+
+    def render_metrics(self) -> List[str]:
+        stats = self.stats()
+        lines = ["# HELP jobs Jobs in the queue by state", "# TYPE jobs gauge"]
+        lines += [f'jobs{{state="{state}"}} {count}' for state, count in stats["jobs"].items()]
+        lines += ["# HELP job_workers Workers with a recent heartbeat", "# TYPE job_workers gauge"]
+        lines.append(f"job_workers {len(stats['workers'])}")
+        return lines
+
+    def close(self):
+        self._pool.close()
+
+
+class Worker:
+    """
+    Claims jobs and runs them with the handler registered for their kind.
+    handlers maps a job kind to a callable taking the case_id and the job
+    payload as keyword arguments; its return value is stored as the result.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handlers: Dict[str, Callable[..., Any]],
+        worker_id: Optional[str] = None,
+        heartbeat_seconds: float = JOB_HEARTBEAT_SECONDS,
+        poll_seconds: float = JOB_POLL_SECONDS,
+        on_failure: Optional[Callable[[Dict[str, Any], str], None]] = None
+    ):
+        self.queue = queue
+        self.handlers = handlers
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_seconds = poll_seconds
+        # Called with the updated job (queued again, or failed for good) and the error
+        self.on_failure = on_failure
+        self.jobs_done = 0
+        self._current: Optional[str] = None
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def run_once(self) -> bool:
+        """Claim and run one job; False if there was nothing to do"""
+        job = self.queue.claim(self.worker_id, self.handlers)
+        if job is None:
+            return False
+        key = job["job_key"]
+        self._current = key
+        self.queue.heartbeat(self.worker_id, key, self.jobs_done)
+        logger.info(f"Worker {self.worker_id} running {key} (attempt {job['attempts']}/{job['max_attempts']})")
+        try:
+            with span(f"job.{job['kind']}"):
+                result = self.handlers[job["kind"]](case_id=job["case_id"], **job["payload"])
+        except Exception as e:
+            logger.error(f"Job {key} failed on attempt {job['attempts']}: {e}")
+            if self.queue.fail(key, self.worker_id, str(e)) and self.on_failure is not None:
+                self.on_failure(self.queue.get(key), str(e))
+        else:
+            if not self.queue.complete(key, self.worker_id, result):
+                logger.warning(f"Job {key} finished after its lease was lost; result discarded")
+        finally:
+            self._current = None
+            self.jobs_done += 1
+            self.queue.heartbeat(self.worker_id, None, self.jobs_done)
+        return True
+
+    def _heartbeat(self):
+        """Keep the worker's heartbeat and its current job's lease fresh"""
+        while not self._stop.wait(self.heartbeat_seconds):
+            try:
+                key = self._current
+                self.queue.heartbeat(self.worker_id, key, self.jobs_done)
+                if key is not None and not self.queue.renew(key, self.worker_id):
+                    logger.warning(f"Worker {self.worker_id} lost the lease on {key}")
+            except Exception as e:
+                logger.error(f"Heartbeat failed for worker {self.worker_id}: {e}")
+
+    def run(self):
+        """Process jobs until stop() is called"""
+        self.queue.heartbeat(self.worker_id, None, self.jobs_done)
+        while not self._stop.is_set():
+            try:
+                busy = self.run_once()
+            except Exception as e:
+                logger.error(f"Worker {self.worker_id} could not claim a job: {e}")
+                busy = False
+            if not busy:
+                self._stop.wait(self.poll_seconds)
+
+    def start(self):
+        """Run in background threads (job loop plus heartbeat)"""
+        if self._threads:
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self.run, name=f"worker-{self.worker_id}", daemon=True),
+            threading.Thread(target=self._heartbeat, name=f"worker-{self.worker_id}-heartbeat", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop claiming jobs; waits up to timeout for the current one to finish"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self.queue.remove_worker(self.worker_id)
+
+
+_queue: Optional[JobQueue] = None
+_events: Optional[EventLog] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide job queue"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue(JOB_QUEUE_PATH)
+    return _queue
+
+
+def get_event_log() -> EventLog:
+    """Return the process-wide job event log"""
+    global _events
+    if _events is None:
+        with _queue_lock:
+            if _events is None:
+                _events = EventLog(JOB_QUEUE_PATH)
+    return _events
@@ -0,0 +1,97 @@
+"""
+Mesh files written straight from marching-cubes arrays.
+
+Building a trimesh.Trimesh just to export it merges vertices, caches
+properties and then walks the faces again to write them. These writers
+lay the file out in one NumPy buffer (a structured dtype matching the
+on-disk records) and write it in a single call:
+
+- write_stl: binary STL, 50 bytes per triangle. Face normals are computed
+  in one vectorized pass, or left zero with normals=False for consumers
+  that recompute them.
+- write_ply: binary little-endian PLY, indexed (each vertex stored once),
+  typically about half the size of the STL for marching-cubes surfaces.
+
+write_mesh picks the format from the file extension.
+"""
+import os
+
+import numpy as np
+
+STL_HEADER_SIZE = 80
+
+# One binary STL triangle: normal, three vertices, attribute byte count
+STL_DTYPE = np.dtype([
+    ("normal", "<f4", (3,)),
+    ("vertices", "<f4", (3, 3)),
+    ("attributes", "<u2"),
+])
+
+# One PLY face: vertex count (always 3), then the indices
+PLY_FACE_DTYPE = np.dtype([
+    ("count", "u1"),
+    ("indices", "<i4", (3,)),
+])
+
+
+def face_normals(triangles: np.ndarray) -> np.ndarray:
+    """Unit normals of (n, 3, 3) triangles; degenerate triangles get zero normals"""
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    # Zero-length cross products are left as they are: zero
+    np.divide(normals, lengths, out=normals, where=lengths > 0)
+    return normals
+
+
+def write_stl(path: str, verts: np.ndarray, faces: np.ndarray, normals: bool = True, header: bytes = b""):
+    """Write a binary STL file from (v, 3) vertices and (f, 3) vertex indices"""
+    buffer = np.zeros(STL_HEADER_SIZE + 4 + len(faces) * STL_DTYPE.itemsize, dtype=np.uint8)
+    buffer[:STL_HEADER_SIZE] = np.frombuffer(header[:STL_HEADER_SIZE].ljust(STL_HEADER_SIZE, b" "), dtype=np.uint8)
+    buffer[STL_HEADER_SIZE:STL_HEADER_SIZE + 4] = np.frombuffer(np.uint32(len(faces)).tobytes(), dtype=np.uint8)
+
+    # Fill the records in place; attributes stay zero
+    records = buffer[STL_HEADER_SIZE + 4:].view(STL_DTYPE)
+    triangles = np.asarray(verts, dtype=np.float32)[faces]
+    records["vertices"] = triangles
+    if normals:
+        records["normal"] = face_normals(triangles)
+
+    with open(path, "wb") as f:
+        f.write(buffer)
+
+
+def write_ply(path: str, verts: np.ndarray, faces: np.ndarray):
+    """Write a binary PLY file (vertices stored once, faces as indices)"""
+    header = (
+        "ply\n"
+        "format binary_little_endian 1.0\n"
+        f"element vertex {len(verts)}\n"
+        "property float x\n"
+        "property float y\n"
+        "property float z\n"
+        f"element face {len(faces)}\n"
+        "property list uchar int vertex_indices\n"
+        "end_header\n"
+    ).encode("ascii")
+    vertex_bytes = len(verts) * 12
+    buffer = np.empty(len(header) + vertex_bytes + len(faces) * PLY_FACE_DTYPE.itemsize, dtype=np.uint8)
+    buffer[:len(header)] = np.frombuffer(header, dtype=np.uint8)
+    buffer[len(header):len(header) + vertex_bytes].view("<f4")[:] = np.asarray(verts, dtype=np.float32).ravel()
+
+    records = buffer[len(header) + vertex_bytes:].view(PLY_FACE_DTYPE)
+    records["count"] = 3
+    records["indices"] = faces
+
+    with open(path, "wb") as f:
+        f.write(buffer)
+
+
+def write_mesh(path: str, verts: np.ndarray, faces: np.ndarray, normals: bool = True):
+    """Write a mesh as binary STL or PLY, by the path's extension"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".stl":
+        write_stl(path, verts, faces, normals=normals)
+    elif extension == ".ply":
+        write_ply(path, verts, faces)
+    else:
+        raise ValueError(f"Unsupported mesh format: {extension}")
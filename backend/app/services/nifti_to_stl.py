@@ -2,56 +2,39 @@
 Service to segment NIfTI files and convert brain regions to STL files
 This integrates the segmentation scripts into the backend service
 """
+import json
+import logging
 import os
 import subprocess
 import sys
-import nibabel as nib
 import numpy as np
-from skimage import measure
-import trimesh
 from pathlib import Path
-from typing import List, Dict, Optional
-
-# Brain region labels mapping
-REGION_LABELS = {
-    0: "Background",
-    1: "CSF_(Cerebrospinal_Fluid)",
-    2: "Gray_Matter",
-    3: "White_Matter",
-    4: "Deep_Gray_Matter",
-    5: "Brain_Stem",
-    6: "Cerebellum",
-    10: "Left_Thalamus",
-    11: "Left_Caudate",
-    12: "Left_Putamen",
-    13: "Left_Pallidum",
-    14: "3rd_Ventricle",
-    15: "4th_Ventricle",
-    16: "Brain_Stem",
-    17: "Left_Hippocampus",
-    18: "Left_Amygdala",
-    26: "Left_Accumbens_area",
-    28: "Left_VentralDC",
-    31: "Left_choroid_plexus",
-    41: "Right_Cerebral_White_Matter",
-    42: "Right_Cerebral_Cortex",
-    43: "Right_Lateral_Ventricle",
-    44: "Right_Inf_Lat_Vent",
-    46: "Right_Cerebellum_White_Matter",
-    47: "Right_Cerebellum_Cortex",
-    49: "Right_Thalamus",
-    50: "Right_Caudate",
-    51: "Right_Putamen",
-    52: "Right_Pallidum",
-    53: "Right_Hippocampus",
-    54: "Right_Amygdala",
-    58: "Right_Accumbens_area",
-    60: "Right_VentralDC",
-    63: "Right_choroid_plexus",
-    173: "Hypothalamus",
-    174: "Left_Hypothalamus",
-    175: "Right_Hypothalamus",
-}
+from typing import Callable, List, Dict, Optional
+
+from app.services.artifact_store import REGIONS_FILE, get_artifact_store
+from app.services.job_queue import get_event_log
+from app.services.mesh_io import write_mesh
+from app.services.object_store import data_path
+from app.services.region_labels import REGION_LABELS as SHARED_REGION_LABELS
+from app.services.storage_manager import get_storage_manager
+from app.services.intensity import digitize, intensity_range, normalized_edges
+from app.services.tracing import span
+from app.services.volume_cache import nifti_labels, nifti_mask, nifti_volume
+
+logger = logging.getLogger(__name__)
+
+# Brain region labels mapping, with the underscores used in file names
+REGION_LABELS = {label: name.replace(" ", "_") for label, name in SHARED_REGION_LABELS.items()}
+
+# Meshed first, in this order: brain stem, thalamus, hypothalamus, hippocampus,
+# amygdala, deep gray nuclei and ventricles - the structures checked first
+# around a resection
+CLINICAL_PRIORITY = [
+    5, 16, 10, 49, 173, 174, 175, 17, 53, 18, 54,
+    4, 11, 50, 12, 51, 13, 52, 14, 15, 43
+]
+# "clinical", "size" (largest first) or "label"; see order_regions
+MESH_ORDER = os.getenv("MESH_ORDER", "clinical").lower()
 
 
 def segment_nifti_to_regions(input_file: str, output_dir: str) -> Optional[str]:
@@ -69,7 +52,7 @@ def segment_nifti_to_regions(input_file: str, output_dir: str) -> Optional[str]:
     
     if script_path.exists():
         try:
-            print(f"Using SynthSeg to segment {input_file}...")
+            logger.info(f"Using SynthSeg to segment {input_file}...")
             cmd = [
                 sys.executable,
                 str(script_path),
@@ -86,21 +69,21 @@ def segment_nifti_to_regions(input_file: str, output_dir: str) -> Optional[str]:
             )
             
             if result.returncode == 0 and os.path.exists(segmented_output):
-                print(f"Segmentation complete: {segmented_output}")
+                logger.info(f"Segmentation complete: {segmented_output}")
                 return segmented_output
             else:
-                print(f"SynthSeg error: {result.stderr}")
+                logger.error(f"SynthSeg error: {result.stderr}")
         except subprocess.TimeoutExpired:
-            print("SynthSeg timed out")
+            logger.warning("SynthSeg timed out")
         except Exception as e:
-            print(f"SynthSeg error: {e}")
+            logger.error(f"SynthSeg error: {e}")
     
     # Fallback: Use simple thresholding-based segmentation
-    print("Using fallback segmentation method...")
+    logger.warning("Using fallback segmentation method...")
     try:
         return segment_with_thresholding(input_file, segmented_output)
     except Exception as e:
-        print(f"Fallback segmentation failed: {e}")
+        logger.error(f"Fallback segmentation failed: {e}")
         return None
 
 
@@ -109,152 +92,356 @@ def segment_with_thresholding(input_file: str, output_file: str) -> str:
     Simple thresholding-based segmentation as fallback.
     Creates basic tissue type labels.
     """
+    import nibabel as nib
+
     img = nib.load(input_file)
-    data = img.get_fdata()
+    data, _ = nifti_volume(input_file)
     
-    # Normalize
-    data_norm = (data - data.min()) / (data.max() - data.min() + 1e-8)
-    
-    # Simple thresholding for tissue types
-    segmented = np.zeros_like(data, dtype=np.int32)
-    
-    # Background
-    segmented[data_norm < 0.1] = 0
-    # CSF
-    segmented[(data_norm >= 0.1) & (data_norm < 0.3)] = 1
-    # Gray Matter
-    segmented[(data_norm >= 0.3) & (data_norm < 0.6)] = 2
-    # White Matter
-    segmented[(data_norm >= 0.6) & (data_norm < 0.8)] = 3
-    # Deep structures (simplified)
-    segmented[data_norm >= 0.8] = 4
+    # Tissue classes by normalized intensity, labelled in one pass straight into uint8:
+    # < 0.1 background, CSF, gray matter, white matter, >= 0.8 deep structures (simplified)
+    value_range = intensity_range(data)
+    segmented = digitize(data, normalized_edges([0.1, 0.3, 0.6, 0.8], value_range))
     
     # Save segmented image
     seg_img = nib.Nifti1Image(segmented, img.affine, img.header)
+    seg_img.set_data_dtype(np.uint8)
     nib.save(seg_img, output_file)
     
     return output_file
 
 
+def plan_regions(seg_data: np.ndarray) -> List[Dict]:
+    """Labels worth meshing in a label volume, with their names and voxel counts"""
+    # Voxel count per label in one pass; labels are small unsigned ints
+    label_counts = np.bincount(seg_data.ravel())
+    
+    regions = []
+    for label in np.flatnonzero(label_counts[1:]) + 1:  # Skip background
+        if label_counts[label] < 100:  # Skip tiny regions
+            continue
+        region_name = REGION_LABELS.get(int(label), f"Region_{int(label)}")
+        regions.append({
+            'label': int(label),
+            'name': region_name,
+            'safe_name': region_name.replace(" ", "_").replace("/", "_"),
+            'voxels': int(label_counts[label])
+        })
+    return regions
+
+
+def order_regions(regions: List[Dict], order: str = MESH_ORDER) -> List[Dict]:
+    """
+    The order to mesh regions in: "clinical" puts CLINICAL_PRIORITY labels
+    first and the rest largest first, "size" is largest first, "label" is
+    by label number
+    """
+    if order == "label":
+        return sorted(regions, key=lambda region: region['label'])
+    if order == "size":
+        return sorted(regions, key=lambda region: -region['voxels'])
+    if order != "clinical":
+        raise ValueError(f"Unknown MESH_ORDER: {order}")
+    rank = {label: i for i, label in enumerate(CLINICAL_PRIORITY)}
+    return sorted(regions, key=lambda region: (rank.get(region['label'], len(rank)), -region['voxels']))
+
+
+def _save_region(seg_img, seg_data: np.ndarray, region: Dict, output_dir: str) -> str:
+    """Write one region's mask as a NIfTI file; returns its path"""
+    import nibabel as nib
+
+    # uint8 mask: an eighth of the float64 / a quarter of the float32 it used to be
+    region_mask = (seg_data == region['label']).view(np.uint8)
+    
+    region_img = nib.Nifti1Image(region_mask, seg_img.affine, seg_img.header)
+    region_img.set_data_dtype(np.uint8)
+    
+    filepath = os.path.join(output_dir, f"{region['safe_name']}_{region['label']}.nii.gz")
+    nib.save(region_img, filepath)
+    return filepath
+
+
 def extract_regions_to_nifti(segmented_file: str, output_dir: str) -> Dict[int, Dict]:
     """
     Extract individual brain regions from segmented file as separate NIfTI files.
     Returns dictionary mapping label to region info.
     """
+    import nibabel as nib
+
     os.makedirs(output_dir, exist_ok=True)
     
     seg_img = nib.load(segmented_file)
-    seg_data = seg_img.get_fdata().astype(np.int32)
-    
-    unique_labels = np.unique(seg_data)
-    unique_labels = unique_labels[unique_labels > 0]  # Remove background
+    seg_data, _ = nifti_labels(segmented_file)
     
     extracted_regions = {}
-    
-    for label in unique_labels:
-        region_mask = (seg_data == label).astype(np.float32)
-        
-        if np.sum(region_mask) < 100:  # Skip tiny regions
-            continue
-        
-        region_img = nib.Nifti1Image(region_mask, seg_img.affine, seg_img.header)
-        
-        region_name = REGION_LABELS.get(int(label), f"Region_{int(label)}")
-        safe_name = region_name.replace(" ", "_").replace("/", "_")
-        filename = f"{safe_name}_{int(label)}.nii.gz"
-        filepath = os.path.join(output_dir, filename)
-        
-        nib.save(region_img, filepath)
-        extracted_regions[int(label)] = {
-            'name': region_name,
-            'file': filepath,
-            'voxels': int(np.sum(region_mask))
+    for region in plan_regions(seg_data):
+        extracted_regions[region['label']] = {
+            'name': region['name'],
+            'file': _save_region(seg_img, seg_data, region, output_dir),
+            'voxels': region['voxels']
         }
     
     return extracted_regions
 
 
+def _crop_to_mask(mask: np.ndarray):
+    """Slices of the mask's bounding box, padded by one voxel so the surface closes as before"""
+    bounds = []
+    for axis in range(mask.ndim):
+        other_axes = tuple(a for a in range(mask.ndim) if a != axis)
+        present = np.flatnonzero(mask.any(axis=other_axes))
+        bounds.append(slice(max(present[0] - 1, 0), min(present[-1] + 2, mask.shape[axis])))
+    return tuple(bounds)
+
+
 def nifti_to_stl(nifti_file: str, stl_file: str, iso_level: float = 0.5) -> bool:
     """
-    Convert a NIfTI file to STL format using marching cubes.
-    Returns True if successful.
+    Convert a region mask NIfTI file (voxels above iso_level) to STL format
+    (or binary PLY, for a .ply stl_file) using marching cubes. Returns True
+    if successful.
     """
+    from skimage import measure
+
     try:
-        img = nib.load(nifti_file)
-        data = img.get_fdata()
+        # Boolean mask at 1 byte per voxel instead of a float64 volume
+        mask, spacing = nifti_mask(nifti_file, iso_level)
         
-        if np.count_nonzero(data) < 100:
+        if np.count_nonzero(mask) < 100:
             return False
         
-        # Get spacing from header
-        spacing = img.header.get_zooms()[:3]
-        
-        # Marching cubes
-        verts, faces, normals, values = measure.marching_cubes(
-            data,
-            level=iso_level,
+        # Marching cubes on the region's bounding box only; it works in float32,
+        # so the crop also bounds that copy
+        crop = _crop_to_mask(mask)
+        verts, faces, _, _ = measure.marching_cubes(
+            mask[crop],
+            level=0.5,
             spacing=spacing
         )
         
         if len(verts) == 0:
             return False
         
-        # Create trimesh
-        mesh = trimesh.Trimesh(vertices=verts, faces=faces, vertex_normals=normals)
+        # Back to the full volume's coordinates
+        verts += np.array([s.start for s in crop], dtype=verts.dtype) * np.array(spacing, dtype=verts.dtype)
         
-        # Export STL
-        mesh.export(stl_file)
+        # Straight from the arrays to the file; STL keeps face normals only
+        write_mesh(stl_file, verts, faces)
         
         return True
     except Exception as e:
-        print(f"Error converting {nifti_file} to STL: {e}")
+        logger.error(f"Error converting {nifti_file} to STL: {e}")
         return False
 
 
 def process_nifti_to_stl_files(
     input_file: str,
     case_id: str,
-    stl_base_dir: str = "stl"
+    stl_base_dir: str = data_path("stl"),
+    content_digest: Optional[str] = None,
+    segment: Callable[[str, str], Optional[str]] = segment_nifti_to_regions
 ) -> List[Dict[str, str]]:
     """
     Main function: Process NIfTI file -> Segment -> Extract regions -> Convert to STL.
     Returns list of STL file info dictionaries.
+
+    With a content_digest (see artifact_store.fileset_digest), outputs go to
+    the content-addressed artifact store, and scans that were already
+    processed are linked to the existing outputs instead of recomputed.
+
+    Regions are meshed one at a time, most important first (MESH_ORDER),
+    and each is stored and listed as ready as soon as its STL file is
+    written. Stage transitions, a "mesh_ready" per region and a final
+    "done" are published to the case's job events (see job_events).
+
+    segment(input_file, output_dir) produces the label volume and returns
+    its path (None on failure); the ml-backend passes its own.
     """
-    # Create case-specific directories
-    case_stl_dir = os.path.join(stl_base_dir, case_id)
-    temp_seg_dir = os.path.join("temp_seg", case_id)
-    os.makedirs(case_stl_dir, exist_ok=True)
-    os.makedirs(temp_seg_dir, exist_ok=True)
-    
+    if content_digest is None:
+        # Create case-specific directories
+        case_stl_dir = os.path.join(stl_base_dir, case_id)
+        temp_seg_dir = data_path("temp_seg", case_id)
+        os.makedirs(case_stl_dir, exist_ok=True)
+        os.makedirs(temp_seg_dir, exist_ok=True)
+        stl_files = _run_pipeline(
+            input_file, temp_seg_dir, case_stl_dir, case_id,
+            save_status=_save_json(os.path.join(case_stl_dir, REGIONS_FILE)),
+            segment=segment
+        )
+        get_storage_manager().purge_intermediates(temp_seg_dir)
+        publish_done(case_id, stl_files)
+        return stl_files
+
+    store = get_artifact_store()
+    # Linked up front so the STL list shows regions as they are written
+    store.link_case(case_id, content_digest)
+    with store.build_lock(content_digest):
+        manifest = store.lookup(content_digest)
+        if manifest is not None:
+            logger.info(f"Reusing segmentation for case {case_id} (content {content_digest[:12]})")
+            stl_dir = store.stl_dir(content_digest)
+            publish_done(case_id, manifest['stl_files'])
+            return [dict(info, path=os.path.join(stl_dir, info['filename'])) for info in manifest['stl_files']]
+
+        # Built in a scratch directory of its own; finished files are moved into place
+        build_dir = store.start_build(content_digest)
+        try:
+            stl_files = _run_pipeline(
+                input_file, os.path.join(build_dir, "segmentation"), os.path.join(build_dir, "stl"), case_id,
+                save_status=lambda regions: store.write_regions(content_digest, regions),
+                on_region=lambda info: store.publish_region(content_digest, info),
+                segment=segment
+            )
+            get_event_log().publish(case_id, "stage", {"stage": "publishing"})
+            store.publish(content_digest, stl_files, build_dir)
+        except Exception:
+            store.discard_build(build_dir)
+            raise
+        # The per-region volumes are only needed to build the meshes
+        get_storage_manager().purge_intermediates(store.segmentation_dir(content_digest))
+        publish_done(case_id, stl_files)
+        return stl_files
+
+
+def _stl_info(info: Dict) -> Dict:
+    """What clients get for an STL file: the STLFileInfo fields, named as the STL list names them"""
+    return {
+        'filename': info['filename'],
+        'name': info['name'].replace("_", " "),
+        'label': int(info['label']),
+        'voxels': int(info['voxels'])
+    }
+
+
+def publish_done(case_id: str, stl_files: List[Dict]):
+    """Announce a case's finished STL files to its job event stream"""
+    get_event_log().publish(case_id, "done", {"stl_files": [_stl_info(info) for info in stl_files]})
+
+
+class RegionProgress:
+    """
+    Build status of each region (pending, meshing, ready or skipped when no
+    surface could be built), handed to save() after every change so the
+    STL list can show regions as they become available
+    """
+
+    def __init__(self, regions: List[Dict], save: Optional[Callable[[Dict], None]] = None):
+        self.regions = [
+            dict(_stl_info(dict(region, filename=f"{region['safe_name']}.stl")), status="pending")
+            for region in regions
+        ]
+        self._by_label = {region['label']: region for region in self.regions}
+        self._save = save
+        self._flush()
+
+    def update(self, label: int, status: str):
+        self._by_label[label]['status'] = status
+        self._flush()
+
+    def _flush(self):
+        if self._save is None:
+            return
+        try:
+            self._save({'regions': self.regions})
+        except Exception as e:
+            # Status is informational; never fail the build over it
+            logger.warning(f"Could not save region status: {e}")
+
+
+def _save_json(path: str) -> Callable[[Dict], None]:
+    """A save() for RegionProgress writing atomically to a local file"""
+    def save(data: Dict):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    return save
+
+
+@span("nifti.pipeline")
+def _run_pipeline(
+    input_file: str,
+    temp_seg_dir: str,
+    case_stl_dir: str,
+    case_id: Optional[str] = None,
+    save_status: Optional[Callable[[Dict], None]] = None,
+    on_region: Optional[Callable[[Dict], None]] = None,
+    segment: Callable[[str, str], Optional[str]] = segment_nifti_to_regions
+) -> List[Dict[str, str]]:
+    """
+    Segment, then extract and mesh one region at a time into case_stl_dir
+    in order_regions() order. on_region(info) runs as each STL file is
+    written, before the region is reported ready.
+    """
+    import nibabel as nib
+
+    events = get_event_log()
     # Step 1: Segment the brain
-    segmented_file = segment_nifti_to_regions(input_file, temp_seg_dir)
+    if case_id:
+        events.publish(case_id, "stage", {"stage": "segmenting"})
+    with span("nifti.segment"):
+        segmented_file = segment(input_file, temp_seg_dir)
     if not segmented_file or not os.path.exists(segmented_file):
         raise RuntimeError("Segmentation failed")
     
-    # Step 2: Extract individual regions
-    regions = extract_regions_to_nifti(segmented_file, temp_seg_dir)
+    # Step 2: Decide which regions to mesh, most important first
+    if case_id:
+        events.publish(case_id, "stage", {"stage": "extracting"})
+    with span("nifti.extract"):
+        seg_img = nib.load(segmented_file)
+        seg_data, _ = nifti_labels(segmented_file)
+        regions = order_regions(plan_regions(seg_data))
+    progress = RegionProgress(regions, save_status)
     
-    # Step 3: Convert each region to STL
+    # Step 3: Extract and convert each region to STL, publishing it before starting the next
+    if case_id:
+        events.publish(case_id, "stage", {
+            "stage": "meshing",
+            "regions": len(regions),
+            "order": [region['filename'] for region in progress.regions]
+        })
+    with span("nifti.mesh"):
+        return _mesh_regions(seg_img, seg_data, regions, temp_seg_dir, case_stl_dir, progress, case_id, on_region)
+
+
+def _mesh_regions(
+    seg_img,
+    seg_data: np.ndarray,
+    regions: List[Dict],
+    region_dir: str,
+    case_stl_dir: str,
+    progress: RegionProgress,
+    case_id: Optional[str] = None,
+    on_region: Optional[Callable[[Dict], None]] = None
+) -> List[Dict[str, str]]:
+    """Mesh regions in order into case_stl_dir, announcing each as it is written"""
     stl_files = []
-    for label, region_info in regions.items():
-        nifti_path = region_info['file']
-        region_name = region_info['name']
-        
-        # Create STL filename
-        safe_name = region_name.replace(" ", "_").replace("/", "_")
-        stl_filename = f"{safe_name}.stl"
+    for region in regions:
+        stl_filename = f"{region['safe_name']}.stl"
         stl_path = os.path.join(case_stl_dir, stl_filename)
+        progress.update(region['label'], "meshing")
+        
+        with span("nifti.extract_region"):
+            nifti_path = _save_region(seg_img, seg_data, region, region_dir)
         
         # Convert to STL
-        if nifti_to_stl(nifti_path, stl_path):
-            stl_files.append({
-                'filename': stl_filename,
-                'path': stl_path,
-                'name': region_name,
-                'label': label,
-                'voxels': region_info['voxels']
-            })
-            print(f"Created STL: {stl_filename}")
+        with span("nifti.region_to_stl"):
+            converted = nifti_to_stl(nifti_path, stl_path)
+        if not converted:
+            progress.update(region['label'], "skipped")
+            continue
+        
+        info = {
+            'filename': stl_filename,
+            'path': stl_path,
+            'name': region['name'],
+            'label': region['label'],
+            'voxels': region['voxels']
+        }
+        if on_region is not None:
+            on_region(info)
+        stl_files.append(info)
+        progress.update(region['label'], "ready")
+        logger.info(f"Created STL: {stl_filename}")
+        if case_id:
+            get_event_log().publish(case_id, "mesh_ready", _stl_info(info))
     
     return stl_files
-
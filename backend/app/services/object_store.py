@@ -0,0 +1,430 @@
+"""
+Where artifacts live: data paths and the object storage backend.
+
+Every data directory (uploads, temp_seg, stl, artifacts) is resolved
+against one absolute DATA_ROOT, by default the project root, so both APIs
+and all replicas on a host agree on locations whatever their working
+directory.
+
+Published pipeline outputs go through an ObjectStore:
+
+- LocalObjectStore keeps objects as files under a directory. It is the
+  default, and objects land exactly where the pipeline writes them.
+- S3ObjectStore keeps them in an S3-compatible bucket (AWS, MinIO, or a
+  local stand-in such as `moto_server` via OBJECT_STORE_ENDPOINT), so
+  replicas share outputs. Reads and writes stream in chunks, downloads can
+  be handed out as presigned URLs, and local_path() serves repeat reads
+  from a node-local read-through cache (ReadThroughCache) instead of going
+  back to the bucket.
+
+boto3 is only imported when the S3 backend is selected (OBJECT_STORE=s3).
+"""
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Iterable, List, Optional, Union
+
+
+def _default_data_root() -> str:
+    """The project root (the directory holding backend/ and ml-backend/), else the cwd"""
+    path = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        if os.path.isdir(os.path.join(path, "backend")) and os.path.isdir(os.path.join(path, "ml-backend")):
+            return path
+        parent = os.path.dirname(path)
+        if parent == path:
+            return os.getcwd()
+        path = parent
+
+
+DATA_ROOT = os.path.abspath(os.getenv("DATA_ROOT") or _default_data_root())
+
+OBJECT_STORE = os.getenv("OBJECT_STORE", "local").lower()
+OBJECT_STORE_BUCKET = os.getenv("OBJECT_STORE_BUCKET", "")
+OBJECT_STORE_PREFIX = os.getenv("OBJECT_STORE_PREFIX", "")
+OBJECT_STORE_ENDPOINT = os.getenv("OBJECT_STORE_ENDPOINT") or None
+OBJECT_STORE_REGION = os.getenv("OBJECT_STORE_REGION") or None
+# Lifetime of presigned download URLs; 0 streams downloads through the API instead
+OBJECT_STORE_URL_TTL = int(os.getenv("OBJECT_STORE_URL_TTL", "900"))
+OBJECT_CACHE_MAX_BYTES = int(os.getenv("OBJECT_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# A copy read this recently is never dropped, so a path just handed out
+# stays there until the caller has opened it
+OBJECT_CACHE_GRACE_SECONDS = float(os.getenv("OBJECT_CACHE_GRACE_SECONDS", "60"))
+CHUNK_SIZE = 1024 * 1024
+
+
+def data_path(*parts: str) -> str:
+    """Absolute path under DATA_ROOT"""
+    return os.path.join(DATA_ROOT, *parts)
+
+
+OBJECT_CACHE_DIR = os.path.abspath(os.getenv("OBJECT_CACHE_DIR") or data_path("object_cache"))
+
+
+class ObjectNotFound(Exception):
+    pass
+
+
+Readable = Union[BinaryIO, Iterable[bytes]]
+
+
+def _chunks(data: Readable) -> Iterable[bytes]:
+    if hasattr(data, "read"):
+        while True:
+            chunk = data.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from data
+
+
+class ObjectStore(ABC):
+    """Keys are '/'-separated paths relative to the store's root or prefix"""
+
+    remote = False
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """A file-like object streaming the object; raises ObjectNotFound"""
+
+    @abstractmethod
+    def write(self, key: str, data: Readable):
+        """Store a file-like object or an iterable of byte chunks"""
+
+    def upload_file(self, key: str, path: str):
+        with open(path, "rb") as f:
+            self.write(key, f)
+
+    def move_file(self, key: str, path: str):
+        """Store a local file and remove it"""
+        self.upload_file(key, path)
+        os.remove(path)
+
+    def read_bytes(self, key: str) -> bytes:
+        with self.open(key) as f:
+            return f.read()
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        pass
+
+    @abstractmethod
+    def list(self, prefix: str = "") -> List[str]:
+        """Keys under a prefix"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+
+    @abstractmethod
+    def local_path(self, key: str) -> str:
+        """A file on this node holding the object"""
+
+    def url(self, key: str, expires: int = OBJECT_STORE_URL_TTL) -> Optional[str]:
+        """A presigned URL clients can download from directly, or None"""
+        return None
+
+
+class LocalObjectStore(ObjectStore):
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if os.path.commonpath([path, self.root]) != self.root:
+            raise ValueError(f"Key escapes the store: {key}")
+        return path
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return open(self._path(key), "rb")
+        except FileNotFoundError:
+            raise ObjectNotFound(key)
+
+    def write(self, key: str, data: Readable):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            for chunk in _chunks(data):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+
+    def upload_file(self, key: str, path: str):
+        # Outputs are usually written in place already
+        if os.path.abspath(path) != self._path(key):
+            super().upload_file(key, path)
+
+    def move_file(self, key: str, path: str):
+        # A rename, when the file is on the store's filesystem
+        target = self._path(key)
+        if os.path.abspath(path) == target:
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.replace(path, target)
+        except OSError:
+            super().move_file(key, path)
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._path(key))
+
+    def list(self, prefix: str = "") -> List[str]:
+        base = self._path(prefix) if prefix else self.root
+        if not os.path.isdir(base):
+            return []
+        keys = []
+        for dirpath, _, filenames in os.walk(base):
+            for name in filenames:
+                if not name.endswith(".tmp"):
+                    keys.append(os.path.relpath(os.path.join(dirpath, name), self.root).replace(os.sep, "/"))
+        return sorted(keys)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key: str) -> str:
+        path = self._path(key)
+        if not os.path.isfile(path):
+            raise ObjectNotFound(key)
+        return path
+
+
+class ReadThroughCache:
+    """
+    Node-local copies of remote objects, fetched on first read. Objects are
+    immutable once published, so a cached copy never goes stale. The least
+    recently read copies are dropped when the cache exceeds max_bytes,
+    except those read within grace_seconds (by any process sharing the
+    directory, going by mtime), which may be about to be opened.
+    The directory is scanned once, on first use; after that, sizes and
+    read order are tracked in memory, so a miss costs no directory walk.
+    """
+
+    def __init__(
+        self,
+        root: str = OBJECT_CACHE_DIR,
+        max_bytes: int = OBJECT_CACHE_MAX_BYTES,
+        grace_seconds: float = OBJECT_CACHE_GRACE_SECONDS
+    ):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.grace_seconds = grace_seconds
+        self._lock = threading.Lock()
+        self._fetching = {}
+        # Cached file path -> size, least recently read first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._scanned = False
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, fetch: Callable[[str], None]) -> str:
+        """Path of the cached copy of key, calling fetch(path) to fill it on a miss"""
+        path = os.path.join(self.root, *key.split("/"))
+        with self._lock:
+            self._scan()
+            try:
+                # mtime keeps the read order across restarts, and starts the grace period
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            else:
+                if path in self._entries:
+                    self._entries.move_to_end(path)
+                self.hits += 1
+                return path
+        with self._lock:
+            lock = self._fetching.setdefault(key, threading.Lock())
+        with lock:
+            # Another thread may have fetched it while this one waited
+            if not os.path.isfile(path):
+                self.misses += 1
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+                try:
+                    fetch(tmp_path)
+                    size = os.path.getsize(tmp_path)
+                    os.replace(tmp_path, path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                with self._lock:
+                    self._scan()
+                    self._size += size - self._entries.pop(path, 0)
+                    self._entries[path] = size
+                    self._trim()
+        with self._lock:
+            self._fetching.pop(key, None)
+        return path
+
+    def _scan(self):
+        """Index the copies already on disk, oldest read first (caller holds self._lock)"""
+        if self._scanned:
+            return
+        self._scanned = True
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        for _, size, path in sorted(entries):
+            self._entries[path] = size
+            self._size += size
+
+    def _trim(self):
+        """Drop the least recently read copies, skipping any still in their grace period (caller holds self._lock)"""
+        now = time.time()
+        for _ in range(len(self._entries)):
+            if self._size <= self.max_bytes:
+                break
+            path, size = self._entries.popitem(last=False)
+            try:
+                recent = now - os.stat(path).st_mtime < self.grace_seconds
+            except OSError:
+                recent = False
+            if recent:
+                # Read since it was indexed, possibly by another process
+                self._entries[path] = size
+                continue
+            self._size -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class S3ObjectStore(ObjectStore):
+    remote = True
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        cache: Optional[ReadThroughCache] = None
+    ):
+        import boto3
+
+        if not bucket:
+            raise ValueError("OBJECT_STORE_BUCKET is required for the s3 object store")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.cache = cache or ReadThroughCache(os.path.join(OBJECT_CACHE_DIR, bucket, *filter(None, prefix.split("/"))))
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _missing(self, error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def open(self, key: str) -> BinaryIO:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+        except ClientError as e:
+            if self._missing(e):
+                raise ObjectNotFound(key)
+            raise
+
+    def write(self, key: str, data: Readable):
+        if not hasattr(data, "read"):
+            data = _IterReader(_chunks(data))
+        # Multipart upload in CHUNK_SIZE parts; nothing is buffered whole
+        self.client.upload_fileobj(data, self.bucket, self._key(key))
+
+    def upload_file(self, key: str, path: str):
+        self.client.upload_file(path, self.bucket, self._key(key))
+
+    def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except ClientError as e:
+            if self._missing(e):
+                return False
+            raise
+
+    def list(self, prefix: str = "") -> List[str]:
+        keys = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            keys.extend(item["Key"][len(self.prefix):] for item in page.get("Contents", []))
+        return sorted(keys)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def local_path(self, key: str) -> str:
+        from botocore.exceptions import ClientError
+
+        def fetch(path):
+            try:
+                self.client.download_file(self.bucket, self._key(key), path)
+            except ClientError as e:
+                if self._missing(e):
+                    raise ObjectNotFound(key)
+                raise
+
+        return self.cache.get(key, fetch)
+
+    def url(self, key: str, expires: int = OBJECT_STORE_URL_TTL) -> Optional[str]:
+        if expires <= 0:
+            return None
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._key(key)}, ExpiresIn=expires
+        )
+
+
+class _IterReader:
+    """File-like read() over an iterable of byte chunks"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        # bytearray: appending and dropping from the front are amortized O(1)
+        self._buffer = bytearray()
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0 or size >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+
+def make_object_store(name: str, local_root: str) -> ObjectStore:
+    """
+    The configured backend for one kind of object: files under local_root,
+    or keys under <OBJECT_STORE_PREFIX><name>/ in the bucket
+    """
+    if OBJECT_STORE == "s3":
+        prefix = f"{OBJECT_STORE_PREFIX.rstrip('/')}/{name}/" if OBJECT_STORE_PREFIX else f"{name}/"
+        return S3ObjectStore(OBJECT_STORE_BUCKET, prefix, OBJECT_STORE_ENDPOINT, OBJECT_STORE_REGION)
+    if OBJECT_STORE != "local":
+        raise ValueError(f"Unknown OBJECT_STORE: {OBJECT_STORE}")
+    return LocalObjectStore(local_root)
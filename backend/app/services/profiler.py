@@ -0,0 +1,221 @@
+"""
+On-demand statistical profiler for running API workers.
+
+A sampler thread snapshots Python stacks (sys._current_frames) every
+PROFILER_INTERVAL_MS and counts them. Nothing runs until a profile is
+requested, and while one is running the cost is one stack walk per thread
+per sample.
+
+Output is the collapsed-stack format ("thread;outer;...;inner count" per
+line) that flamegraph.pl, speedscope and inferno read directly.
+
+Two ways in, both admin-only (PROFILER_ADMIN_TOKEN, sent as X-Admin-Token;
+profiling is disabled while it is unset):
+- attach for N seconds and get the profile back;
+- send X-Profile: 1 with a request. ProfilingMiddleware samples the
+  thread serving the request while it runs, stores the result, and
+  returns its ID in the X-Profile-Id response header.
+
+An attached profile covers every thread of the API process it is sent to:
+request handlers, the threadpool, the write-behind thread and inline
+segmentation workers. A per-request profile covers only the request's own
+thread (the event loop, for async handlers), so other requests don't show
+up in it. Work it hands to the threadpool is not included; attach for that.
+Neither covers other processes: segmentation workers started with
+`python -m app.worker` have no profiling endpoint, so sample them from
+outside (e.g. py-spy) if needed.
+"""
+import asyncio
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Set
+
+PROFILER_ADMIN_TOKEN = os.getenv("PROFILER_ADMIN_TOKEN", "")
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "10"))
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "120"))
+# Profiles kept for download, oldest dropped first
+PROFILER_KEEP = int(os.getenv("PROFILER_KEEP", "20"))
+
+ADMIN_TOKEN_HEADER = "x-admin-token"
+PROFILE_REQUEST_HEADER = "x-profile"
+PROFILE_ID_HEADER = "x-profile-id"
+
+
+def admin_token_valid(token: Optional[str]) -> bool:
+    """True if profiling is enabled and the token matches"""
+    # Compared as bytes: compare_digest rejects str with non-ASCII characters
+    return (
+        bool(PROFILER_ADMIN_TOKEN)
+        and token is not None
+        and hmac.compare_digest(token.encode("utf-8"), PROFILER_ADMIN_TOKEN.encode("utf-8"))
+    )
+
+
+class Profile:
+    """
+    Stack counts collected between start() and stop(), for the given
+    thread idents or, when threads is None, every thread
+    """
+
+    def __init__(self, label: str, threads: Optional[Set[int]] = None):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.threads = threads
+        self.started = time.time()
+        self.duration = 0.0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def collapsed(self) -> str:
+        lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "label": self.label,
+            "started": self.started,
+            "duration": round(self.duration, 3),
+            "samples": self.samples,
+            "stacks": len(self.stacks)
+        }
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _fold(frame) -> List[str]:
+    """Frames from outermost to innermost"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return names
+
+
+class SamplingProfiler:
+    """
+    One sampler thread shared by all active profiles; it runs only while at
+    least one profile is active, and feeds each sample to all of them.
+    """
+
+    def __init__(self, interval_ms: float = PROFILER_INTERVAL_MS, keep: int = PROFILER_KEEP):
+        self.interval = interval_ms / 1000
+        self._active: List[Profile] = []
+        self._finished: "OrderedDict[str, Profile]" = OrderedDict()
+        self._keep = keep
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, label: str, threads: Optional[Set[int]] = None) -> Profile:
+        profile = Profile(label, threads)
+        with self._lock:
+            self._active.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+                self._thread.start()
+        return profile
+
+    def stop(self, profile: Profile) -> Profile:
+        with self._lock:
+            if profile in self._active:
+                self._active.remove(profile)
+                profile.duration = time.time() - profile.started
+                self._finished[profile.id] = profile
+                while len(self._finished) > self._keep:
+                    self._finished.popitem(last=False)
+        return profile
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        with self._lock:
+            return self._finished.get(profile_id)
+
+    def list(self) -> List[Dict]:
+        with self._lock:
+            return [profile.summary() for profile in reversed(self._finished.values())]
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                active = list(self._active)
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = {
+                ident: ";".join([thread_names.get(ident, str(ident))] + _fold(frame))
+                for ident, frame in sys._current_frames().items()
+                if ident != own
+            }
+            with self._lock:
+                for profile in active:
+                    profile.samples += 1
+                    if profile.threads is None:
+                        profile.stacks.update(stacks.values())
+                    else:
+                        profile.stacks.update(stacks[ident] for ident in profile.threads if ident in stacks)
+            time.sleep(self.interval)
+
+
+_profiler = SamplingProfiler()
+
+
+def get_profiler() -> SamplingProfiler:
+    return _profiler
+
+
+async def attach(seconds: float) -> Profile:
+    """Sample every thread for `seconds` (capped at PROFILER_MAX_SECONDS)"""
+    seconds = min(seconds, PROFILER_MAX_SECONDS)
+    profiler = get_profiler()
+    profile = profiler.start(f"attach {seconds:g}s")
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop(profile)
+    return profile
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the thread serving a single request when it carries
+    X-Profile: 1 and a valid X-Admin-Token
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers", []))
+        wanted = headers.get(PROFILE_REQUEST_HEADER.encode(), b"").decode("latin-1").lower() in ("1", "true", "yes")
+        token = headers.get(ADMIN_TOKEN_HEADER.encode(), b"").decode("latin-1")
+        if not wanted or not admin_token_valid(token):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = get_profiler()
+        profile = profiler.start(f"{scope['method']} {scope['path']}", threads={threading.get_ident()})
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", [])) + [(PROFILE_ID_HEADER.encode(), profile.id.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop(profile)
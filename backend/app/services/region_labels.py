@@ -0,0 +1,50 @@
+"""
+Brain region label table shared by segmentation, meshing and stress
+classification. Plain constants only, so it can be imported on request
+paths without pulling in imaging libraries.
+"""
+
+# Note: SynthSeg provides anatomical regions (thalamus, hypothalamus, etc.)
+# ANTsPyNet deep_atropos provides tissue types (CSF, gray matter, white matter, etc.)
+REGION_LABELS = {
+    # Tissue types (from ANTsPyNet deep_atropos)
+    0: "Background",
+    1: "CSF (Cerebrospinal Fluid)",
+    2: "Gray Matter",
+    3: "White Matter",
+    4: "Deep Gray Matter",
+    5: "Brain Stem",
+    6: "Cerebellum",
+    # Anatomical regions (from SynthSeg - if available)
+    10: "Left Thalamus",
+    11: "Left Caudate",
+    12: "Left Putamen",
+    13: "Left Pallidum",
+    14: "3rd Ventricle",
+    15: "4th Ventricle",
+    16: "Brain Stem",
+    17: "Left Hippocampus",
+    18: "Left Amygdala",
+    26: "Left Accumbens area",
+    28: "Left VentralDC",
+    31: "Left choroid plexus",
+    41: "Right Cerebral White Matter",
+    42: "Right Cerebral Cortex",
+    43: "Right Lateral Ventricle",
+    44: "Right Inf Lat Vent",
+    46: "Right Cerebellum White Matter",
+    47: "Right Cerebellum Cortex",
+    49: "Right Thalamus",
+    50: "Right Caudate",
+    51: "Right Putamen",
+    52: "Right Pallidum",
+    53: "Right Hippocampus",
+    54: "Right Amygdala",
+    58: "Right Accumbens area",
+    60: "Right VentralDC",
+    63: "Right choroid plexus",
+    # Additional labels for hypothalamus and other regions
+    173: "Hypothalamus",
+    174: "Left Hypothalamus",
+    175: "Right Hypothalamus",
+}
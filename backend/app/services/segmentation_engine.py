@@ -1,63 +1,183 @@
 import numpy as np
+import logging
 import os
 import glob
-import pydicom
-from skimage import measure
-from scipy.ndimage import zoom, binary_erosion, binary_dilation
-from app.models.schemas import MeshData
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from app.models.schemas import MeshData, MeshingInfo, MeshingPolicy
+from app.services.blockwise import boundary_faces, erode_dilate, marching_cubes
+from app.services.intensity import digitize, intensity_range, normalized, quantiles
+from app.services.object_store import data_path
+from app.services.tracing import span
+from app.services.volume_cache import CACHE_DIR_NAME, cached_volume
 
+logger = logging.getLogger(__name__)
 
-def load_dicom_volume(case_dir):
+
+DICOM_LOAD_WORKERS = int(os.getenv("DICOM_LOAD_WORKERS", str(min(8, os.cpu_count() or 1))))
+
+# Default triangle budget per meshing mode; preview matches the old fixed
+# mesh size (about 5k vertices, so about 10k triangles)
+MESH_TRIANGLE_BUDGETS = {
+    "preview": int(os.getenv("MESH_PREVIEW_TRIANGLES", "10000")),
+    "full": int(os.getenv("MESH_FULL_TRIANGLES", "2000000")),
+}
+MAX_MESH_STEP_SIZE = 16
+
+
+def _read_dicom_header(dcm_file):
+    """Parse one file's header only; returns None for unreadable files"""
+    import pydicom
+
+    try:
+        return pydicom.dcmread(dcm_file, stop_before_pixels=True)
+    except Exception as e:
+        logger.error(f"Error reading {dcm_file}: {e}")
+        return None
+
+
+def _stored_dtype(ds):
+    """numpy dtype of a slice's stored pixels, from its header"""
+    bits = int(getattr(ds, "BitsAllocated", 16))
+    if int(getattr(ds, "SamplesPerPixel", 1)) != 1 or bits not in (8, 16, 32):
+        return np.dtype(np.float32)
+    return np.dtype(f"{'i' if int(getattr(ds, 'PixelRepresentation', 0)) else 'u'}{bits // 8}")
+
+
+def _single_channel(pixels, ds):
     """
-    Load DICOM slices and stack them into a 3D volume
-    Returns: 3D numpy array with the volume data
+    Reduce a multi-sample (e.g. RGB) slice of shape (rows, cols, samples) to
+    one channel: the Y plane for YBR data, else the Rec. 601 luma
     """
-    # Get all DICOM files
-    dcm_files = glob.glob(os.path.join(case_dir, "*.dcm"))
+    if int(getattr(ds, "SamplesPerPixel", 1)) == 1:
+        return pixels
+    if str(getattr(ds, "PhotometricInterpretation", "")).startswith("YBR"):
+        return pixels[..., 0]
+    return pixels[..., :3].astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
 
-    if not dcm_files:
+
+def _slice_position(ds):
+    """Position along the slice normal, or None if the orientation tags are missing"""
+    try:
+        orientation = np.array(ds.ImageOrientationPatient, dtype=np.float64)
+        normal = np.cross(orientation[:3], orientation[3:])
+        return float(np.dot(normal, np.array(ds.ImagePositionPatient, dtype=np.float64)))
+    except (AttributeError, ValueError, TypeError):
         return None
 
-    print(f"Loading {len(dcm_files)} DICOM slices...")
 
-    # Read all DICOM files and sort by slice location
-    slices = []
-    for dcm_file in dcm_files:
-        try:
-            ds = pydicom.dcmread(dcm_file)
-            slices.append(ds)
-        except Exception as e:
-            print(f"Error reading {dcm_file}: {e}")
-            continue
+def _sort_series(headers):
+    """
+    Sort (file, header) pairs of one series into slice order and return
+    them with the spacing between slices (None if it can't be measured)
+    """
+    positions = [_slice_position(ds) for _, ds in headers]
+    if all(p is not None for p in positions):
+        order = np.argsort(positions, kind="stable")
+        headers = [headers[i] for i in order]
+        gaps = np.diff(np.sort(positions))
+        return headers, float(np.median(gaps)) if len(gaps) else None
 
-    # Sort slices by ImagePositionPatient (Z coordinate) or InstanceNumber
     try:
-        slices.sort(key=lambda x: float(x.ImagePositionPatient[2]))
-    except:
-        try:
-            slices.sort(key=lambda x: int(x.InstanceNumber))
-        except:
-            print("Warning: Could not sort slices properly")
-
-    # Stack slices into 3D volume
-    volume_slices = []
-    for s in slices:
-        # Get pixel array and apply rescale slope/intercept if available
-        pixel_array = s.pixel_array.astype(np.float32)
+        headers = sorted(headers, key=lambda item: int(item[1].InstanceNumber))
+    except (AttributeError, ValueError, TypeError):
+        logger.warning("Could not sort slices properly")
+    return headers, None
 
-        # Apply Hounsfield Unit conversion for CT scans
-        if hasattr(s, 'RescaleSlope') and hasattr(s, 'RescaleIntercept'):
-            pixel_array = pixel_array * float(s.RescaleSlope) + float(s.RescaleIntercept)
 
-        volume_slices.append(pixel_array)
+def load_dicom_volume(case_dir):
+    """
+    Load DICOM slices and stack them into a 3D volume
+    Returns: (volume, spacing) - 3D array (Z, Y, X) and the voxel spacing in
+    mm as (z, y, x), or (None, None) if there are no DICOM files. The volume
+    keeps the stored integer type where the rescale allows, else float32.
+    Multi-sample (colour) slices are reduced to a single grey channel.
+
+    Headers are read first (without pixel data) to group slices by series,
+    sort them and check their dimensions; pixel data is then decoded in a
+    thread pool straight into a preallocated volume.
+    """
+    # Get all DICOM files
+    dcm_files = sorted(glob.glob(os.path.join(case_dir, "*.dcm")))
 
-    # Stack into 3D array (Z, Y, X)
-    volume = np.stack(volume_slices, axis=0)
+    if not dcm_files:
+        return None, None
+
+    logger.info(f"Loading {len(dcm_files)} DICOM slices...")
+
+    with ThreadPoolExecutor(max_workers=DICOM_LOAD_WORKERS) as pool:
+        headers = [
+            (dcm_file, ds) for dcm_file, ds in zip(dcm_files, pool.map(_read_dicom_header, dcm_files))
+            if ds is not None
+        ]
+    if not headers:
+        return None, None
+
+    # Keep the largest series if the upload mixes several
+    series = {}
+    for dcm_file, ds in headers:
+        series.setdefault(getattr(ds, "SeriesInstanceUID", None), []).append((dcm_file, ds))
+    headers = max(series.values(), key=len)
+    if len(series) > 1:
+        logger.warning(f"{len(series)} series uploaded, using the largest ({len(headers)} slices)")
+
+    # Drop slices whose in-plane size doesn't match the rest of the series
+    shapes = [(int(ds.Rows), int(ds.Columns)) for _, ds in headers]
+    rows, columns = max(set(shapes), key=shapes.count)
+    if shapes.count((rows, columns)) != len(headers):
+        logger.warning(f"skipping {len(headers) - shapes.count((rows, columns))} slices with mismatched dimensions")
+        headers = [item for item, shape in zip(headers, shapes) if shape == (rows, columns)]
+
+    headers, slice_spacing = _sort_series(headers)
+    first = headers[0][1]
+    if slice_spacing is None or slice_spacing <= 0:
+        slice_spacing = float(getattr(first, "SpacingBetweenSlices", getattr(first, "SliceThickness", 1.0)) or 1.0)
+    pixel_spacing = [float(v) for v in getattr(first, "PixelSpacing", [1.0, 1.0])]
+    spacing = (slice_spacing, pixel_spacing[0], pixel_spacing[1])
+
+    volume = np.empty((len(headers), rows, columns), dtype=_stored_dtype(first))
+
+    import pydicom
+
+    def decode(index):
+        dcm_file = headers[index][0]
+        ds = pydicom.dcmread(dcm_file)
+        volume[index] = _single_channel(ds.pixel_array, ds)
+
+    # numpy and most pixel decoders release the GIL, so slices decode in parallel
+    with ThreadPoolExecutor(max_workers=DICOM_LOAD_WORKERS) as pool:
+        list(pool.map(decode, range(len(headers))))
+
+    # Apply Hounsfield Unit conversion for CT scans, over the whole volume at once
+    slopes = np.array([float(getattr(ds, "RescaleSlope", 1.0)) for _, ds in headers])
+    intercepts = np.array([float(getattr(ds, "RescaleIntercept", 0.0)) for _, ds in headers])
+    if np.any(slopes != 1.0) or np.any(intercepts != 0.0):
+        if np.all(slopes == np.round(slopes)) and np.all(intercepts == np.round(intercepts)):
+            # Integer rescale (the usual CT case): stay in the smallest integer type that holds the result
+            lo, hi = float(volume.min()), float(volume.max())
+            # Includes the products, since the slope is applied before the intercept
+            ends = np.concatenate([slopes * lo, slopes * hi, slopes * lo + intercepts, slopes * hi + intercepts])
+            dtype = next(
+                (t for t in (np.int16, np.int32) if np.iinfo(t).min <= ends.min() and ends.max() <= np.iinfo(t).max),
+                np.float32
+            )
+        else:
+            dtype = np.float32
+        volume = volume.astype(dtype, copy=False)
+        if np.all(slopes == slopes[0]) and np.all(intercepts == intercepts[0]):
+            volume *= volume.dtype.type(slopes[0])
+            volume += volume.dtype.type(intercepts[0])
+        else:
+            volume *= slopes[:, np.newaxis, np.newaxis].astype(volume.dtype)
+            volume += intercepts[:, np.newaxis, np.newaxis].astype(volume.dtype)
 
-    print(f"Volume shape: {volume.shape}")
-    print(f"Volume range: [{volume.min()}, {volume.max()}]")
+    logger.info(f"Volume shape: {volume.shape}, spacing (mm): {spacing}")
+    if logger.isEnabledFor(logging.DEBUG):  # A full pass over the volume
+        logger.debug(f"Volume range: [{volume.min()}, {volume.max()}]")
 
-    return volume
+    return volume, spacing
 
 
 def segment_brain_tissue(volume):
@@ -65,151 +185,156 @@ def segment_brain_tissue(volume):
     Segment brain tissue from CT/MRI volume using thresholding
     Returns binary mask of brain tissue
     """
-    # Normalize volume to 0-1 range
-    volume_norm = (volume - volume.min()) / (volume.max() - volume.min() + 1e-8)
+    value_range = intensity_range(volume)
 
     # For brain CT scans, brain tissue is typically in the range of 0-80 HU
     # For MRI, we'll use intensity-based thresholding
 
     # Apply thresholding to extract brain tissue
     # This is a simple approach - in production you'd use deep learning
-    threshold_low = np.percentile(volume_norm, 20)
-    threshold_high = np.percentile(volume_norm, 95)
+    # Percentiles from one histogram pass over the raw volume instead of two full sorts
+    threshold_low, threshold_high = quantiles(volume, [0.20, 0.95], value_range)
+
+    # Strictly between the thresholds is class 1; the mask reuses the class array's memory
+    classes = digitize(volume, [np.nextafter(threshold_low, np.inf), threshold_high])
+    brain_mask = np.equal(classes, 1, out=classes.view(np.bool_))
 
-    brain_mask = (volume_norm > threshold_low) & (volume_norm < threshold_high)
+    # Normalize volume to 0-1 range (float32, built in place)
+    volume_norm = normalized(volume, value_range)
 
-    # Morphological operations to clean up the mask
-    brain_mask = binary_erosion(brain_mask, iterations=2)
-    brain_mask = binary_dilation(brain_mask, iterations=3)
+    # Morphological operations to clean up the mask, slab by slab with a 5-slice halo
+    brain_mask = erode_dilate(brain_mask, erosion_iterations=2, dilation_iterations=3)
 
     return brain_mask, volume_norm
 
 
-def generate_mesh_from_volume(volume, brain_mask, target_vertices=5000):
+@contextmanager
+def _timed(timings, stage):
+    """Record a stage's wall time in seconds under timings[stage], and trace it as a span"""
+    start = time.perf_counter()
+    try:
+        with span(f"segmentation.{stage}"):
+            yield
+    finally:
+        timings[stage] = round(time.perf_counter() - start, 4)
+
+
+def choose_step_size(brain_mask, max_triangles):
+    """Smallest marching cubes step whose mesh should fit in max_triangles"""
+    # About two triangles per boundary voxel face at step 1, falling with the square of the step
+    expected = 2 * boundary_faces(brain_mask)
+    return int(min(MAX_MESH_STEP_SIZE, max(1, math.ceil(math.sqrt(expected / max_triangles)))))
+
+
+def generate_mesh_from_volume(volume, brain_mask, policy: MeshingPolicy = None, spacing=(1.0, 1.0, 1.0), timings=None):
     """
     Generate 3D mesh from volume using marching cubes algorithm
-    """
-    # Downsample if volume is too large (for performance)
-    max_dim = 128
-    if max(volume.shape) > max_dim:
-        scale_factors = [min(max_dim / s, 1.0) for s in volume.shape]
-        volume = zoom(volume, scale_factors, order=1)
-        brain_mask = zoom(brain_mask.astype(float), scale_factors, order=0) > 0.5
 
-    print(f"Processing volume of shape: {volume.shape}")
+    Vertices are in millimetres (voxel spacing applied), centred on the origin.
+    The policy sets a triangle budget (by mode, or max_triangles) and the
+    marching cubes step is chosen to fit it, unless the policy fixes one;
+    preview and full meshes differ only in that budget.
+    Returns (MeshData, MeshingInfo); the info is None for the fallback mesh.
+    """
+    policy = policy or MeshingPolicy()
+    timings = {} if timings is None else timings
+    max_triangles = policy.max_triangles or MESH_TRIANGLE_BUDGETS[policy.mode]
+    logger.debug(f"Processing volume of shape: {volume.shape}")
 
-    # Apply marching cubes to generate mesh
+    # Apply marching cubes to generate mesh, at full resolution, slab by slab
     try:
-        verts, faces, normals, values = measure.marching_cubes(
-            brain_mask.astype(float),
-            level=0.5,
-            step_size=1,
-            allow_degenerate=False
-        )
+        with _timed(timings, "mesh"):
+            step_size = policy.step_size or choose_step_size(brain_mask, max_triangles)
+            while True:
+                surface = marching_cubes(
+                    brain_mask,
+                    level=0.5,
+                    spacing=spacing,
+                    step_size=step_size,
+                    allow_degenerate=False
+                )
+                if surface is None:
+                    raise ValueError("no surface at level 0.5")
+                # The estimate is close; one coarser step covers the rare overshoot
+                if policy.step_size or len(surface[1]) <= max_triangles or step_size >= MAX_MESH_STEP_SIZE:
+                    break
+                step_size += 1
+        verts, faces, normals, values = surface
     except Exception as e:
-        print(f"Marching cubes error: {e}")
+        logger.error(f"Marching cubes error: {e}")
         # Fallback to generating a simple mesh
-        return generate_mock_brain_mesh("fallback")
+        return generate_mock_brain_mesh("fallback"), None
 
-    print(f"Generated mesh: {len(verts)} vertices, {len(faces)} faces")
+    logger.info(f"Generated mesh: {len(verts)} vertices, {len(faces)} faces (step {step_size})")
 
-    # Scale vertices to reasonable size and center
+    # Center, keeping millimetre units
     verts = verts - verts.mean(axis=0)
-    scale = 10.0 / max(verts.max(axis=0) - verts.min(axis=0))
-    verts = verts * scale
-
-    # Simplify mesh if too many vertices (for performance)
-    if len(verts) > target_vertices:
-        # Simple decimation by sampling
-        step = len(verts) // target_vertices
-        indices = np.arange(0, len(verts), step)[:target_vertices]
-
-        # Create mapping from old to new indices
-        index_map = {old_idx: new_idx for new_idx, old_idx in enumerate(indices)}
-        verts = verts[indices]
-
-        # Update faces with new indices
-        new_faces = []
-        for face in faces:
-            if all(v in index_map for v in face):
-                new_face = [index_map[v] for v in face]
-                new_faces.append(new_face)
-        faces = np.array(new_faces) if new_faces else faces
 
     # Generate labels and colors based on position and intensity
-    labels = generate_tissue_labels(verts, volume, brain_mask)
-    colors = assign_colors_by_label(labels)
-
-    # Convert to lists for JSON serialization
-    vertices_list = verts.tolist()
-    faces_list = faces.tolist()
-    labels_list = labels.tolist()
-    colors_list = colors.tolist()
+    with _timed(timings, "labels"):
+        labels = generate_tissue_labels(verts, volume, brain_mask)
+        colors = assign_colors_by_label(labels)
+
+    # Arrays stay as they are; FastJSONResponse encodes them without a list round trip
+    with _timed(timings, "pack"):
+        mesh_data = MeshData.model_construct(
+            vertices=np.ascontiguousarray(verts),
+            faces=np.ascontiguousarray(faces),
+            labels=labels,
+            colors=colors
+        )
 
-    return MeshData(
-        vertices=vertices_list,
-        faces=faces_list,
-        labels=labels_list,
-        colors=colors_list
+    info = MeshingInfo(
+        mode=policy.mode,
+        step_size=step_size,
+        vertices=len(verts),
+        triangles=len(faces),
+        spacing=[float(s) for s in spacing],
+        timings=timings
     )
+    return mesh_data, info
 
 
 def generate_tissue_labels(vertices, volume, brain_mask):
     """
     Assign tissue type labels based on position and intensity
     """
-    labels = np.zeros(len(vertices), dtype=int)
+    vertices = np.asarray(vertices)
 
     # Normalize vertex positions to volume coordinates
-    verts_norm = vertices.copy()
-    verts_norm = verts_norm - verts_norm.min(axis=0)
+    verts_norm = vertices - vertices.min(axis=0)
     verts_norm = verts_norm / (verts_norm.max(axis=0) + 1e-8)
 
-    # Sample volume at vertex positions
-    for i, v in enumerate(verts_norm):
-        # Map to volume coordinates
-        z = int(v[0] * (volume.shape[0] - 1))
-        y = int(v[1] * (volume.shape[1] - 1))
-        x = int(v[2] * (volume.shape[2] - 1))
-
-        # Clamp to valid range
-        z = np.clip(z, 0, volume.shape[0] - 1)
-        y = np.clip(y, 0, volume.shape[1] - 1)
-        x = np.clip(x, 0, volume.shape[2] - 1)
-
-        # Get intensity value
-        intensity = volume[z, y, x]
-
-        # Assign label based on intensity (simple segmentation)
-        # In production, use trained neural network
-        if intensity > 0.7:
-            labels[i] = 1  # White matter (high intensity)
-        elif intensity > 0.4:
-            labels[i] = 2  # Grey matter (medium intensity)
-        elif intensity > 0.2:
-            # Check if in specific region for tumor (simplified)
-            if vertices[i][0] > 0 and vertices[i][1] > 0 and vertices[i][2] > 0:
-                labels[i] = 3  # Tumor (simulated)
-            else:
-                labels[i] = 2  # Grey matter
-        else:
-            labels[i] = 0  # Skull/CSF (low intensity)
+    # Map to volume coordinates, clamped to the valid range
+    shape = np.array(volume.shape[:3])
+    coords = np.clip((verts_norm * (shape - 1)).astype(np.int64), 0, shape - 1)
 
-    return labels
+    # Sample volume at vertex positions
+    intensity = np.asarray(volume[coords[:, 0], coords[:, 1], coords[:, 2]])
+
+    # Assign label based on intensity (simple segmentation)
+    # In production, use trained neural network
+    # Tumor (simulated) in the positive octant, grey matter elsewhere
+    low_band = np.where((vertices > 0).all(axis=1), 3, 2)
+    return np.select(
+        [intensity > 0.7, intensity > 0.4, intensity > 0.2],
+        [1, 2, low_band],  # White matter (high intensity), grey matter (medium)
+        default=0          # Skull/CSF (low intensity)
+    )
 
 
 def assign_colors_by_label(labels):
     """
     Assign colors based on tissue labels
     """
-    color_map = {
-        0: [0.9, 0.9, 0.9],    # Skull/CSF - light grey
-        1: [1.0, 0.95, 0.9],   # White matter - off-white
-        2: [0.7, 0.7, 0.75],   # Grey matter - grey
-        3: [0.9, 0.2, 0.2]     # Tumor - red
-    }
-
-    colors = np.array([color_map[label] for label in labels])
+    color_map = np.array([
+        [0.9, 0.9, 0.9],    # Skull/CSF - light grey
+        [1.0, 0.95, 0.9],   # White matter - off-white
+        [0.7, 0.7, 0.75],   # Grey matter - grey
+        [0.9, 0.2, 0.2]     # Tumor - red
+    ])
+
+    colors = color_map[np.asarray(labels, dtype=np.int64)]
     return colors
 
 
@@ -306,7 +431,7 @@ def load_2d_image_as_volume(case_dir):
     if not image_files:
         return None
 
-    print(f"Loading 2D image: {image_files[0]}")
+    logger.info(f"Loading 2D image: {image_files[0]}")
 
     # Load image
     img = Image.open(image_files[0]).convert('L')  # Convert to grayscale
@@ -315,7 +440,7 @@ def load_2d_image_as_volume(case_dir):
     # Normalize to 0-1
     img_array = (img_array - img_array.min()) / (img_array.max() - img_array.min() + 1e-8)
 
-    print(f"Image shape: {img_array.shape}")
+    logger.debug(f"Image shape: {img_array.shape}")
 
     # Create 3D volume by extruding the 2D image
     # This simulates depth by replicating the slice
@@ -332,45 +457,54 @@ def load_2d_image_as_volume(case_dir):
 
     volume = np.stack(volume_slices, axis=0)
 
-    print(f"Created 3D volume from 2D image, shape: {volume.shape}")
-    print(f"Volume range: [{volume.min()}, {volume.max()}]")
+    logger.info(f"Created 3D volume from 2D image, shape: {volume.shape}")
+    if logger.isEnabledFor(logging.DEBUG):  # A full pass over the volume
+        logger.debug(f"Volume range: [{volume.min()}, {volume.max()}]")
 
     return volume
 
 
-def process_dicom_to_mesh(case_id: str):
+def process_dicom_to_mesh(case_id: str, policy: MeshingPolicy = None):
     """
     Main function to process medical imaging data and generate 3D mesh
     Supports:
     - Multiple DICOM slices (.dcm) - stacks into 3D volume
     - Single 2D images (PNG/JPG) - extrudes to create 3D volume
+    Returns (MeshData, MeshingInfo); the info is None for mock meshes.
     """
-    upload_dir = "uploads"
-    case_dir = os.path.join(upload_dir, case_id)
+    case_dir = data_path("uploads", case_id)
 
     # Check if case directory exists
     if not os.path.exists(case_dir):
-        print(f"Case directory not found: {case_dir}, using mock data")
-        return generate_mock_brain_mesh(case_id)
+        logger.warning(f"Case directory not found: {case_dir}, using mock data")
+        return generate_mock_brain_mesh(case_id), None
 
-    # Try to load DICOM volume first
-    volume = load_dicom_volume(case_dir)
+    # Try to load DICOM volume first, decoded once and then memory-mapped from the cache
+    def decode_dicom():
+        volume, spacing = load_dicom_volume(case_dir)
+        return None if volume is None else (volume, {"spacing": list(spacing)})
 
-    # If no DICOM, try 2D image
-    if volume is None:
-        print("No DICOM files found, trying 2D image...")
-        volume = load_2d_image_as_volume(case_dir)
+    timings = {}
+    with _timed(timings, "load"):
+        cached = cached_volume(os.path.join(case_dir, CACHE_DIR_NAME), "dicom", case_dir, decode_dicom)
+        volume, spacing = (cached[0], cached[1]["spacing"]) if cached is not None else (None, None)
+
+        # If no DICOM, try 2D image (1 mm pixels, as nothing says otherwise)
+        if volume is None:
+            logger.warning("No DICOM files found, trying 2D image...")
+            volume, spacing = load_2d_image_as_volume(case_dir), (1.0, 1.0, 1.0)
 
     # If still no data, use mock
     if volume is None:
-        print("No valid image data found, using mock data")
-        return generate_mock_brain_mesh(case_id)
+        logger.warning("No valid image data found, using mock data")
+        return generate_mock_brain_mesh(case_id), None
 
     # Segment brain tissue
-    brain_mask, volume_norm = segment_brain_tissue(volume)
+    with _timed(timings, "segment"):
+        brain_mask, volume_norm = segment_brain_tissue(volume)
 
     # Generate mesh from volume
-    mesh_data = generate_mesh_from_volume(volume_norm, brain_mask)
+    mesh_data, info = generate_mesh_from_volume(volume_norm, brain_mask, policy, spacing, timings)
 
-    print(f"Successfully generated 3D mesh from medical imaging data")
-    return mesh_data
+    logger.info(f"Successfully generated 3D mesh from medical imaging data")
+    return mesh_data, info
@@ -0,0 +1,69 @@
+"""
+Fast JSON responses for the mesh-heavy endpoints.
+
+Segmentation and simulation responses carry meshes with hundreds of
+thousands of coordinates. Going through response_model means FastAPI
+validates every float and then encodes the whole tree with the stdlib
+encoder, which costs far more than building the mesh.
+
+The services build these responses with Model.model_construct() around
+NumPy arrays instead; the data is produced by our own code and already
+has the right shape and types, so there is nothing to validate.
+FastJSONResponse encodes them with orjson: arrays go straight from their
+buffers, and pydantic models are walked field by field. The routes keep
+response_model, so the OpenAPI schema still describes the payload.
+
+Encoding is timed as the "serialize" stage (stage histograms in /metrics)
+and reported in a Server-Timing header.
+"""
+import time
+from typing import Any, Mapping, Optional
+
+import numpy as np
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from starlette.background import BackgroundTask
+
+from app.services.tracing import span
+
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        # Shallow; nested models and arrays come back through here or orjson
+        return dict(obj)
+    if isinstance(obj, np.ndarray):
+        # orjson takes C-contiguous arrays of common dtypes; anything else goes as lists
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson; accepts models, dicts and NumPy arrays"""
+
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+        background: Optional[BackgroundTask] = None
+    ):
+        self._serialize_ms = 0.0
+        super().__init__(content, status_code, headers, media_type, background)
+        self.raw_headers.append((b"server-timing", f"serialize;dur={self._serialize_ms:.1f}".encode()))
+
+    def render(self, content: Any) -> bytes:
+        start = time.perf_counter()
+        with span("serialize"):
+            body = dumps(content)
+        self._serialize_ms = (time.perf_counter() - start) * 1000
+        return body
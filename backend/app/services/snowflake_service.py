@@ -1,19 +1,47 @@
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from fastapi.concurrency import run_in_threadpool
 from app.models.schemas import SnowflakeSimulationData
+from app.services.case_store import get_case_store
+from app.services.tracing import span
+from app.services.write_buffer import get_write_buffer
 import json
 
-# Mock database for demo (replace with actual Snowflake connector in production)
-# In production, use: import snowflake.connector
-
-# In-memory storage for demo
-mock_database = []
+# Cases are kept in a local embedded store (see case_store.py).
+# In production, the Snowflake connector can be plugged in as another backend.
+
+# Sample cases shown until the store has a match for the requested location
+DEMO_CASES = [
+    {
+        "case_id": "demo-001",
+        "tumor_location": "right_frontal_lobe",
+        "tumor_volume": 7.8,
+        "max_displacement": 4.2,
+        "avg_stress": 1.15
+    },
+    {
+        "case_id": "demo-002",
+        "tumor_location": "right_frontal_lobe",
+        "tumor_volume": 9.1,
+        "max_displacement": 5.1,
+        "avg_stress": 1.42
+    },
+    {
+        "case_id": "demo-003",
+        "tumor_location": "frontal_lobe",
+        "tumor_volume": 6.5,
+        "max_displacement": 3.8,
+        "avg_stress": 0.98
+    }
+]
 
 
 async def save_simulation(data: SnowflakeSimulationData) -> Dict[str, Any]:
     """
     Save simulation data to Snowflake
-    (Currently using mock storage for demo)
+    (Currently using the local case store)
+    The row is journaled and queued, then written in a batch by the
+    write-behind buffer, so it shows up in queries after the next flush.
     """
     # In production, use Snowflake connector:
     """
@@ -44,25 +72,31 @@ async def save_simulation(data: SnowflakeSimulationData) -> Dict[str, Any]:
     conn.close()
     """
 
-    # Mock implementation
-    mock_database.append({
-        "case_id": data.case_id,
-        "timestamp": data.timestamp.isoformat(),
-        "tumor_location": data.tumor_location,
-        "tumor_volume": data.tumor_volume,
-        "max_displacement": data.max_displacement,
-        "avg_stress": data.avg_stress,
-        "affected_regions": data.affected_regions,
-        "simulation_json": data.simulation_json
-    })
+    # submit blocks until the row is fsync'd; keep that off the event loop
+    with span("store.submit"):
+        record_id = await run_in_threadpool(get_write_buffer().submit, data)
+
+    return {"status": "queued", "records_queued": 1, "record_id": record_id}
+
 
-    return {"status": "success", "records_inserted": 1}
+async def get_writer_stats() -> Dict[str, Any]:
+    """
+    Queue depth and flush latency of the write-behind buffer
+    """
+    return get_write_buffer().stats()
 
 
-async def get_similar_cases(tumor_location: str, limit: int = 5) -> List[Dict[str, Any]]:
+async def get_similar_cases(
+    tumor_location: str,
+    limit: int = 5,
+    tumor_volume: Optional[float] = None,
+    max_displacement: Optional[float] = None,
+    avg_stress: Optional[float] = None,
+    affected_regions: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
     """
-    Retrieve similar cases from Snowflake based on tumor location
-    (Currently using mock data for demo)
+    Retrieve the most similar cases by tumor location and simulation outcome
+    (Currently using the local case store's vector index, with demo cases as a fallback)
     """
     # In production, use Snowflake connector:
     """
@@ -83,50 +117,30 @@ async def get_similar_cases(tumor_location: str, limit: int = 5) -> List[Dict[st
     return [dict(zip(['case_id', 'tumor_location', 'tumor_volume', 'max_displacement', 'avg_stress'], row)) for row in results]
     """
 
-    # Mock implementation - generate sample similar cases
-    similar_cases = [
-        {
-            "case_id": "demo-001",
-            "tumor_location": "right_frontal_lobe",
-            "tumor_volume": 7.8,
-            "max_displacement": 4.2,
-            "avg_stress": 1.15
-        },
-        {
-            "case_id": "demo-002",
-            "tumor_location": "right_frontal_lobe",
-            "tumor_volume": 9.1,
-            "max_displacement": 5.1,
-            "avg_stress": 1.42
-        },
-        {
-            "case_id": "demo-003",
-            "tumor_location": "frontal_lobe",
-            "tumor_volume": 6.5,
-            "max_displacement": 3.8,
-            "avg_stress": 0.98
-        }
-    ]
-
-    # Add any matching cases from mock database
-    for case in mock_database:
-        if tumor_location.lower() in case["tumor_location"].lower():
-            similar_cases.append({
-                "case_id": case["case_id"],
-                "tumor_location": case["tumor_location"],
-                "tumor_volume": case["tumor_volume"],
-                "max_displacement": case["max_displacement"],
-                "avg_stress": case["avg_stress"]
-            })
+    # SQLite queries, and on first use the vector index load; keep them off the event loop
+    with span("store.find_similar"):
+        similar_cases = await run_in_threadpool(
+            get_case_store().find_similar,
+            tumor_location,
+            limit,
+            tumor_volume=tumor_volume,
+            max_displacement=max_displacement,
+            avg_stress=avg_stress,
+            affected_regions=affected_regions
+        )
+    if not similar_cases:
+        similar_cases = DEMO_CASES
 
     return similar_cases[:limit]
 
 
-async def get_case_statistics() -> Dict[str, Any]:
+async def get_case_statistics(top_k: int = 5) -> Dict[str, Any]:
     """
-    Get aggregate statistics across all cases
+    Get aggregate statistics across all cases, with the top_k most common locations
     """
-    if not mock_database:
+    with span("store.statistics"):
+        statistics = await run_in_threadpool(get_case_store().statistics, top_k)
+    if statistics is None:
         return {
             "total_cases": 3,
             "avg_displacement": 4.37,
@@ -134,9 +148,4 @@ async def get_case_statistics() -> Dict[str, Any]:
             "common_locations": ["frontal_lobe", "parietal_lobe", "temporal_lobe"]
         }
 
-    return {
-        "total_cases": len(mock_database),
-        "avg_displacement": sum(c["max_displacement"] for c in mock_database) / len(mock_database),
-        "avg_stress": sum(c["avg_stress"] for c in mock_database) / len(mock_database),
-        "common_locations": list(set(c["tumor_location"] for c in mock_database))
-    }
+    return statistics
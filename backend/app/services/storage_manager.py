@@ -0,0 +1,460 @@
+"""
+Disk usage tracking and garbage collection for case data.
+
+A case's data is spread over a few per-case directories (uploads/<case_id>,
+temp_seg/<case_id>, stl/<case_id>) plus, for content-addressed cases, the
+artifacts/<digest> outputs it links to, which may be shared by several
+cases with the same scans. The manager measures each case's footprint and
+evicts whole cases:
+
+1. cases idle for longer than STORAGE_TTL_SECONDS;
+2. cases whose footprint exceeds STORAGE_CASE_QUOTA_BYTES;
+3. the least recently used cases, until the total is under
+   STORAGE_MAX_BYTES.
+
+A case was last used when its directories last changed or when touch()
+was last called for it (reads of its meshes), whichever is later.
+Artifact outputs are deleted with their last linked case. Zero disables
+a limit.
+
+Jobs pin the case and content digest they work on. Pinned cases and
+digests are never evicted, and pin() waits for an eviction of the same
+case that is already under way, so eviction never races a job. Pins only
+cover this process, so cases and digests with a queued or running job in
+the shared job queue are skipped as well: their uploads are still waiting
+for a worker, or are being processed by a worker elsewhere. Pipeline
+intermediates (segmentation volumes and per-region NIfTI files) are
+purged as soon as a job succeeds.
+
+With a remote object store, shared outputs and case links live in the
+bucket rather than on this node's disk, so only the per-case directories
+are tracked here; the bucket's own lifecycle rules expire objects there.
+
+collect() runs every STORAGE_GC_INTERVAL seconds once start() is called.
+usage() and render_metrics() report footprints, pins and eviction counts.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.services.artifact_store import ArtifactStore, get_artifact_store
+from app.services.job_queue import JobQueue, get_job_queue
+from app.services.object_store import data_path
+
+logger = logging.getLogger(__name__)
+
+STORAGE_MAX_BYTES = int(os.getenv("STORAGE_MAX_BYTES", "0"))
+STORAGE_CASE_QUOTA_BYTES = int(os.getenv("STORAGE_CASE_QUOTA_BYTES", "0"))
+STORAGE_TTL_SECONDS = float(os.getenv("STORAGE_TTL_SECONDS", str(7 * 24 * 3600)))
+STORAGE_GC_INTERVAL = float(os.getenv("STORAGE_GC_INTERVAL", "600"))
+STORAGE_PURGE_INTERMEDIATES = os.getenv("STORAGE_PURGE_INTERMEDIATES", "true").lower() not in ("0", "false", "no")
+
+# Per-case directories, by area name
+CASE_AREAS = {
+    "uploads": data_path("uploads"),
+    "temp_seg": data_path("temp_seg"),
+    "stl": data_path("stl"),
+}
+
+
+def _tree_stats(path: str):
+    """(bytes, newest mtime) of everything under path; (0, 0) if it doesn't exist"""
+    total, newest = 0, 0.0
+    try:
+        newest = os.stat(path).st_mtime
+    except OSError:
+        return 0, 0.0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                st = os.stat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            total += st.st_size
+            newest = max(newest, st.st_mtime)
+    return total, newest
+
+
+class Pin:
+    """Keeps cases and digests from being evicted until released"""
+
+    def __init__(self, manager: "StorageManager", keys: List[str]):
+        self._manager = manager
+        self._keys = keys
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._manager._unpin(self._keys)
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """Call fn and release the pin afterwards; for background tasks"""
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class StorageManager:
+    def __init__(
+        self,
+        areas: Dict[str, str] = CASE_AREAS,
+        artifact_store: Optional[ArtifactStore] = None,
+        job_queue: Optional[JobQueue] = None,
+        max_bytes: int = STORAGE_MAX_BYTES,
+        case_quota_bytes: int = STORAGE_CASE_QUOTA_BYTES,
+        ttl_seconds: float = STORAGE_TTL_SECONDS
+    ):
+        self.areas = dict(areas)
+        self.artifact_store = artifact_store or get_artifact_store()
+        self.job_queue = job_queue or get_job_queue()
+        self.max_bytes = max_bytes
+        self.case_quota_bytes = case_quota_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._pins: Counter = Counter()
+        self._evicting: set = set()
+        self._touched: Dict[str, float] = {}
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._evictions = 0
+        self._evicted_bytes = 0
+        self._purged_bytes = 0
+        self._collections = 0
+        self._last_collection: Optional[Dict[str, Any]] = None
+        self._last_usage: Optional[Dict[str, Any]] = None
+
+    # Pins and access
+
+    def pin(self, *keys: Optional[str]) -> Pin:
+        """Pin case IDs and/or content digests (None is ignored)"""
+        keys = [key for key in keys if key]
+        with self._changed:
+            while any(key in self._evicting for key in keys):
+                self._changed.wait()
+            self._pins.update(keys)
+        return Pin(self, keys)
+
+    def _unpin(self, keys: Iterable[str]):
+        with self._lock:
+            self._pins.subtract(keys)
+            self._pins += Counter()  # Drop keys that reached zero
+
+    def is_pinned(self, key: str) -> bool:
+        with self._lock:
+            return self._pins[key] > 0
+
+    def _active_jobs(self) -> set:
+        """Case IDs and digests with a queued or running job, in any process sharing the queue"""
+        keys = set()
+        for case_id, digest in self.job_queue.active_cases().items():
+            keys.add(case_id)
+            if digest:
+                keys.add(digest)
+        return keys
+
+    def touch(self, case_id: str):
+        """Record a use of the case, for LRU and TTL"""
+        with self._lock:
+            self._touched[case_id] = time.time()
+
+    # Footprints
+
+    def _local_digest(self, case_id: str) -> Optional[str]:
+        """The case's digest, if its outputs are on this node's disk"""
+        if self.artifact_store.remote:
+            return None
+        return self.artifact_store.case_digest(case_id)
+
+    def _case_ids(self) -> List[str]:
+        case_ids = set()
+        for base in self.areas.values():
+            try:
+                case_ids.update(entry.name for entry in os.scandir(base) if entry.is_dir())
+            except FileNotFoundError:
+                pass
+        if not self.artifact_store.remote:
+            case_ids.update(self.artifact_store.case_ids())
+        return sorted(case_ids)
+
+    def _scan(self) -> Dict[str, Any]:
+        """Footprint of every case and linked digest"""
+        cases: Dict[str, Dict[str, Any]] = {}
+        links: Dict[str, str] = {}
+        digest_cases: Dict[str, List[str]] = {}
+        for case_id in self._case_ids():
+            areas, last_used = {}, 0.0
+            for area, base in self.areas.items():
+                size, mtime = _tree_stats(os.path.join(base, case_id))
+                if mtime:
+                    areas[area] = size
+                    last_used = max(last_used, mtime)
+            digest = self._local_digest(case_id)
+            if digest:
+                links[case_id] = digest
+                digest_cases.setdefault(digest, []).append(case_id)
+                last_used = max(last_used, _tree_stats(self.artifact_store.case_link_path(case_id))[1])
+            with self._lock:
+                last_used = max(last_used, self._touched.get(case_id, 0.0))
+            cases[case_id] = {"areas": areas, "digest": digest, "last_used": last_used}
+
+        digests: Dict[str, Dict[str, Any]] = {}
+        for digest, linked in digest_cases.items():
+            size, mtime = _tree_stats(self.artifact_store.artifact_dir(digest))
+            digests[digest] = {"bytes": size, "cases": linked}
+            for case_id in linked:
+                cases[case_id]["last_used"] = max(cases[case_id]["last_used"], mtime)
+
+        for info in cases.values():
+            own = sum(info["areas"].values())
+            shared = digests[info["digest"]]["bytes"] if info["digest"] in digests else 0
+            info["bytes"] = own + shared
+            info["artifact_bytes"] = shared
+        return {"cases": cases, "digests": digests, "links": links}
+
+    def case_footprint(self, case_id: str) -> Optional[Dict[str, Any]]:
+        case = self._scan()["cases"].get(case_id)
+        if case is None:
+            return None
+        return {"case_id": case_id, "pinned": self.is_pinned(case_id), **case}
+
+    def usage(self) -> Dict[str, Any]:
+        """Totals per area, case counts and GC statistics (rescans the disk)"""
+        scan = self._scan()
+        areas = {area: 0 for area in self.areas}
+        for case in scan["cases"].values():
+            for area, size in case["areas"].items():
+                areas[area] += size
+        areas["artifacts"] = sum(digest["bytes"] for digest in scan["digests"].values())
+        with self._lock:
+            pinned = sorted(self._pins)
+            usage = {
+                "total_bytes": sum(areas.values()),
+                "areas": areas,
+                "cases": len(scan["cases"]),
+                "digests": len(scan["digests"]),
+                "pinned": pinned,
+                "limits": {
+                    "max_bytes": self.max_bytes,
+                    "case_quota_bytes": self.case_quota_bytes,
+                    "ttl_seconds": self.ttl_seconds
+                },
+                "evictions": self._evictions,
+                "evicted_bytes": self._evicted_bytes,
+                "purged_bytes": self._purged_bytes,
+                "collections": self._collections,
+                "last_collection": self._last_collection
+            }
+            self._last_usage = usage
+        return usage
+
+    # Eviction
+
+    def _choose_victims(self, scan: Dict[str, Any], now: float) -> List[tuple]:
+        """(case_id, reason) pairs in eviction order, pinned cases and cases with active jobs excluded"""
+        cases = scan["cases"]
+        digests = scan["digests"]
+        active = self._active_jobs()
+        with self._lock:
+            evictable = {
+                case_id for case_id, case in cases.items()
+                if not self._pins[case_id] and not (case["digest"] and self._pins[case["digest"]])
+                and case_id not in active and case["digest"] not in active
+            }
+
+        victims = []
+        chosen = set()
+
+        def choose(case_id, reason):
+            victims.append((case_id, reason))
+            chosen.add(case_id)
+
+        for case_id in sorted(evictable, key=lambda c: cases[c]["last_used"]):
+            if self.ttl_seconds and now - cases[case_id]["last_used"] > self.ttl_seconds:
+                choose(case_id, "ttl")
+        if self.case_quota_bytes:
+            for case_id in sorted(evictable - chosen, key=lambda c: -cases[c]["bytes"]):
+                if cases[case_id]["bytes"] > self.case_quota_bytes:
+                    choose(case_id, "quota")
+        if self.max_bytes:
+            # Shared outputs are only freed with the last case linking to them
+            remaining_links = {digest: set(info["cases"]) for digest, info in digests.items()}
+            total = sum(sum(case["areas"].values()) for case in cases.values())
+            total += sum(info["bytes"] for info in digests.values())
+
+            def freed(case_id):
+                case = cases[case_id]
+                size = sum(case["areas"].values())
+                links = remaining_links.get(case["digest"])
+                if links is not None:
+                    links.discard(case_id)
+                    if not links:
+                        size += digests[case["digest"]]["bytes"]
+                return size
+
+            for case_id, _ in victims:
+                total -= freed(case_id)
+            for case_id in sorted(evictable - chosen, key=lambda c: cases[c]["last_used"]):
+                if total <= self.max_bytes:
+                    break
+                total -= freed(case_id)
+                choose(case_id, "lru")
+        return victims
+
+    def collect(self) -> Dict[str, Any]:
+        """Run one garbage collection pass; returns what was evicted"""
+        start = time.time()
+        scan = self._scan()
+        evicted = []
+        for case_id, reason in self._choose_victims(scan, start):
+            case = scan["cases"][case_id]
+            freed = self.evict(case_id, case["digest"], scan["links"])
+            if freed is not None:
+                evicted.append({"case_id": case_id, "reason": reason, "bytes": freed})
+                logger.info(f"Evicted case {case_id} ({reason}, {freed} bytes)")
+
+        result = {
+            "started": start,
+            "duration": round(time.time() - start, 3),
+            "evicted": evicted,
+            "freed_bytes": sum(e["bytes"] for e in evicted)
+        }
+        with self._lock:
+            self._collections += 1
+            self._last_collection = result
+        return result
+
+    def evict(self, case_id: str, digest: Optional[str] = None, links: Optional[Dict[str, str]] = None) -> Optional[int]:
+        """
+        Delete a case's data, and its digest's outputs if no other case links
+        to them. links is a case -> digest map from this GC pass's scan, so
+        only links written since are read. Returns the bytes freed, or None
+        if the case is pinned or has a queued or running job.
+        """
+        digest = digest or self._local_digest(case_id)
+        active = self._active_jobs()
+        if case_id in active or (digest and digest in active):
+            return None
+        with self._lock:
+            if self._pins[case_id] or case_id in self._evicting or (digest and self._pins[digest]):
+                return None
+            keys = [case_id] + ([digest] if digest else [])
+            self._evicting.update(keys)
+        try:
+            freed = 0
+            for base in self.areas.values():
+                freed += self._remove(os.path.join(base, case_id))
+            if digest:
+                self.artifact_store.unlink_case(case_id)
+                # Held by a re-upload between its lookup and link, in any process
+                with self.artifact_store.build_lock(digest):
+                    if not self.artifact_store.linked_cases(digest, links):
+                        freed += self._remove(self.artifact_store.artifact_dir(digest))
+        finally:
+            with self._changed:
+                self._evicting.difference_update(keys)
+                self._touched.pop(case_id, None)
+                self._changed.notify_all()
+        with self._lock:
+            self._evictions += 1
+            self._evicted_bytes += freed
+        return freed
+
+    def purge_intermediates(self, path: str) -> int:
+        """Delete a finished job's intermediate files; returns the bytes freed"""
+        if not STORAGE_PURGE_INTERMEDIATES:
+            return 0
+        freed = self._remove(path)
+        with self._lock:
+            self._purged_bytes += freed
+        return freed
+
+    @staticmethod
+    def _remove(path: str) -> int:
+        size, mtime = _tree_stats(path)
+        if not mtime:
+            return 0
+        shutil.rmtree(path, ignore_errors=True)
+        return size
+
+    # Background collection
+
+    def start(self, interval: float = STORAGE_GC_INTERVAL):
+        if self._thread is not None or interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="storage-gc", daemon=True)
+        self._thread.start()
+
+    def _run(self, interval: float):
+        while True:
+            try:
+                self.collect()
+                self.usage()
+            except Exception as e:
+                logger.error(f"Storage collection failed: {e}")
+            if self._stop.wait(interval):
+                return
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # Metrics
+
+    def render_metrics(self) -> List[str]:
+        """Prometheus gauges and counters; sizes come from the last usage() scan"""
+        with self._lock:
+            usage = self._last_usage
+            lines = [
+                "# HELP storage_evictions_total Cases evicted by the storage manager",
+                "# TYPE storage_evictions_total counter",
+                f"storage_evictions_total {self._evictions}",
+                "# HELP storage_evicted_bytes_total Bytes freed by evicting cases",
+                "# TYPE storage_evicted_bytes_total counter",
+                f"storage_evicted_bytes_total {self._evicted_bytes}",
+                "# HELP storage_purged_bytes_total Bytes of job intermediates purged after success",
+                "# TYPE storage_purged_bytes_total counter",
+                f"storage_purged_bytes_total {self._purged_bytes}",
+                "# HELP storage_pinned Cases and digests currently pinned by jobs",
+                "# TYPE storage_pinned gauge",
+                f"storage_pinned {len(self._pins)}",
+            ]
+        if usage is not None:
+            lines += ["# HELP storage_bytes Bytes on disk per storage area", "# TYPE storage_bytes gauge"]
+            lines += [f'storage_bytes{{area="{area}"}} {size}' for area, size in usage["areas"].items()]
+            lines += ["# HELP storage_cases Cases with data on disk", "# TYPE storage_cases gauge"]
+            lines.append(f"storage_cases {usage['cases']}")
+        return lines
+
+
+_manager: Optional[StorageManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_storage_manager() -> StorageManager:
+    """Return the process-wide storage manager"""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = StorageManager()
+    return _manager
+
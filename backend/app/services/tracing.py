@@ -0,0 +1,204 @@
+"""
+Request tracing and latency metrics.
+
+TracingMiddleware gives every HTTP request an ID (the caller's X-Request-ID,
+or a fresh one), returns it in the X-Request-ID response header, tags every
+log line written while handling the request with it, and records the
+request's latency per route template. span("name") times a block of work
+(or, as a decorator, a function); spans nest, so their log lines show the
+path from the outermost span, and each span's duration also goes to a
+per-stage histogram. render_metrics() renders all histograms in the
+Prometheus text format for a /metrics endpoint.
+
+Recording costs two perf_counter calls and one locked bucket increment, so
+it stays on in production. TRACING_ENABLED=false turns spans into no-ops;
+request IDs and route latencies are kept either way.
+"""
+import bisect
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() not in ("0", "false", "no")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+REQUEST_ID_HEADER = "x-request-id"
+
+# Seconds; wide enough for a 1 ms store call and a multi-minute SynthSeg run
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0
+)
+
+logger = logging.getLogger(__name__)
+
+_request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+_span_path: contextvars.ContextVar[Tuple[str, ...]] = contextvars.ContextVar("span_path", default=())
+
+
+class Histogram:
+    """A Prometheus-style histogram with one series per label combination"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in snapshot:
+            pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = ",".join(pairs + [f'le="{le}"'])
+                lines.append(f"{self.name}_bucket{{{bucket_labels}}} {cumulative}")
+            label_text = "{" + ",".join(pairs) + "}" if pairs else ""
+            lines.append(f"{self.name}_sum{label_text} {series[-1]}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response",
+    ("method", "route", "status")
+)
+STAGE_LATENCY = Histogram(
+    "pipeline_stage_duration_seconds",
+    "Duration of traced spans (pipeline stages, LLM and store calls)",
+    ("stage",)
+)
+
+
+def current_request_id() -> str:
+    return _request_id.get()
+
+
+@contextmanager
+def span(name: str):
+    """Time a block of work as a stage; usable as a decorator on sync functions"""
+    if not TRACING_ENABLED:
+        yield
+        return
+    path = _span_path.get() + (name,)
+    token = _span_path.set(path)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _span_path.reset(token)
+        STAGE_LATENCY.observe(elapsed, name)
+        logger.debug("span %s took %.1f ms", "/".join(path), elapsed * 1000)
+
+
+def render_metrics() -> str:
+    """All histograms in the Prometheus text exposition format"""
+    lines = REQUEST_LATENCY.render() + STAGE_LATENCY.render()
+    return "\n".join(lines) + "\n"
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware assigning request IDs and recording per-route latency.
+    Latency stops at the last response byte, so background tasks that run
+    after the response don't count towards it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _incoming_request_id(scope) or uuid.uuid4().hex
+        token = _request_id.set(request_id)
+        start = time.perf_counter()
+        status = 500
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            if not recorded:
+                recorded = True
+                REQUEST_LATENCY.observe(time.perf_counter() - start, scope["method"], _route_template(scope), str(status))
+
+        async def send_traced(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", [])) + [(REQUEST_ID_HEADER.encode(), request_id.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            record()
+            _request_id.reset(token)
+
+
+def _route_template(scope) -> str:
+    """Path template of the matched route, e.g. /api/stl/{case_id}; "unmatched" for 404s"""
+    # Recent FastAPI keeps included routers whole; the full template is on the effective route
+    context = (scope.get("fastapi") or {}).get("effective_route_context")
+    path = getattr(context, "path", None) or getattr(scope.get("route"), "path", None)
+    return path or "unmatched"
+
+
+def _incoming_request_id(scope) -> str:
+    """The caller's X-Request-ID, if it is a reasonable token"""
+    for name, value in scope.get("headers", []):
+        if name == REQUEST_ID_HEADER.encode():
+            value = value.decode("latin-1").strip()
+            if 0 < len(value) <= 128 and value.isprintable():
+                return value
+    return ""
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+def configure_logging():
+    """Log to stderr with the current request ID on every line (idempotent)"""
+    root = logging.getLogger()
+    if any(getattr(handler, "_tracing", False) for handler in root.handlers):
+        return
+    handler = logging.StreamHandler()
+    handler._tracing = True
+    handler.addFilter(_RequestIdFilter())
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
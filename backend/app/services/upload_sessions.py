@@ -0,0 +1,233 @@
+"""
+Resumable upload sessions, in the style of the tus protocol.
+
+A client creates a session by declaring the files (name and size) it is
+about to send and gets back a case_id. Each file is then sent as any number
+of PUT requests carrying the byte offset they start at. Bytes are appended
+straight to the file in the case directory, so after a dropped connection
+the client asks for the current offsets and carries on from there rather
+than starting over. Finalizing checks every file is complete and hands the
+case to the normal post-upload pipeline.
+
+Session state is a small JSON file in the case directory; a file's offset
+is simply its size on disk, so progress survives restarts. Appends to a
+file are serialized by a FileLock next to it, so workers in different
+processes can't both append at the same offset.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List
+
+import aiofiles
+
+from app.services.file_lock import FileLock
+from app.services.upload_stream import MAX_UPLOAD_FILE_BYTES, MAX_UPLOAD_TOTAL_BYTES, UPLOAD_CHUNK_SIZE, UploadTooLarge
+
+SESSION_FILE = ".upload.json"
+
+
+class UploadSessionNotFound(Exception):
+    pass
+
+
+class UploadOffsetMismatch(Exception):
+    """A chunk's offset doesn't match the bytes already received"""
+
+    def __init__(self, filename: str, expected: int, received: int):
+        super().__init__(f"{filename}: expected offset {expected}, got {received}")
+        self.filename = filename
+        self.expected = expected
+        self.received = received
+
+
+class UploadBusy(UploadOffsetMismatch):
+    """Another request is still appending to the file"""
+
+    def __init__(self, filename: str, current: int, received: int):
+        Exception.__init__(self, f"{filename}: another request is writing this file (at offset {current})")
+        self.filename = filename
+        self.expected = current
+        self.received = received
+
+
+class UploadIncomplete(Exception):
+    pass
+
+
+def _session_path(case_dir: str) -> str:
+    return os.path.join(case_dir, SESSION_FILE)
+
+
+def _file_lock(path: str) -> FileLock:
+    # Dot-prefixed, so it can't clash with a declared file or match the scan globs
+    directory, name = os.path.split(path)
+    return FileLock(os.path.join(directory, f".{name}.lock"))
+
+
+def _write_session(case_dir: str, session: Dict[str, Any]):
+    tmp_path = _session_path(case_dir) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(session, f)
+    os.replace(tmp_path, _session_path(case_dir))
+
+
+def create_session(upload_dir: str, files: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Start a session for the given files, each {"filename", "size", "sha256"?}.
+    Raises ValueError for bad names and UploadTooLarge for oversized files.
+    """
+    names = [f["filename"] for f in files]
+    if not names or len(set(names)) != len(names):
+        raise ValueError("Declare at least one file, with unique filenames")
+    for f in files:
+        if os.path.basename(f["filename"]) != f["filename"] or f["filename"].startswith("."):
+            raise ValueError(f"Invalid filename: {f['filename']}")
+        if f["size"] < 0:
+            raise ValueError(f"Invalid size for {f['filename']}")
+        if f["size"] > MAX_UPLOAD_FILE_BYTES:
+            raise UploadTooLarge(f["filename"], MAX_UPLOAD_FILE_BYTES)
+    if sum(f["size"] for f in files) > MAX_UPLOAD_TOTAL_BYTES:
+        raise UploadTooLarge("upload", MAX_UPLOAD_TOTAL_BYTES)
+
+    case_id = str(uuid.uuid4())
+    case_dir = os.path.join(upload_dir, case_id)
+    os.makedirs(case_dir)
+    for f in files:
+        # Empty placeholders, so offsets can always be read from the file size
+        open(os.path.join(case_dir, f["filename"]), "wb").close()
+
+    session = {
+        "case_id": case_id,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "finalized": False,
+        "files": [
+            {"filename": f["filename"], "size": f["size"], "sha256": f.get("sha256")}
+            for f in files
+        ]
+    }
+    _write_session(case_dir, session)
+    return get_progress(upload_dir, case_id)
+
+
+def load_session(upload_dir: str, case_id: str) -> Dict[str, Any]:
+    try:
+        uuid.UUID(case_id)
+    except ValueError:
+        raise UploadSessionNotFound(case_id)
+    path = _session_path(os.path.join(upload_dir, case_id))
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise UploadSessionNotFound(case_id)
+
+
+def get_progress(upload_dir: str, case_id: str) -> Dict[str, Any]:
+    """Declared size and bytes received so far for every file in the session"""
+    session = load_session(upload_dir, case_id)
+    case_dir = os.path.join(upload_dir, case_id)
+    files = [
+        {"filename": f["filename"], "size": f["size"], "offset": os.path.getsize(os.path.join(case_dir, f["filename"]))}
+        for f in session["files"]
+    ]
+    total = sum(f["size"] for f in files)
+    received = sum(f["offset"] for f in files)
+    return {
+        "case_id": case_id,
+        "finalized": session["finalized"],
+        "complete": received == total,
+        "bytes_total": total,
+        "bytes_received": received,
+        "files": files
+    }
+
+
+async def write_chunk(
+    upload_dir: str,
+    case_id: str,
+    filename: str,
+    offset: int,
+    chunks: AsyncIterator[bytes]
+) -> int:
+    """
+    Append a chunk that starts at `offset` to a session file; returns the new offset.
+    If the connection drops mid-chunk, the bytes that did arrive are kept
+    and the next chunk resumes from there.
+    """
+    session = load_session(upload_dir, case_id)
+    if session["finalized"]:
+        raise ValueError("Upload is already finalized")
+    declared = {f["filename"]: f["size"] for f in session["files"]}
+    if filename not in declared:
+        raise ValueError(f"{filename} is not part of this upload")
+
+    path = os.path.join(upload_dir, case_id, filename)
+    lock = _file_lock(path)
+    if not lock.acquire(blocking=False):
+        # Whatever the other request appends makes this offset stale anyway
+        raise UploadBusy(filename, os.path.getsize(path), offset)
+    try:
+        current = os.path.getsize(path)
+        if offset != current:
+            raise UploadOffsetMismatch(filename, current, offset)
+
+        async with aiofiles.open(path, "ab") as f:
+            async for chunk in chunks:
+                if current + len(chunk) > declared[filename]:
+                    # Drop the overflowing request's bytes; the file stays resumable
+                    await f.truncate(offset)
+                    raise UploadTooLarge(filename, declared[filename])
+                await f.write(chunk)
+                current += len(chunk)
+        return current
+    finally:
+        lock.release()
+
+
+def _sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+async def finalize_session(upload_dir: str, case_id: str) -> List[Dict[str, Any]]:
+    """
+    Check that every file is complete (and matches its declared SHA-256,
+    if one was given), then close the session. Returns filename, size and
+    sha256 for each file. Raises UploadIncomplete otherwise.
+    """
+    session = load_session(upload_dir, case_id)
+    if session["finalized"]:
+        raise ValueError("Upload is already finalized")
+    progress = get_progress(upload_dir, case_id)
+    if not progress["complete"]:
+        raise UploadIncomplete(
+            f"Received {progress['bytes_received']} of {progress['bytes_total']} bytes"
+        )
+
+    case_dir = os.path.join(upload_dir, case_id)
+    files = []
+    for f in session["files"]:
+        sha256 = await asyncio.to_thread(_sha256, os.path.join(case_dir, f["filename"]))
+        if f["sha256"] and f["sha256"].lower() != sha256:
+            raise UploadIncomplete(f"{f['filename']}: SHA-256 does not match the declared value")
+        files.append({"filename": f["filename"], "size": f["size"], "sha256": sha256})
+
+    session["finalized"] = True
+    _write_session(case_dir, session)
+    return files
+
+
+def abort_session(upload_dir: str, case_id: str):
+    """Discard an unfinished upload and everything received for it"""
+    session = load_session(upload_dir, case_id)
+    if session["finalized"]:
+        raise ValueError("Upload is already finalized")
+    shutil.rmtree(os.path.join(upload_dir, case_id), ignore_errors=True)
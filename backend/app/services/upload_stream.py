@@ -0,0 +1,61 @@
+"""
+Chunked copy of uploaded scans to disk.
+
+Uploads are copied in fixed-size chunks rather than read whole, so memory
+per upload stays around one chunk however large the scan is. Size limits
+are enforced as bytes arrive, and each file's SHA-256 is computed on the
+way through.
+"""
+import hashlib
+import os
+
+import aiofiles
+from fastapi import UploadFile
+
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(2 * 1024 ** 3)))
+MAX_UPLOAD_TOTAL_BYTES = int(os.getenv("MAX_UPLOAD_TOTAL_BYTES", str(4 * 1024 ** 3)))
+
+
+class UploadTooLarge(Exception):
+    """An upload went over its size limit; the partial file has been removed"""
+
+    def __init__(self, filename: str, limit: int):
+        super().__init__(f"{filename} exceeds the upload limit of {limit} bytes")
+        self.filename = filename
+        self.limit = limit
+
+
+async def stream_to_disk(
+    upload: UploadFile,
+    path: str,
+    max_bytes: int = MAX_UPLOAD_FILE_BYTES,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+):
+    """
+    Copy an upload to `path` chunk by chunk.
+    Returns (bytes_written, sha256_hex). Raises UploadTooLarge, after
+    deleting the partial file, as soon as more than max_bytes arrive.
+    """
+    # Reject early when the client told us the size up front
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge(upload.filename, max_bytes)
+
+    hasher = hashlib.sha256()
+    written = 0
+    try:
+        async with aiofiles.open(path, "wb") as f:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise UploadTooLarge(upload.filename, max_bytes)
+                hasher.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return written, hasher.hexdigest()
@@ -0,0 +1,154 @@
+"""
+On-disk cache of decoded volumes.
+
+Decoding a scan (parsing a DICOM series, gunzipping a .nii.gz) is the
+slowest part of reading it, and several stages read the same scan. The
+first read writes the decoded array as a raw .npy file plus a JSON sidecar
+(spacing, affine, source file stamp). Later reads open the .npy with
+np.load(mmap_mode='r'): no decoding, no copy, and pages are shared through
+the OS page cache between stages and processes.
+
+Cached arrays are read-only memory maps at the volume's native dtype;
+callers that need to modify one must copy it first.
+
+The NIfTI readers here never go through float64: intensities keep their
+stored dtype (or float32 when scaled), label maps use the smallest integer
+dtype that fits, and masks are boolean.
+"""
+import json
+import os
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+CACHE_DIR_NAME = ".volume_cache"
+
+
+def _cache_paths(cache_dir: str, name: str) -> Tuple[str, str]:
+    return os.path.join(cache_dir, f"{name}.npy"), os.path.join(cache_dir, f"{name}.json")
+
+
+def _source_stamp(path: str) -> Dict[str, Any]:
+    """Size and mtime of a source file or directory, to detect changes"""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def write_volume(cache_dir: str, name: str, volume: np.ndarray, meta: Dict[str, Any]) -> np.ndarray:
+    """Write a volume and its metadata, then return it reopened as a memory map"""
+    os.makedirs(cache_dir, exist_ok=True)
+    npy_path, meta_path = _cache_paths(cache_dir, name)
+    tmp_path = npy_path + ".tmp.npy"
+    np.save(tmp_path, np.ascontiguousarray(volume))
+    os.replace(tmp_path, npy_path)
+    meta = dict(meta, shape=list(volume.shape), dtype=str(volume.dtype))
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    # The sidecar goes last: a volume only counts as cached once it exists
+    os.replace(meta_path + ".tmp", meta_path)
+    return np.load(npy_path, mmap_mode="r")
+
+
+def open_volume(cache_dir: str, name: str, source: Optional[str] = None) -> Optional[Tuple[np.ndarray, Dict[str, Any]]]:
+    """
+    Memory-map a cached volume; returns (volume, meta), or None when it isn't
+    cached or `source` has changed since it was written.
+    """
+    npy_path, meta_path = _cache_paths(cache_dir, name)
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if source is not None and meta.get("source") != _source_stamp(source):
+            return None
+        return np.load(npy_path, mmap_mode="r"), meta
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def cached_volume(
+    cache_dir: str,
+    name: str,
+    source: str,
+    decode: Callable[[], Optional[Tuple[np.ndarray, Dict[str, Any]]]]
+) -> Optional[Tuple[np.ndarray, Dict[str, Any]]]:
+    """
+    Return the cached (volume, meta) for `source`, calling decode() and
+    caching its result on a miss. decode() may return None for "no volume".
+    """
+    cached = open_volume(cache_dir, name, source)
+    if cached is not None:
+        return cached
+    # Created before stamping, since it may live inside a source directory
+    os.makedirs(cache_dir, exist_ok=True)
+    decoded = decode()
+    if decoded is None:
+        return None
+    volume, meta = decoded
+    meta = dict(meta, source=_source_stamp(source))
+    return write_volume(cache_dir, name, volume, meta), meta
+
+
+def label_dtype(max_label: int) -> np.dtype:
+    """Smallest unsigned integer dtype that holds labels up to max_label"""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if max_label <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def as_labels(data: np.ndarray) -> np.ndarray:
+    """A label map in the smallest integer dtype; float-stored labels are rounded"""
+    if data.dtype.kind == "f":
+        data = np.rint(data)
+    max_label = int(data.max()) if data.size else 0
+    return data.astype(label_dtype(max_label), copy=False)
+
+
+def _native_data(img) -> np.ndarray:
+    """
+    Voxel data without the float64 upcast of get_fdata(): unscaled images
+    keep their stored dtype, scaled ones are read as float32
+    """
+    if img.dataobj.slope in (None, 1.0) and img.dataobj.inter in (None, 0.0):
+        return np.asanyarray(img.dataobj)
+    return img.get_fdata(dtype=np.float32)
+
+
+def _nifti_cached(path: str, suffix: str, convert: Callable[[np.ndarray], np.ndarray]):
+    import nibabel as nib
+
+    def decode():
+        img = nib.load(path)
+        return convert(_native_data(img)), {
+            "affine": img.affine.tolist(),
+            "spacing": [float(z) for z in img.header.get_zooms()[:3]]
+        }
+
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+    name = os.path.basename(path).split(".nii")[0] + suffix
+    return cached_volume(cache_dir, name, path, decode)
+
+
+def nifti_volume(path: str) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Voxel data of a NIfTI file, through the cache next to it.
+    Unscaled images keep their stored dtype; scaled ones become float32.
+    meta holds "affine" and "spacing" (the first three header zooms).
+    """
+    return _nifti_cached(path, "", lambda data: data)
+
+
+def nifti_labels(path: str) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Like nifti_volume, for a label map: integer labels in the smallest dtype that fits"""
+    return _nifti_cached(path, ".labels", as_labels)
+
+
+def nifti_mask(path: str, level: float = 0.5) -> Tuple[np.ndarray, Tuple[float, float, float]]:
+    """
+    Boolean mask (voxels above `level`) of a NIfTI file, plus its spacing.
+    Not cached: region masks are read once, straight after they're written.
+    """
+    import nibabel as nib
+
+    img = nib.load(path)
+    return _native_data(img) > level, tuple(float(z) for z in img.header.get_zooms()[:3])
@@ -0,0 +1,108 @@
+"""
+Startup warmup and readiness.
+
+The API imports no heavy scientific or LLM libraries at startup; they load
+on first use. Warmup loads them ahead of the first request, in a
+background thread, so the process answers liveness checks (/health) at
+once. Readiness checks should wait until warmup has finished.
+
+Each step is a module name to import or a callable (e.g. building the
+Gemini model). Required steps run first; the process is ready once they
+have all succeeded. Optional steps (features the API can serve without,
+such as the Gemini client) run afterwards and never hold readiness back:
+a failure is logged and reported by status() as a degraded feature. A
+failed step does not stop the rest. WARMUP_ON_STARTUP=false skips warmup;
+the process is then ready immediately and pays the import cost on the
+first request that needs each library.
+"""
+import importlib
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence, Union
+
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() not in ("0", "false", "no")
+
+logger = logging.getLogger(__name__)
+
+Step = Union[str, Callable[[], object]]
+
+
+def _step_name(step: Step) -> str:
+    return step if isinstance(step, str) else f"{step.__module__}.{step.__qualname__}"
+
+
+class Warmup:
+    def __init__(self, steps: Sequence[Step], optional: Sequence[Step] = (), enabled: bool = WARMUP_ON_STARTUP):
+        self.steps = list(steps)
+        self.optional = list(optional)
+        self.enabled = enabled
+        self._required_done = threading.Event()
+        self._done = threading.Event()
+        self._timings: Dict[str, float] = {}
+        self._errors: Dict[str, str] = {}
+        self._optional_errors: Dict[str, str] = {}
+        self._thread: Optional[threading.Thread] = None
+        if not enabled:
+            self._required_done.set()
+            self._done.set()
+
+    def start(self):
+        """Run the steps in a background thread (once)"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def _run_step(self, step: Step, errors: Dict[str, str]):
+        name = _step_name(step)
+        step_start = time.perf_counter()
+        try:
+            if isinstance(step, str):
+                importlib.import_module(step)
+            else:
+                step()
+        except Exception as e:
+            errors[name] = str(e)
+            logger.error(f"Warmup step {name} failed: {e}")
+        self._timings[name] = round(time.perf_counter() - step_start, 3)
+
+    def _run(self):
+        started = time.perf_counter()
+        for step in self.steps:
+            self._run_step(step, self._errors)
+        self._required_done.set()
+        for step in self.optional:
+            self._run_step(step, self._optional_errors)
+        logger.info(f"Warmup finished in {time.perf_counter() - started:.2f}s")
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for every step, optional ones included"""
+        return self._done.wait(timeout)
+
+    @property
+    def ready(self) -> bool:
+        """True once every required step has succeeded"""
+        return self._required_done.is_set() and not self._errors
+
+    def status(self) -> Dict:
+        if not self._required_done.is_set():
+            state = "warming_up"
+        elif self._errors:
+            state = "failed"
+        elif self._optional_errors:
+            state = "degraded"
+        else:
+            state = "ready"
+        return {
+            "status": state,
+            "warmup": {
+                "enabled": self.enabled,
+                "finished": self._done.is_set(),
+                "timings": dict(self._timings),
+                "errors": dict(self._errors),
+                "optional_errors": dict(self._optional_errors)
+            }
+        }
@@ -0,0 +1,377 @@
+"""
+Write-behind buffer for saved simulations.
+
+save_simulation appends each row to a local append-only journal (fsync'd
+before returning, so an acknowledged save survives a crash) and queues it in
+memory. A background thread flushes the queue to the case store in batches,
+either when max_batch rows are waiting or every flush_interval seconds.
+
+Each process journals into its own directory under WRITE_BUFFER_JOURNAL_DIR,
+held with a file lock, so API workers never share a journal. The journal is
+a series of segments: a flush seals the current segment and starts a new
+one, and sealed segments are deleted once every row in them is in the
+store. Concurrent saves share fsyncs (group commit) and the fsync runs
+outside the buffer lock. At startup, journal directories whose owner has
+exited are adopted and their rows replayed. Every row carries a record_id,
+and the store skips record_ids it already has, so replaying a row that was
+flushed just before a crash is harmless.
+
+The queue holds at most max_pending rows; submit raises WriteBufferFull
+beyond that, and the API answers 503 so clients back off.
+"""
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.models.schemas import SnowflakeSimulationData
+from app.services.case_store import get_case_store
+from app.services.file_lock import FileLock
+from app.services.object_store import data_path
+from app.services.tracing import span
+
+logger = logging.getLogger(__name__)
+
+WRITE_BUFFER_JOURNAL_DIR = os.path.abspath(os.getenv("WRITE_BUFFER_JOURNAL_DIR") or data_path("journal"))
+WRITE_BUFFER_MAX_BATCH = int(os.getenv("WRITE_BUFFER_MAX_BATCH", "500"))
+WRITE_BUFFER_FLUSH_INTERVAL = float(os.getenv("WRITE_BUFFER_FLUSH_INTERVAL", "1.0"))
+WRITE_BUFFER_MAX_PENDING = int(os.getenv("WRITE_BUFFER_MAX_PENDING", "10000"))
+# Longest wait between retries while the store keeps failing
+WRITE_BUFFER_MAX_BACKOFF = float(os.getenv("WRITE_BUFFER_MAX_BACKOFF", "30"))
+
+SEGMENT_SUFFIX = ".journal"
+LOCK_SUFFIX = ".lock"
+
+
+class WriteBufferFull(Exception):
+    """Raised by submit when max_pending rows are already waiting to be flushed"""
+    pass
+
+
+def _segment_paths(directory: str) -> List[str]:
+    """Journal segments in a writer directory, oldest first"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name) for name in sorted(names) if name.endswith(SEGMENT_SUFFIX)]
+
+
+def _remove_writer_dir(directory: str, lock: FileLock):
+    """Delete a writer directory and its lock file, then drop the lock"""
+    shutil.rmtree(directory, ignore_errors=True)
+    try:
+        os.remove(lock.path)
+    except FileNotFoundError:
+        pass
+    lock.release()
+
+
+class WriteBehindBuffer:
+    """
+    Batches rows for a sink exposing insert_many(rows, record_ids).
+    Thread-safe; call start() to run the background flusher and close()
+    to drain the queue on shutdown.
+    """
+
+    def __init__(
+        self,
+        sink,
+        journal_dir: str = WRITE_BUFFER_JOURNAL_DIR,
+        max_batch: int = WRITE_BUFFER_MAX_BATCH,
+        flush_interval: float = WRITE_BUFFER_FLUSH_INTERVAL,
+        max_pending: int = WRITE_BUFFER_MAX_PENDING
+    ):
+        self.sink = sink
+        self.journal_dir = journal_dir
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        # Serializes fsyncs and segment rotation; taken before self._lock
+        self._sync_lock = threading.Lock()
+        self._pending: deque = deque()
+        self._closed = False
+        self._thread = None
+
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._consecutive_failures = 0
+        self._rows_flushed = 0
+        self._rejected = 0
+        self._last_flush_latency_ms = None
+        self._max_flush_latency_ms = 0.0
+        self._last_error = None
+
+        # Lock the writer directory before creating it, so other processes never adopt it
+        os.makedirs(journal_dir, exist_ok=True)
+        name = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.writer_dir = os.path.join(journal_dir, name)
+        self._writer_lock = FileLock(self.writer_dir + LOCK_SUFFIX)
+        self._writer_lock.acquire()
+        os.makedirs(self.writer_dir)
+
+        # Writer directories of exited processes, removed once their rows are flushed
+        self._adopted: List[Tuple[str, FileLock]] = []
+        self._adopt_orphans()
+
+        self._sealed: List[str] = []
+        self._segment_number = 0
+        self._segment_rows = 0
+        self._written = 0
+        self._synced = 0
+        self._open_segment()
+
+    def _adopt_orphans(self):
+        """Queue rows journaled by processes that exited before flushing them"""
+        for name in sorted(os.listdir(self.journal_dir)):
+            directory = os.path.join(self.journal_dir, name)
+            if directory == self.writer_dir or not os.path.isdir(directory):
+                continue
+            lock = FileLock(directory + LOCK_SUFFIX)
+            if not lock.acquire(blocking=False):
+                # Its owner is still running
+                continue
+            replayed = 0
+            for path in _segment_paths(directory):
+                try:
+                    f = open(path, encoding="utf-8")
+                except FileNotFoundError:
+                    continue
+                with f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            data = SnowflakeSimulationData.model_validate(entry["data"])
+                        except (ValueError, KeyError):
+                            # A torn final line from a crash mid-append; that save was never acknowledged
+                            continue
+                        self._pending.append((entry["record_id"], data))
+                        replayed += 1
+            self._adopted.append((directory, lock))
+            if replayed:
+                logger.info(f"Replaying {replayed} journaled simulation rows from {name}")
+
+    def _open_segment(self):
+        self._segment_number += 1
+        self._segment_path = os.path.join(self.writer_dir, f"{self._segment_number:06d}{SEGMENT_SUFFIX}")
+        self._segment = open(self._segment_path, "a", encoding="utf-8")
+        self._segment_rows = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="case-write-buffer", daemon=True)
+            self._thread.start()
+
+    def submit(self, data: SnowflakeSimulationData) -> str:
+        """
+        Journal and queue one row; returns its record_id once it is durable.
+        Blocks on fsync, so call it from a worker thread rather than the event loop.
+        """
+        record_id = uuid.uuid4().hex
+        line = json.dumps({"record_id": record_id, "data": data.model_dump(mode="json")}) + "\n"
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Write buffer is closed")
+            if len(self._pending) >= self.max_pending:
+                self._rejected += 1
+                raise WriteBufferFull(f"{len(self._pending)} rows waiting to be written")
+            self._segment.write(line)
+            self._segment_rows += 1
+            self._written += 1
+            sequence = self._written
+            self._pending.append((record_id, data))
+            if len(self._pending) >= self.max_batch:
+                self._wakeup.notify()
+        self._sync(sequence)
+        return record_id
+
+    def _sync(self, sequence: int):
+        """Make journal writes up to sequence durable; one fsync covers every write before it"""
+        with self._sync_lock:
+            if self._synced >= sequence:
+                return
+            with self._lock:
+                written = self._written
+                self._segment.flush()
+                fileno = self._segment.fileno()
+            os.fsync(fileno)
+            self._synced = written
+
+    def _rotate(self) -> Tuple[int, List[str], List[Tuple[str, FileLock]]]:
+        """
+        Seal the current segment so every pending row lives in a sealed segment
+        (or an adopted directory); returns the pending count and what to delete
+        once those rows are flushed
+        """
+        with self._sync_lock, self._lock:
+            if self._segment_rows:
+                self._segment.flush()
+                os.fsync(self._segment.fileno())
+                self._synced = self._written
+                self._segment.close()
+                self._sealed.append(self._segment_path)
+                self._open_segment()
+            return len(self._pending), list(self._sealed), list(self._adopted)
+
+    def flush(self) -> int:
+        """Write everything queued so far to the sink; returns the number of rows sent"""
+        sent = 0
+        with self._flush_lock:
+            # Rows queued after this point wait for the next flush, so batches stay full
+            target, sealed, adopted = self._rotate()
+            while sent < target:
+                with self._lock:
+                    batch: List[Tuple[str, SnowflakeSimulationData]] = [
+                        self._pending[i] for i in range(min(self.max_batch, target - sent))
+                    ]
+
+                start = time.perf_counter()
+                try:
+                    with span("store.insert_batch"):
+                        self.sink.insert_many([data for _, data in batch], [record_id for record_id, _ in batch])
+                except Exception as e:
+                    # Rows stay queued and their segments stay on disk; the next flush retries them
+                    with self._lock:
+                        self._failed_flushes += 1
+                        self._consecutive_failures += 1
+                        self._last_error = str(e)
+                    logger.error(f"Write buffer flush failed: {e}")
+                    return sent
+                latency_ms = (time.perf_counter() - start) * 1000
+
+                with self._lock:
+                    for _ in batch:
+                        self._pending.popleft()
+                    self._flushes += 1
+                    self._rows_flushed += len(batch)
+                    self._last_flush_latency_ms = latency_ms
+                    self._max_flush_latency_ms = max(self._max_flush_latency_ms, latency_ms)
+                    self._last_error = None
+                    self._consecutive_failures = 0
+                sent += len(batch)
+
+            # Every row in these segments is now in the store
+            for path in sealed:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            for directory, lock in adopted:
+                _remove_writer_dir(directory, lock)
+            with self._lock:
+                self._sealed = self._sealed[len(sealed):]
+                self._adopted = self._adopted[len(adopted):]
+            return sent
+
+    def _retry_delay(self) -> float:
+        """Exponential backoff after consecutive failed flushes (caller holds self._lock)"""
+        return min(self.flush_interval * 2 ** (self._consecutive_failures - 1), WRITE_BUFFER_MAX_BACKOFF)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._consecutive_failures:
+                    # The store is failing: wait out the backoff even if a full batch is waiting
+                    deadline = time.monotonic() + self._retry_delay()
+                    while not self._closed and time.monotonic() < deadline:
+                        self._wakeup.wait(deadline - time.monotonic())
+                elif not self._closed and len(self._pending) < self.max_batch:
+                    self._wakeup.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def close(self):
+        """Stop the flusher after a final flush"""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            self.flush()
+        with self._sync_lock, self._lock:
+            self._segment.close()
+            drained = not self._pending
+        if drained:
+            _remove_writer_dir(self.writer_dir, self._writer_lock)
+        else:
+            # Left for the next process to adopt and replay
+            logger.warning(f"Write buffer closed with {len(self._pending)} rows still journaled in {self.writer_dir}")
+            self._writer_lock.release()
+            for _, lock in self._adopted:
+                lock.release()
+
+    @staticmethod
+    def _journal_bytes(paths: List[str], adopted_dirs: List[str]) -> int:
+        paths = list(paths)
+        for directory in adopted_dirs:
+            paths.extend(_segment_paths(directory))
+        total = 0
+        for path in paths:
+            try:
+                total += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "queue_depth": len(self._pending),
+                "max_pending": self.max_pending,
+                "max_batch": self.max_batch,
+                "flush_interval_s": self.flush_interval,
+                "flushes": self._flushes,
+                "failed_flushes": self._failed_flushes,
+                "consecutive_failures": self._consecutive_failures,
+                "retry_in_s": self._retry_delay() if self._consecutive_failures else None,
+                "rows_flushed": self._rows_flushed,
+                "rejected": self._rejected,
+                "last_flush_latency_ms": self._last_flush_latency_ms,
+                "max_flush_latency_ms": self._max_flush_latency_ms,
+                "last_error": self._last_error,
+                "journal_dir": self.writer_dir,
+                "journal_segments": len(self._sealed) + 1
+            }
+            paths = self._sealed + [self._segment_path]
+            adopted_dirs = [directory for directory, _ in self._adopted]
+        # Disk stats outside the lock, so saves never wait on them
+        stats["journal_bytes"] = self._journal_bytes(paths, adopted_dirs)
+        return stats
+
+
+_buffer: Optional[WriteBehindBuffer] = None
+_buffer_lock = threading.Lock()
+
+
+def get_write_buffer() -> WriteBehindBuffer:
+    """Return the process-wide write buffer, starting it on first use"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                buffer = WriteBehindBuffer(get_case_store())
+                buffer.start()
+                _buffer = buffer
+    return _buffer
+
+
+def close_write_buffer():
+    """Flush and stop the write buffer if one was started"""
+    global _buffer
+    with _buffer_lock:
+        if _buffer is not None:
+            _buffer.close()
+            _buffer = None
@@ -0,0 +1,83 @@
+"""
+Segmentation worker.
+
+Runs queued segmentation and meshing jobs (see services/job_queue). Start
+one or more per CPU-heavy node, pointing at the same DATA_ROOT (or
+JOB_QUEUE_PATH) as the API nodes:
+
+    python -m app.worker [--concurrency N] [--kinds segment]
+
+With JOB_INLINE_WORKERS > 0 (the default, for development) the API runs
+the same workers in-process; set it to 0 on API nodes that should only
+enqueue.
+"""
+import argparse
+import logging
+import signal
+import threading
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from app.services.job_queue import FAILED, JobQueue, Worker, get_event_log, get_job_queue
+from app.services.storage_manager import get_storage_manager
+from app.services.tracing import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+def segment_case(case_id: str, input_file: str, content_digest: Optional[str] = None) -> Dict[str, Any]:
+    """Segment an uploaded NIfTI volume and mesh its regions"""
+    from app.services.nifti_to_stl import process_nifti_to_stl_files
+
+    with get_storage_manager().pin(case_id, content_digest):
+        stl_files = process_nifti_to_stl_files(input_file, case_id, content_digest=content_digest)
+    return {"stl_files": [info["filename"] for info in stl_files]}
+
+
+# Job kind -> handler(case_id=..., **payload)
+HANDLERS = {
+    "segment": segment_case,
+}
+
+
+def publish_failure(job: Dict[str, Any], error: str):
+    """Tell clients watching the case whether the job will be retried"""
+    if job["state"] == FAILED:
+        get_event_log().publish(job["case_id"], "failed", {"error": error, "attempts": job["attempts"]})
+    else:
+        get_event_log().publish(job["case_id"], "stage", {"stage": "retrying", "error": error})
+
+
+def start_workers(count: int, queue: Optional[JobQueue] = None, kinds: Optional[List[str]] = None) -> List[Worker]:
+    """Start count workers in background threads"""
+    handlers = {kind: HANDLERS[kind] for kind in (kinds or HANDLERS)}
+    workers = [Worker(queue or get_job_queue(), handlers, on_failure=publish_failure) for _ in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run segmentation jobs from the shared queue")
+    parser.add_argument("--concurrency", type=int, default=1, help="jobs to run at once in this process")
+    parser.add_argument("--kinds", default=",".join(HANDLERS), help="comma-separated job kinds to take")
+    args = parser.parse_args()
+
+    load_dotenv()
+    configure_logging()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    workers = start_workers(args.concurrency, kinds=[kind for kind in args.kinds.split(",") if kind])
+    logger.info(f"Started {len(workers)} worker(s): {', '.join(w.worker_id for w in workers)}")
+    stop.wait()
+    logger.info("Stopping workers; waiting for running jobs to finish")
+    for worker in workers:
+        worker.stop()
+
+
+if __name__ == "__main__":
+    main()
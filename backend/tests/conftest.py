@@ -0,0 +1,17 @@
+"""
+Shared setup for the backend tests. Run from backend/ with
+
+    python -m pytest
+
+Services resolve their data directories from DATA_ROOT at import time, so
+it points at a throwaway directory before any app module is imported.
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+os.environ["DATA_ROOT"] = tempfile.mkdtemp(prefix="presurg-tests-")
+atexit.register(shutil.rmtree, os.environ["DATA_ROOT"], ignore_errors=True)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
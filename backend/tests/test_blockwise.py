@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from scipy.ndimage import binary_dilation, binary_erosion, gaussian_filter
+from scipy.spatial import cKDTree
+from skimage import measure
+
+from app.services.blockwise import boundary_faces, erode_dilate, marching_cubes
+
+
+def _blobs(shape=(40, 24, 28), seed=0):
+    """A smooth random field, thresholded into a few irregular blobs"""
+    rng = np.random.default_rng(seed)
+    field = gaussian_filter(rng.standard_normal(shape), sigma=2.5)
+    return field, field > 0.05
+
+
+def _assert_same_mesh(verts, faces, expected_verts, expected_faces):
+    """
+    Same vertices and triangles, whatever the vertex numbering. Slab
+    vertices are shifted into place in float32, so positions may differ
+    from the whole-volume ones in the last bit.
+    """
+    distance, match = cKDTree(expected_verts).query(verts)
+    assert distance.max() < 1e-4
+    assert len(np.unique(match)) == len(expected_verts)
+    triangles = sorted(tuple(sorted(face)) for face in match[faces].tolist())
+    assert triangles == sorted(tuple(sorted(face)) for face in expected_faces.tolist())
+
+
+@pytest.mark.parametrize("slab_depth", [1, 4, 7, 64])
+@pytest.mark.parametrize("erosions, dilations", [(2, 3), (1, 0), (0, 2)])
+def test_erode_dilate_matches_whole_volume(slab_depth, erosions, dilations):
+    _, mask = _blobs()
+    expected = mask
+    if erosions:
+        expected = binary_erosion(expected, iterations=erosions)
+    if dilations:
+        expected = binary_dilation(expected, iterations=dilations)
+
+    result = erode_dilate(mask, erosions, dilations, slab_depth=slab_depth, workers=3)
+    np.testing.assert_array_equal(result, expected)
+
+
+@pytest.mark.parametrize("slab_depth", [2, 5, 8, 64])
+@pytest.mark.parametrize("step_size", [1, 2])
+def test_marching_cubes_matches_whole_volume(slab_depth, step_size):
+    field, _ = _blobs()
+    verts, faces, _, _ = measure.marching_cubes(field, level=0.05, step_size=step_size)
+
+    result = marching_cubes(field, 0.05, step_size=step_size, slab_depth=slab_depth, workers=3)
+    assert result is not None
+    block_verts, block_faces, block_normals, block_values = result
+
+    # Seam vertices are welded, so the counts match exactly, not just the surface
+    assert len(block_verts) == len(verts)
+    assert len(block_faces) == len(faces)
+    assert len(block_normals) == len(block_verts) == len(block_values)
+    _assert_same_mesh(block_verts, block_faces, verts, faces)
+
+
+def test_marching_cubes_applies_spacing_after_welding():
+    field, _ = _blobs()
+    spacing = (1.5, 0.8, 1.0)
+    verts, faces, _, _ = marching_cubes(field, 0.05, slab_depth=8)
+    spaced_verts, spaced_faces, _, _ = marching_cubes(field, 0.05, spacing=spacing, slab_depth=8)
+
+    np.testing.assert_array_equal(spaced_faces, faces)
+    np.testing.assert_allclose(spaced_verts, verts * np.r_[spacing], rtol=1e-6)
+
+
+def test_marching_cubes_without_surface_returns_none():
+    assert marching_cubes(np.zeros((10, 6, 6)), 0.5, slab_depth=3) is None
+
+
+def test_boundary_faces_matches_whole_volume():
+    _, mask = _blobs()
+    expected = sum(np.count_nonzero(np.diff(mask, axis=axis)) for axis in range(3))
+    for slab_depth in (1, 3, 64):
+        assert boundary_faces(mask, slab_depth=slab_depth) == expected
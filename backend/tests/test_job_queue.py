@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from app.services.job_queue import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue, job_key
+
+LEASE = 0.2
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), lease_seconds=LEASE)
+    yield queue
+    queue.close()
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(queue):
+    queue.enqueue("segment", "case-1", {"input_file": "scan.nii.gz"})
+    first = queue.claim("worker-a")
+    assert first["state"] == RUNNING and first["attempts"] == 1
+    assert queue.claim("worker-b") is None
+
+    time.sleep(LEASE * 1.5)
+    second = queue.claim("worker-b")
+    assert second["job_key"] == first["job_key"]
+    assert second["attempts"] == 2
+
+    # The worker that lost its lease can no longer renew or finish the job
+    assert not queue.renew(first["job_key"], "worker-a")
+    assert not queue.complete(first["job_key"], "worker-a", {"stl_files": []})
+    assert queue.complete(second["job_key"], "worker-b", {"stl_files": []})
+    assert queue.get(first["job_key"])["state"] == SUCCEEDED
+
+
+def test_renewed_lease_is_not_reclaimed(queue):
+    queue.enqueue("segment", "case-1", {})
+    job = queue.claim("worker-a")
+    for _ in range(3):
+        time.sleep(LEASE / 2)
+        assert queue.renew(job["job_key"], "worker-a")
+    assert queue.claim("worker-b") is None
+
+
+def test_failed_attempt_is_retried_after_backoff(queue):
+    queue.enqueue("segment", "case-1", {}, max_attempts=2)
+    job = queue.claim("worker-a")
+    assert queue.fail(job["job_key"], "worker-a", "boom", backoff=LEASE)
+
+    retry = queue.get(job["job_key"])
+    assert retry["state"] == QUEUED and retry["error"] == "boom"
+    assert queue.claim("worker-b") is None
+
+    time.sleep(LEASE * 1.5)
+    job = queue.claim("worker-b")
+    assert job["attempts"] == 2
+    assert queue.fail(job["job_key"], "worker-b", "boom again", backoff=LEASE)
+    assert queue.get(job["job_key"])["state"] == FAILED
+
+
+def test_lease_expiring_on_the_last_attempt_fails_the_job(queue):
+    queue.enqueue("segment", "case-1", {}, max_attempts=1)
+    queue.claim("worker-a")
+    time.sleep(LEASE * 1.5)
+
+    assert queue.claim("worker-b") is None
+    job = queue.get(job_key("segment", "case-1"))
+    assert job["state"] == FAILED
+    assert "last attempt" in job["error"]
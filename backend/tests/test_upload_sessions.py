@@ -0,0 +1,68 @@
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.routers import upload
+from app.services.upload_sessions import _file_lock
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(upload.router, prefix="/api")
+    with TestClient(app) as client:
+        yield client
+
+
+def _start(client, size):
+    response = client.post("/api/uploads", json={"files": [{"filename": "scan.nii.gz", "size": size}]})
+    assert response.status_code == 201
+    return response.json()["case_id"]
+
+
+def _put(client, case_id, offset, body):
+    return client.put(
+        f"/api/uploads/{case_id}/files/scan.nii.gz", content=body, headers={"Upload-Offset": str(offset)}
+    )
+
+
+def test_mismatched_offset_gets_409_with_the_offset_to_resume_from(client):
+    case_id = _start(client, 10)
+    assert _put(client, case_id, 0, b"01234").json()["offset"] == 5
+
+    # A retry of the first chunk, and a chunk that skips ahead
+    for offset in (0, 7):
+        response = _put(client, case_id, offset, b"56789")
+        assert response.status_code == 409
+        assert response.headers["Upload-Offset"] == "5"
+        assert response.json()["detail"]["offset"] == 5
+
+    # Nothing from the rejected chunks was written; resuming completes the file
+    assert _put(client, case_id, 5, b"56789").json()["offset"] == 10
+    progress = client.get(f"/api/uploads/{case_id}").json()
+    assert progress["complete"]
+    with open(os.path.join(upload.UPLOAD_DIR, case_id, "scan.nii.gz"), "rb") as f:
+        assert f.read() == b"0123456789"
+
+
+def test_chunk_while_another_request_is_appending_gets_409(client):
+    case_id = _start(client, 10)
+    assert _put(client, case_id, 0, b"01234").status_code == 200
+
+    # Held as another process's write_chunk would hold it
+    lock = _file_lock(os.path.join(upload.UPLOAD_DIR, case_id, "scan.nii.gz"))
+    lock.acquire()
+    try:
+        response = _put(client, case_id, 5, b"56789")
+    finally:
+        lock.release()
+    assert response.status_code == 409
+    assert response.headers["Upload-Offset"] == "5"
+    assert _put(client, case_id, 5, b"56789").json()["offset"] == 10
+
+
+def test_chunk_for_unknown_upload_is_404(client):
+    response = _put(client, "00000000-0000-0000-0000-000000000000", 0, b"x")
+    assert response.status_code == 404
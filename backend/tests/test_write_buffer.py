@@ -0,0 +1,82 @@
+import os
+import sqlite3
+
+from app.models.schemas import SnowflakeSimulationData
+from app.services.case_store import SQLiteCaseStore
+from app.services.write_buffer import WriteBehindBuffer
+
+
+class FailingSink:
+    """A case store that is down"""
+
+    def insert_many(self, rows, record_ids):
+        raise RuntimeError("store unavailable")
+
+
+def _simulation(i):
+    return SnowflakeSimulationData(
+        case_id=f"case-{i}",
+        timestamp="2025-01-01T00:00:00",
+        tumor_location="frontal lobe",
+        tumor_volume=10.0 + i,
+        max_displacement=1.5,
+        avg_stress=90.0,
+        affected_regions=["Gray Matter"],
+        simulation_json={"i": i}
+    )
+
+
+def _record_ids(store):
+    with sqlite3.connect(store.path) as conn:
+        return sorted(row[0] for row in conn.execute("SELECT record_id FROM simulations"))
+
+
+def _crash(buffer):
+    """What a killed process leaves behind: its journal, with the OS lock dropped"""
+    buffer._writer_lock.release()
+
+
+def test_rows_journaled_before_a_crash_are_replayed(tmp_path):
+    journal_dir = str(tmp_path / "journal")
+    crashed = WriteBehindBuffer(FailingSink(), journal_dir=journal_dir)
+    record_ids = [crashed.submit(_simulation(i)) for i in range(3)]
+    # A failed flush seals the segment; later rows go to a new one
+    assert crashed.flush() == 0
+    record_ids += [crashed.submit(_simulation(i)) for i in range(3, 5)]
+    _crash(crashed)
+
+    store = SQLiteCaseStore(str(tmp_path / "cases.db"))
+    recovered = WriteBehindBuffer(store, journal_dir=journal_dir)
+    assert recovered.stats()["queue_depth"] == 5
+    assert recovered.flush() == 5
+    recovered.close()
+
+    assert _record_ids(store) == sorted(record_ids)
+    # Both the adopted writer directory and the new one are gone once drained
+    assert os.listdir(journal_dir) == []
+
+
+def test_replaying_rows_already_in_the_store_writes_nothing_twice(tmp_path):
+    journal_dir = str(tmp_path / "journal")
+    store = SQLiteCaseStore(str(tmp_path / "cases.db"))
+    crashed = WriteBehindBuffer(store, journal_dir=journal_dir)
+    record_ids = [crashed.submit(_simulation(i)) for i in range(4)]
+    # Stored, but the process dies before the segment is sealed and removed
+    store.insert_many([_simulation(i) for i in range(4)], record_ids)
+    _crash(crashed)
+
+    recovered = WriteBehindBuffer(store, journal_dir=journal_dir)
+    assert recovered.flush() == 4
+    recovered.close()
+    assert _record_ids(store) == sorted(record_ids)
+
+
+def test_live_writer_journal_is_not_adopted(tmp_path):
+    journal_dir = str(tmp_path / "journal")
+    live = WriteBehindBuffer(FailingSink(), journal_dir=journal_dir)
+    live.submit(_simulation(0))
+
+    other = WriteBehindBuffer(FailingSink(), journal_dir=journal_dir)
+    assert other.stats()["queue_depth"] == 0
+    other.close()
+    _crash(live)
@@ -0,0 +1,101 @@
+"""
+Microbenchmark for the /api/fea stress classification step.
+
+Times ml-backend/stress_classifier.py on a representative Gemini response,
+next to the per-term description scan it replaced.
+
+Usage:
+    python benchmarks/bench_stress_classifier.py [--iterations 20000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "ml-backend"))
+from stress_classifier import BRAIN_TERMS, RegionTermIndex, build_vocabulary, classify_stress, get_region_index
+
+STL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "stl")
+
+SAMPLE_RESULT = {
+    "removalSummary": {
+        "affectedRegions": [
+            "Left hippocampus proper", "Adjacent parahippocampal gyrus", "Entorhinal cortex",
+            "Primary fornix connections", "Temporal lobe white matter", "Left amygdala",
+        ],
+        "preservedRegions": ["Contralateral hemisphere", "Brainstem", "Right hippocampus", "Thalamus"],
+        "eloquentCortex": True
+    },
+    "neurologicalDeficits": {
+        "motor": {
+            "affected": True,
+            "description": "Mild weakness from involvement of the corticospinal tract near the internal capsule region",
+            "severity": "MILD",
+            "bodyParts": ["Right arm"]
+        },
+        "sensory": {
+            "affected": False,
+            "description": "No sensory changes expected",
+            "severity": "NONE"
+        },
+        "cognitive": {
+            "affected": True,
+            "functions": ["memory", "attention"],
+            "description": "Episodic memory deficits from loss of the left hippocampus and entorhinal cortex, "
+                           "with reduced input to the posterior cingulate gyrus and medial temporal lobe area",
+            "severity": "SEVERE"
+        },
+        "language": {
+            "affected": True,
+            "type": "receptive",
+            "description": "Naming difficulty if the superior temporal gyrus and Wernicke area are disturbed",
+            "severity": "MODERATE"
+        }
+    }
+}
+
+
+def legacy_extract(description, terms):
+    """The per-term, per-word scan that used to live in main.py"""
+    extracted_regions = []
+    desc_lower = description.lower()
+    for term in terms:
+        if term in desc_lower:
+            words = description.split()
+            for i, word in enumerate(words):
+                if term in word.lower():
+                    region_phrase = " ".join(words[max(0, i - 1):min(len(words), i + 2)])
+                    if region_phrase not in extracted_regions and len(region_phrase) > 5:
+                        extracted_regions.append(region_phrase)
+    return extracted_regions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    index = get_region_index()
+    build_s = timeit.timeit(lambda: RegionTermIndex(build_vocabulary(STL_DIR)), number=10) / 10
+    lookup_s = timeit.timeit(lambda: get_region_index(STL_DIR), number=1000) / 1000
+    descriptions = [d["description"] for d in SAMPLE_RESULT["neurologicalDeficits"].values()]
+
+    legacy_s = timeit.timeit(lambda: [legacy_extract(d, BRAIN_TERMS) for d in descriptions], number=args.iterations)
+    legacy_full_s = timeit.timeit(lambda: [legacy_extract(d, index.vocabulary) for d in descriptions], number=args.iterations)
+    scan_s = timeit.timeit(lambda: [index.extract_phrases(d) for d in descriptions], number=args.iterations)
+    full_s = timeit.timeit(
+        lambda: classify_stress(SAMPLE_RESULT, "Left Hippocampus", "Hippocampus", index=index),
+        number=args.iterations
+    )
+
+    print(f"Vocabulary: {len(index.vocabulary)} terms ({len(BRAIN_TERMS)} generic)")
+    print(f"Index build (when STL files change):          {build_s * 1e3:8.3f} ms")
+    print(f"Index lookup (STL directory unchanged):       {lookup_s * 1e6:8.2f} us/request")
+    print(f"Description scan, legacy, generic terms only: {legacy_s / args.iterations * 1e6:8.2f} us/request")
+    print(f"Description scan, legacy, full vocabulary:    {legacy_full_s / args.iterations * 1e6:8.2f} us/request")
+    print(f"Description scan, compiled index:             {scan_s / args.iterations * 1e6:8.2f} us/request")
+    print(f"Full classify_stress:                         {full_s / args.iterations * 1e6:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
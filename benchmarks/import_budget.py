@@ -0,0 +1,110 @@
+"""
+Import-time budget check for the two API processes.
+
+Imports each app's entry module (backend: app.main, ml-backend: main) in a
+fresh interpreter and checks two things:
+
+- none of the heavy scientific or LLM libraries is imported at startup
+  (they load lazily or during warmup, see warmup.py);
+- the import takes no longer than --budget-ms, best of --repeat runs.
+
+Exits with status 1 if either check fails; --importtime prints the
+slowest modules (python -X importtime) to show where the time went.
+
+Usage:
+    python benchmarks/import_budget.py [--apps backend,ml-backend] [--budget-ms 1000]
+        [--repeat 3] [--importtime]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+APPS = {
+    "backend": (os.path.join(ROOT, "backend"), "app.main"),
+    "ml-backend": (os.path.join(ROOT, "ml-backend"), "main"),
+}
+
+HEAVY_MODULES = [
+    "nibabel",
+    "skimage",
+    "trimesh",
+    "scipy",
+    "pydicom",
+    "google.generativeai",
+    "torch",
+    "tensorflow",
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(app, repeat):
+    """Best-of-repeat import time (ms) and the heavy modules that got imported"""
+    cwd, module = APPS[app]
+    env = {**os.environ, "PYTHONWARNINGS": "ignore", "PYTHONDONTWRITEBYTECODE": "1"}
+    best, loaded = None, []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=cwd, env=env, capture_output=True, text=True, check=True
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        best = result["ms"] if best is None else min(best, result["ms"])
+        loaded = result["loaded"]
+    return best, loaded
+
+
+def slowest_imports(app, count=15):
+    """The modules with the largest cumulative import time, from -X importtime"""
+    cwd, module = APPS[app]
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, capture_output=True, text=True, env={**os.environ, "PYTHONWARNINGS": "ignore"}
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", default=",".join(APPS))
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="Maximum import time per app")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per app; the fastest is kept")
+    parser.add_argument("--importtime", action="store_true", help="Show the slowest imports")
+    args = parser.parse_args()
+
+    failed = False
+    for app in [a for a in args.apps.split(",") if a]:
+        if app not in APPS:
+            parser.error(f"Unknown app: {app}")
+        ms, loaded = measure(app, args.repeat)
+        problems = []
+        if ms > args.budget_ms:
+            problems.append(f"over budget ({args.budget_ms:.0f} ms)")
+        if loaded:
+            problems.append(f"imports {', '.join(loaded)} at startup")
+        failed = failed or bool(problems)
+        print(f"{app:>11}  {ms:8.1f} ms  {'; '.join(problems) if problems else 'ok'}")
+        if args.importtime:
+            for cumulative, name in slowest_imports(app):
+                print(f"{'':>13}{cumulative / 1000:8.1f} ms  {name}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Benchmark suite for the imaging -> mesh -> simulation pipeline.
+
+Builds synthetic head phantoms (an intensity volume plus a parcellation
+with up to ~100 labels, like SynthSeg --parc) and times each backend stage
+on them:
+
+    segment      segment_brain_tissue
+    mesh         generate_mesh_from_volume (preview and full policies)
+    extract      extract_regions_to_nifti
+    stl          nifti_to_stl over every extracted region
+    simulate     perform_tumor_removal_simulation
+
+Every (stage, size) runs in a fresh process, so peak RSS is the stage's
+own: the high-water mark is reset after setup where Linux allows it
+(/proc/self/clear_refs), and rss_delta_mb is the growth over the
+post-setup RSS. Throughput is input megavoxels per second. Everything runs
+offline on the CPU; SynthSeg and GPUs are never touched.
+
+Usage:
+    python benchmarks/pipeline_bench.py [--sizes 64,128,256] [--labels 100]
+        [--stages segment,mesh_preview,...] [--repeat 3] [--output results.json]
+    python benchmarks/pipeline_bench.py --baseline baseline.json      run, then compare
+    python benchmarks/pipeline_bench.py --results new.json --baseline baseline.json
+                                                                       compare saved results
+
+Comparison flags a stage as a regression when its wall time grows by more
+than --time-tolerance or its peak RSS by more than --rss-tolerance
+(fractions), and exits with status 1 if anything regressed.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+STAGES = ["segment", "mesh_preview", "mesh_full", "extract", "stl", "simulate"]
+DEFAULT_SIZES = [64, 128, 256]
+
+
+def phantom(size, n_labels, seed=0):
+    """
+    Head phantom: an int16 intensity volume and a parcellation of the brain
+    ellipsoid into n_labels labels (radial shells x angular sectors), built
+    slice by slice
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    label_dtype = np.uint8 if n_labels < 256 else np.uint16
+    labels = np.zeros((size, size, size), dtype=label_dtype)
+    volume = np.empty((size, size, size), dtype=np.int16)
+    centre = (size - 1) / 2
+    radii = np.array([0.40, 0.34, 0.38]) * size
+    n_shells, n_az, n_el = 4, 10, max(1, -(-n_labels // 40))
+    means = 300 + (np.arange(n_labels + 1) * 37) % 600
+    means[0] = 40
+
+    y, x = np.ogrid[:size, :size]
+    dy, dx = (y - centre) / radii[1], (x - centre) / radii[2]
+    azimuth = ((np.arctan2(dy, dx) + np.pi) / (2 * np.pi) * n_az).astype(int) % n_az
+    for z in range(size):
+        dz = (z - centre) / radii[0]
+        r = np.sqrt(dz ** 2 + dy ** 2 + dx ** 2)
+        elevation = np.minimum(((np.arctan2(dz, np.sqrt(dy ** 2 + dx ** 2)) / np.pi + 0.5) * n_el).astype(int), n_el - 1)
+        shell = np.minimum((r * n_shells).astype(int), n_shells - 1)
+        parcel = 1 + (shell * n_az * n_el + elevation * n_az + azimuth) % n_labels
+        brain = r < 1.0
+        labels[z] = np.where(brain, parcel, 0)
+        intensity = means[labels[z]] + rng.normal(0, 20, size=(size, size))
+        # Skull shell just outside the brain
+        intensity[(r >= 1.0) & (r < 1.12)] = 1400
+        volume[z] = intensity.astype(np.int16)
+    return volume, labels
+
+
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def _peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _reset_peak_rss():
+    """Reset the RSS high-water mark to the current RSS; False where unsupported"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _setup(stage, size, n_labels, workdir):
+    """Build a stage's inputs; returns (run, megavoxels of input)"""
+    import nibabel as nib
+    import numpy as np
+
+    if stage == "simulate":
+        from app.services.fea_simulator import perform_tumor_removal_simulation
+        return lambda: perform_tumor_removal_simulation("bench", "tumor", 5.0), 0.0
+
+    volume, labels = phantom(size, n_labels)
+    megavoxels = volume.size / 1e6
+
+    if stage == "segment":
+        from app.services.segmentation_engine import segment_brain_tissue
+        return lambda: segment_brain_tissue(volume), megavoxels
+
+    if stage in ("mesh_preview", "mesh_full"):
+        from app.models.schemas import MeshingPolicy
+        from app.services.segmentation_engine import generate_mesh_from_volume, segment_brain_tissue
+        brain_mask, volume_norm = segment_brain_tissue(volume)
+        del volume
+        policy = MeshingPolicy(mode=stage.split("_")[1])
+        return lambda: generate_mesh_from_volume(volume_norm, brain_mask, policy, (1.0, 1.0, 1.0)), megavoxels
+
+    from app.services.nifti_to_stl import extract_regions_to_nifti, nifti_to_stl
+    del volume
+    seg_file = os.path.join(workdir, "seg.nii.gz")
+    nib.save(nib.Nifti1Image(labels, np.eye(4)), seg_file)
+    del labels
+    if stage == "extract":
+        return lambda: extract_regions_to_nifti(seg_file, os.path.join(workdir, "regions")), megavoxels
+
+    if stage == "stl":
+        regions = extract_regions_to_nifti(seg_file, os.path.join(workdir, "regions"))
+        stl_dir = os.path.join(workdir, "stl")
+        os.makedirs(stl_dir, exist_ok=True)
+
+        def run():
+            for label, info in regions.items():
+                nifti_to_stl(info["file"], os.path.join(stl_dir, f"{label}.stl"))
+        return run, megavoxels
+
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def _run_case(stage, size, n_labels, repeat):
+    """One (stage, size) measurement; runs in its own process"""
+    import contextlib
+    import io
+
+    sys.path.insert(0, BACKEND_DIR)
+    with tempfile.TemporaryDirectory() as workdir:
+        # The pipeline prints progress; keep the benchmark output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            run, megavoxels = _setup(stage, size, n_labels, workdir)
+            exact_peak = _reset_peak_rss()
+            rss_before = _rss_mb()
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - start)
+        peak = _peak_rss_mb()
+    wall = min(times)
+    return {
+        "stage": stage,
+        "size": size,
+        "labels": n_labels,
+        "wall_s": round(wall, 4),
+        "peak_rss_mb": round(peak, 1),
+        "rss_delta_mb": round(max(peak - rss_before, 0.0), 1),
+        "peak_rss_exact": exact_peak,
+        "throughput_mvox_s": round(megavoxels / wall, 2) if megavoxels else None,
+    }
+
+
+def run_benchmarks(stages, sizes, n_labels, repeat):
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for size in sizes:
+        for stage in stages:
+            if stage == "simulate" and size != sizes[0]:
+                continue  # Independent of the volume size
+            with context.Pool(1) as pool:
+                result = pool.apply(_run_case, (stage, size, n_labels, repeat))
+            print(
+                f"{stage:>13} {size:>4}^3  {result['wall_s']:9.3f} s  "
+                f"peak {result['peak_rss_mb']:8.1f} MB  (+{result['rss_delta_mb']:.1f})  "
+                f"{result['throughput_mvox_s'] or '-':>8} Mvox/s",
+                flush=True
+            )
+            results.append(result)
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "labels": n_labels,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, time_tolerance, rss_tolerance):
+    """Print a comparison table; returns the list of regressions"""
+    key = lambda r: (r["stage"], r["size"], r["labels"])
+    base = {key(r): r for r in baseline["results"]}
+    regressions = []
+    print(f"\n{'stage':>13} {'size':>6}  {'wall':>18}  {'peak RSS (MB)':>22}")
+    for result in current["results"]:
+        old = base.get(key(result))
+        if old is None:
+            print(f"{result['stage']:>13} {result['size']:>4}^3  (not in baseline)")
+            continue
+        time_ratio = result["wall_s"] / old["wall_s"] if old["wall_s"] else 1.0
+        rss_ratio = result["peak_rss_mb"] / old["peak_rss_mb"] if old["peak_rss_mb"] else 1.0
+        flags = []
+        if time_ratio > 1 + time_tolerance:
+            flags.append("TIME")
+        if rss_ratio > 1 + rss_tolerance:
+            flags.append("RSS")
+        if flags:
+            regressions.append({**result, "flags": flags, "time_ratio": time_ratio, "rss_ratio": rss_ratio})
+        print(
+            f"{result['stage']:>13} {result['size']:>4}^3  "
+            f"{old['wall_s']:7.3f} -> {result['wall_s']:7.3f}  "
+            f"{old['peak_rss_mb']:8.1f} -> {result['peak_rss_mb']:8.1f}  "
+            f"{'REGRESSION ' + '+'.join(flags) if flags else 'ok'}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="Comma-separated cube edge lengths (64-512)")
+    parser.add_argument("--labels", type=int, default=100, help="Parcellation labels in the phantom")
+    parser.add_argument("--stages", default=",".join(STAGES))
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage; the fastest is kept")
+    parser.add_argument("--output", help="Write results as JSON here")
+    parser.add_argument("--results", help="Compare these saved results instead of running")
+    parser.add_argument("--baseline", help="Baseline results JSON to compare against")
+    parser.add_argument("--time-tolerance", type=float, default=0.20)
+    parser.add_argument("--rss-tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    if args.results:
+        with open(args.results, encoding="utf-8") as f:
+            current = json.load(f)
+    else:
+        stages = [s for s in args.stages.split(",") if s]
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+        sizes = [int(s) for s in args.sizes.split(",") if s]
+        current = run_benchmarks(stages, sizes, args.labels, args.repeat)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(current, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.time_tolerance, args.rss_tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s)")
+            sys.exit(1)
+    elif not args.output:
+        json.dump(current, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
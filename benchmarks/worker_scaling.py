@@ -0,0 +1,88 @@
+"""
+Throughput of the segmentation job queue as worker processes are added.
+
+Queues --jobs synthetic jobs that each hold a worker for --job-seconds
+(standing in for a segmentation run), then drains the queue with 1, 2, 4...
+worker processes sharing one queue file, the way separate worker nodes
+would. Reports jobs per second, speedup over one worker and scaling
+efficiency, and checks that every job ran exactly once.
+
+Usage:
+    python benchmarks/worker_scaling.py [--workers 1,2,4,8] [--jobs 64] [--job-seconds 0.25]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from app.services.job_queue import SUCCEEDED, JobQueue, Worker  # noqa: E402
+
+
+def _hold(case_id: str, seconds: float):
+    time.sleep(seconds)
+    return {"case_id": case_id, "pid": os.getpid()}
+
+
+def _run_worker(path: str, stop):
+    worker = Worker(JobQueue(path), {"hold": _hold}, heartbeat_seconds=1.0, poll_seconds=0.05)
+    worker.start()
+    stop.wait()
+    worker.stop()
+
+
+def run(workers: int, jobs: int, job_seconds: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jobs.db")
+        queue = JobQueue(path)
+        for i in range(jobs):
+            queue.enqueue("hold", f"case-{i}", {"seconds": job_seconds})
+            # Duplicate enqueues must not add work
+            queue.enqueue("hold", f"case-{i}", {"seconds": job_seconds})
+
+        stop = multiprocessing.Event()
+        start = time.perf_counter()
+        procs = [multiprocessing.Process(target=_run_worker, args=(path, stop)) for _ in range(workers)]
+        for proc in procs:
+            proc.start()
+        while queue.stats()["jobs"][SUCCEEDED] < jobs:
+            time.sleep(0.02)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        for proc in procs:
+            proc.join()
+
+        done = [queue.get(f"hold:case-{i}") for i in range(jobs)]
+        return {
+            "workers": workers,
+            "seconds": elapsed,
+            "jobs_per_second": jobs / elapsed,
+            "exactly_once": all(job["attempts"] == 1 for job in done),
+            "pids": len({job["result"]["pid"] for job in done}),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--jobs", type=int, default=64)
+    parser.add_argument("--job-seconds", type=float, default=0.25)
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'workers':>7} {'seconds':>8} {'jobs/s':>8} {'speedup':>8} {'efficiency':>10} {'once':>5}")
+    for count in [int(n) for n in args.workers.split(",")]:
+        result = run(count, args.jobs, args.job_seconds)
+        baseline = baseline or result["jobs_per_second"]
+        speedup = result["jobs_per_second"] / baseline
+        print(
+            f"{count:>7} {result['seconds']:>8.2f} {result['jobs_per_second']:>8.1f} {speedup:>8.2f} "
+            f"{speedup / count:>10.0%} {str(result['exactly_once']):>5}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -62,6 +62,13 @@ export const BrainViewer3D: React.FC<BrainViewer3DProps> = ({
     return geo;
   }, [meshData, showHeatmap, heatmapData]);
 
+  // Segmented meshes come in millimetres; scale them to the ~5-unit radius the camera expects
+  const fitScale = useMemo(() => {
+    geometry.computeBoundingSphere();
+    const radius = geometry.boundingSphere?.radius ?? 0;
+    return radius > 0 ? 5 / radius : 1;
+  }, [geometry]);
+
   return (
     <div className="h-full w-full relative">
       {title && (
@@ -74,7 +81,7 @@ export const BrainViewer3D: React.FC<BrainViewer3DProps> = ({
         <pointLight position={[10, 10, 10]} />
         <pointLight position={[-10, -10, -10]} intensity={0.3} />
         
-        <mesh geometry={geometry}>
+        <mesh geometry={geometry} scale={fitScale}>
           <meshStandardMaterial
             vertexColors={true}
             side={THREE.DoubleSide}
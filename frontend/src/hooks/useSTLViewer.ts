@@ -1,5 +1,5 @@
 import { useState, useEffect, useCallback } from 'react';
-import { listSTLFiles, runFEA } from '../utils/api';
+import { getJobEventsUrl, listSTLFiles, runFEA } from '../utils/api';
 import type { STLFileInfo, FEAResponse } from '../types';
 
 export const useSTLViewer = (caseId: string | null) => {
@@ -12,66 +12,63 @@ export const useSTLViewer = (caseId: string | null) => {
   const [error, setError] = useState<string | null>(null);
   const [polling, setPolling] = useState(false);
 
-  // Poll for STL files if caseId exists
+  // Follow segmentation progress over server-sent events; structures appear as each mesh is ready
   useEffect(() => {
+    setStlFiles([]);
     if (!caseId) {
-      setStlFiles([]);
       setSelectedStructure(null);
       setFeaResults(null);
       setPolling(false);
       return;
     }
 
-    let interval: NodeJS.Timeout | null = null;
     let isMounted = true;
+    setPolling(true);
 
-    const fetchSTLFiles = async () => {
+    const source = new EventSource(getJobEventsUrl(caseId));
+
+    const addFile = (file: STLFileInfo) => {
+      setStlFiles(prev => (prev.some(f => f.filename === file.filename) ? prev : [...prev, file]));
+    };
+
+    source.addEventListener('mesh_ready', (event) => {
+      addFile(JSON.parse((event as MessageEvent).data));
+    });
+
+    source.addEventListener('done', (event) => {
+      const { stl_files } = JSON.parse((event as MessageEvent).data) as { stl_files: STLFileInfo[] };
+      source.close();
+      setStlFiles(stl_files);
+      setPolling(false);
+      console.log(`Loaded ${stl_files.length} STL files`);
+    });
+
+    source.addEventListener('failed', (event) => {
+      const { error: message } = JSON.parse((event as MessageEvent).data) as { error?: string };
+      source.close();
+      setError(message || 'Segmentation failed');
+      setPolling(false);
+    });
+
+    // The browser reconnects on its own (resuming from Last-Event-ID) unless the server refused the stream
+    source.onerror = async () => {
+      if (source.readyState !== EventSource.CLOSED) return;
       try {
         const response = await listSTLFiles(caseId);
         if (!isMounted) return;
-        
-        // Simulate "segmenting" delay - poll a few times before showing files
-        const pollCount = (window as any).__stlPollCount || 0;
-        (window as any).__stlPollCount = pollCount + 1;
-        
-        // After 2 polls (6 seconds), show all files
-        if (pollCount >= 2) {
-          // Show all files we got from the API
-          setStlFiles(response.stl_files);
-          setPolling(false);
-          if (interval) {
-            clearInterval(interval);
-            interval = null;
-          }
-          (window as any).__stlPollCount = 0;
-          console.log(`Loaded ${response.stl_files.length} STL files`);
-        } else {
-          // Keep showing "segmenting" and polling
-          setStlFiles([]);
-          setPolling(true);
-          if (!interval) {
-            interval = setInterval(fetchSTLFiles, 3000);
-          }
-        }
+        setStlFiles(response.stl_files);
       } catch (err: any) {
         if (!isMounted) return;
         console.error('Error fetching STL files:', err);
         setError(err.message || 'Failed to load STL files');
-        setPolling(false);
-        if (interval) {
-          clearInterval(interval);
-          interval = null;
-        }
+      } finally {
+        if (isMounted) setPolling(false);
       }
     };
 
-    fetchSTLFiles();
-
     return () => {
       isMounted = false;
-      if (interval) {
-        clearInterval(interval);
-      }
+      source.close();
     };
   }, [caseId]);
 
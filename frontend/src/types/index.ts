@@ -13,10 +13,21 @@ export interface MeshData {
   colors?: number[][];
 }
 
+export interface MeshingInfo {
+  mode: string;
+  step_size: number;
+  vertices: number;
+  triangles: number;
+  spacing: number[];
+  units: string;
+  timings: Record<string, number>;
+}
+
 export interface SegmentationResponse {
   mesh_data: MeshData;
   label_names: Record<string, string>;
   case_id: string;
+  meshing?: MeshingInfo;
 }
 
 export interface SimulationRequest {
@@ -52,10 +63,15 @@ export interface STLFileInfo {
   voxels: number;
 }
 
+export interface RegionStatus extends STLFileInfo {
+  status: 'pending' | 'meshing' | 'ready' | 'skipped';
+}
+
 export interface STLListResponse {
   case_id: string;
   stl_files: STLFileInfo[];
   status: string;
+  regions?: RegionStatus[];
 }
 
 export interface StructureFEARequest {
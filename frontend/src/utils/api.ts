@@ -102,6 +102,12 @@ export const listSTLFiles = async (caseId: string): Promise<STLListResponse> =>
   return response.data;
 };
 
+// Server-sent segmentation progress for a case (stage, mesh_ready, done, failed)
+export const getJobEventsUrl = (caseId: string): string => {
+  const baseUrl = API_BASE_URL.replace('/api', '');
+  return `${baseUrl}/api/jobs/${caseId}/events`;
+};
+
 // Get STL file URL
 export const getSTLFileUrl = (caseId: string, filename: string): string => {
   const baseUrl = API_BASE_URL.replace('/api', '');
@@ -77,15 +77,24 @@ for fname in sorted(nii_files):
     
     try:
         img = nib.load(path)
-        data = img.get_fdata()
+        # Region masks as bool (1 byte/voxel); get_fdata() would make a float64 copy
+        iso = 0.5
+        mask = np.asanyarray(img.dataobj) > iso
         
-        if np.count_nonzero(data) < 100:
+        if np.count_nonzero(mask) < 100:
             print(f"  Skipping {fname}: empty or tiny segmentation")
             continue
 
-        # Use marching cubes to create 3D mesh
-        iso = 0.5
-        verts, faces, normals, values = measure.marching_cubes(data, level=iso, spacing=img.header.get_zooms()[:3])
+        # Use marching cubes to create 3D mesh, on the region's bounding box only
+        spacing = np.array(img.header.get_zooms()[:3], dtype=np.float32)
+        nonzero = np.argwhere(mask)
+        lo = np.maximum(nonzero.min(axis=0) - 1, 0)
+        hi = np.minimum(nonzero.max(axis=0) + 2, mask.shape)
+        del nonzero
+        verts, faces, normals, values = measure.marching_cubes(
+            mask[lo[0]:hi[0], lo[1]:hi[1], lo[2]:hi[2]], level=0.5, spacing=tuple(spacing)
+        )
+        verts += lo * spacing
         
         if len(verts) == 0:
             print(f"  Skipping {fname}: no vertices generated")
@@ -1,14 +1,25 @@
-import google.generativeai as genai
+import logging
 import os
 import json
+from functools import lru_cache
 from dotenv import load_dotenv
 
+import services_path  # noqa: F401  (backend/app/services on sys.path)
+from app.services.tracing import span
+
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 
-# Setup Gemini
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-model = genai.GenerativeModel('gemini-2.0-flash-exp')
+
+@lru_cache(maxsize=None)
+def get_model():
+    """Gemini model, configured on first use to keep google.generativeai out of startup"""
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+    return genai.GenerativeModel('gemini-2.0-flash-exp')
 
 
 def analyze_brain_removal(procedure_type: str, removal_region: dict, patient_age: int, reason: str) -> dict:
@@ -156,7 +167,8 @@ Generate realistic, medically accurate neurological predictions based on functio
 
     try:
         # Call Gemini
-        response = model.generate_content(prompt)
+        with span("llm.gemini"):
+            response = get_model().generate_content(prompt)
         text = response.text
         
         # Clean up response
@@ -167,7 +179,7 @@ Generate realistic, medically accurate neurological predictions based on functio
         return result
         
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error(f"Error: {e}")
         # Return fallback analysis
         return generate_fallback_analysis(brain_region, hemisphere, volume, patient_age)
 
@@ -1,14 +1,26 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import FastAPI, HTTPException, UploadFile, File, BackgroundTasks, Depends, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+import logging
 import uuid
 import os
-import aiofiles
 import glob
-from gemini_service import analyze_brain_removal
+import shutil
+import services_path  # noqa: F401  (backend/app/services on sys.path)
+from app.services.profiler import PROFILER_ADMIN_TOKEN, PROFILER_MAX_SECONDS, ProfilingMiddleware, admin_token_valid, attach, get_profiler
+from app.services.tracing import TracingMiddleware, configure_logging, render_metrics, span
+from gemini_service import analyze_brain_removal, get_model
+from app.services.object_store import data_path
+from app.services.job_queue import get_event_log
 from segmentation_service import process_nifti_to_stl_files
+from stress_classifier import classify_stress, get_region_index
+from app.services.upload_stream import MAX_UPLOAD_FILE_BYTES, MAX_UPLOAD_TOTAL_BYTES, UploadTooLarge, stream_to_disk
+from app.services.warmup import Warmup
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title="PreSurg.AI - Brain Surgery ML API",
@@ -22,21 +34,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "X-Profile-Id"],
 )
 
-# Directories
-UPLOAD_DIR = "uploads"
-# STL folder is in project root, not ml-backend folder
-# Get the directory where this file is located (ml-backend/)
-ml_backend_dir = os.path.dirname(os.path.abspath(__file__))
-# Go up one level to project root, then into stl/
-project_root = os.path.dirname(ml_backend_dir)
-STL_BASE_DIR = os.path.join(project_root, "stl")
-STL_BASE_DIR = os.path.abspath(STL_BASE_DIR)
+# Profiles the thread serving requests sent with X-Profile: 1 and an admin token
+app.add_middleware(ProfilingMiddleware)
+
+# Outermost, so request IDs and latencies cover everything below it
+app.add_middleware(TracingMiddleware)
+
+# Heavy libraries load lazily; warmup pulls them in after startup so /api/health answers at once
+warmup = Warmup(["skimage.measure", "nibabel"], optional=[get_model])
+
+@app.on_event("startup")
+def start_warmup():
+    warmup.start()
+
+# Directories, shared with the main backend under DATA_ROOT (the project root by default)
+UPLOAD_DIR = data_path("uploads")
+STL_BASE_DIR = data_path("stl")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 # Don't create stl dir if it doesn't exist - it should already exist
-print(f"STL_BASE_DIR: {STL_BASE_DIR}")
-print(f"STL directory exists: {os.path.exists(STL_BASE_DIR)}")
+logger.debug(f"STL_BASE_DIR: {STL_BASE_DIR}")
+logger.debug(f"STL directory exists: {os.path.exists(STL_BASE_DIR)}")
 
 # NEW: Proper coordinate model
 class Coordinates(BaseModel):
@@ -70,10 +90,16 @@ class StructureFEARequest(BaseModel):
     reason: Optional[str] = None
 
 # Upload and STL models
+class UploadedFile(BaseModel):
+    filename: str
+    size: int
+    sha256: str
+
 class UploadResponse(BaseModel):
     case_id: str
     filename: str
     status: str
+    files: Optional[List[UploadedFile]] = None
 
 class STLFileInfo(BaseModel):
     filename: str
@@ -124,6 +150,8 @@ async def upload_scan(files: List[UploadFile] = File(...), background_tasks: Bac
 
     allowed_extensions = {'.nii', '.nii.gz'}
     uploaded_files = []
+    file_info = []
+    total_bytes = 0
 
     for file in files:
         file_ext = os.path.splitext(file.filename)[1].lower()
@@ -142,10 +170,16 @@ async def upload_scan(files: List[UploadFile] = File(...), background_tasks: Bac
         file_path = os.path.join(case_dir, file.filename)
 
         try:
-            async with aiofiles.open(file_path, 'wb') as f:
-                content = await file.read()
-                await f.write(content)
+            # Streamed in chunks; the limit is whatever is left of the per-request budget
+            size, sha256 = await stream_to_disk(
+                file, file_path, max_bytes=min(MAX_UPLOAD_FILE_BYTES, MAX_UPLOAD_TOTAL_BYTES - total_bytes)
+            )
+            total_bytes += size
             uploaded_files.append(file.filename)
+            file_info.append(UploadedFile(filename=file.filename, size=size, sha256=sha256))
+        except UploadTooLarge as e:
+            shutil.rmtree(case_dir, ignore_errors=True)
+            raise HTTPException(status_code=413, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error saving file {file.filename}: {str(e)}")
 
@@ -162,7 +196,8 @@ async def upload_scan(files: List[UploadFile] = File(...), background_tasks: Bac
     return UploadResponse(
         case_id=case_id,
         filename=f"{len(uploaded_files)} files" if len(uploaded_files) > 1 else uploaded_files[0],
-        status=status
+        status=status,
+        files=file_info
     )
 
 # STL endpoints
@@ -176,15 +211,15 @@ async def list_stl_files(case_id: str):
     # Later we can make it case-specific: case_stl_dir = os.path.join(STL_BASE_DIR, case_id)
     stl_pattern = os.path.join(STL_BASE_DIR, "*.stl")
     stl_files = glob.glob(stl_pattern)
-    print(f"[STL List] Looking in: {stl_pattern}")
-    print(f"[STL List] Found {len(stl_files)} STL files")
+    logger.debug(f"[STL List] Looking in: {stl_pattern}")
+    logger.debug(f"[STL List] Found {len(stl_files)} STL files")
     
     # If no files in root, check case-specific folder
     if not stl_files:
         case_stl_dir = os.path.join(STL_BASE_DIR, case_id)
         if os.path.exists(case_stl_dir):
             stl_files = glob.glob(os.path.join(case_stl_dir, "*.stl"))
-            print(f"[STL List] Checked case folder: {case_stl_dir}, found {len(stl_files)} files")
+            logger.debug(f"[STL List] Checked case folder: {case_stl_dir}, found {len(stl_files)} files")
     
     stl_info_list = []
     for stl_path in stl_files:
@@ -227,6 +262,30 @@ async def list_stl_files(case_id: str):
         status="ready" if stl_info_list else "processing"
     )
 
+@app.get("/api/jobs/{case_id}/events")
+async def case_events(case_id: str, last_event_id: Optional[str] = Header(None)):
+    """
+    Server-sent segmentation progress for a case: "stage", "mesh_ready" per
+    region, then "done" or "failed". Cases with no recorded events get the
+    current STL list followed by "done".
+    """
+    async def snapshot():
+        listing = await list_stl_files(case_id)
+        stl_files = [info.model_dump() for info in listing.stl_files]
+        return [{"event": "mesh_ready", "data": info} for info in stl_files] + [
+            {"event": "done", "data": {"stl_files": stl_files}}
+        ]
+
+    try:
+        after = int(last_event_id or 0)
+    except ValueError:
+        after = 0
+    return StreamingResponse(
+        get_event_log().stream(case_id, after, snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/stl/{case_id}/{filename}")
 async def get_stl_file(case_id: str, filename: str):
     """
@@ -348,152 +407,17 @@ def run_fea_simulation(request: StructureFEARequest):
         )
         
         # Debug: Print Gemini response structure
-        print(f"Gemini response keys: {result.keys()}")
-        print(f"Removal summary: {result.get('removalSummary', {})}")
-        
-        # Extract affected regions from Gemini's removalSummary
-        removal_summary = result.get("removalSummary", {})
-        affected_regions = removal_summary.get("affectedRegions", [])
-        preserved_regions = removal_summary.get("preservedRegions", [])
-        
-        # Also check if regions are in other parts of the response
-        if not affected_regions:
-            # Try to extract from risks or other sections
-            risks = result.get("risks", [])
-            for risk in risks:
-                if isinstance(risk, dict) and "consequences" in risk:
-                    # Try to extract brain regions from risk consequences
-                    consequences = risk.get("consequences", "")
-                    if isinstance(consequences, str) and len(consequences) > 10:
-                        # Could parse regions from text, but for now just use structure name
-                        pass
-        
-        # If no affected regions, use the structure name and common adjacent areas
-        if not affected_regions:
-            affected_regions = [request.structure_name]
-            # Add common adjacent structures based on brain region type
-            if "gyrus" in brain_region.lower() or "cortex" in brain_region.lower():
-                affected_regions.append("Adjacent cortical areas")
-            if "hippocampus" in brain_region.lower():
-                affected_regions.append("Temporal lobe connections")
-            if "frontal" in brain_region.lower():
-                affected_regions.append("Prefrontal connections")
-        
-        # Determine stress levels based on neurological deficits severity and actual regions
-        high_stress_regions = []
-        moderate_stress_regions = []
-        low_stress_regions = []
-        
-        # Check neurological deficits to determine stress
-        neuro_deficits = result.get("neurologicalDeficits", {})
-        max_severity = "NONE"
-        
-        for deficit_type, deficit_info in neuro_deficits.items():
-            if isinstance(deficit_info, dict) and deficit_info.get("affected"):
-                severity = deficit_info.get("severity", "MODERATE")
-                
-                # Track maximum severity
-                severity_order = {"SEVERE": 3, "MODERATE": 2, "MILD": 1, "NONE": 0}
-                if severity_order.get(severity, 0) > severity_order.get(max_severity, 0):
-                    max_severity = severity
-                
-                # Get specific affected areas from deficit description
-                description = deficit_info.get("description", "")
-                body_parts = deficit_info.get("bodyParts", [])
-                
-                # Extract brain region names from description if possible
-                # Look for common brain anatomy terms
-                brain_terms = ["gyrus", "cortex", "lobe", "nucleus", "tract", "pathway", "area", "region"]
-                extracted_regions = []
-                if description:
-                    desc_lower = description.lower()
-                    # Try to find brain region mentions
-                    for term in brain_terms:
-                        if term in desc_lower:
-                            # Extract surrounding words as potential region name
-                            words = description.split()
-                            for i, word in enumerate(words):
-                                if term in word.lower():
-                                    # Get 2-3 words around the term
-                                    start = max(0, i-1)
-                                    end = min(len(words), i+2)
-                                    region_phrase = " ".join(words[start:end])
-                                    if region_phrase not in extracted_regions and len(region_phrase) > 5:
-                                        extracted_regions.append(region_phrase)
-                
-                # Add to appropriate stress level with cleaner formatting
-                if severity == "SEVERE":
-                    if extracted_regions:
-                        high_stress_regions.extend(extracted_regions[:2])  # Limit to 2
-                    elif body_parts:
-                        high_stress_regions.append(f"Contralateral {body_parts[0]} motor cortex")
-                    else:
-                        high_stress_regions.append(f"{deficit_type.capitalize()} pathways")
-                elif severity == "MODERATE":
-                    if extracted_regions:
-                        moderate_stress_regions.extend(extracted_regions[:2])
-                    elif body_parts:
-                        moderate_stress_regions.append(f"{body_parts[0]} motor pathways")
-                    else:
-                        # Clean up description - remove redundant parts
-                        clean_desc = description.replace(f"{deficit_type.lower()} ", "").replace("deficits ", "").replace("expected from ", "")
-                        if len(clean_desc) > 60:
-                            clean_desc = clean_desc[:60] + "..."
-                        if clean_desc and clean_desc not in moderate_stress_regions:
-                            moderate_stress_regions.append(clean_desc)
-                else:
-                    if extracted_regions:
-                        low_stress_regions.extend(extracted_regions[:1])
-                    elif description and len(description) < 50:
-                        low_stress_regions.append(description)
-        
-        # Use actual affected regions from Gemini for stress distribution
-        # Primary resection site is always high stress (and only in high stress)
-        if request.structure_name not in high_stress_regions:
-            high_stress_regions.insert(0, request.structure_name)  # Put at front
-        
-        # Remove structure name from other stress levels to avoid duplication
-        moderate_stress_regions = [r for r in moderate_stress_regions if r.lower() != request.structure_name.lower()]
-        low_stress_regions = [r for r in low_stress_regions if r.lower() != request.structure_name.lower()]
-        
-        # Add adjacent regions from affected_regions (these are from Gemini's analysis)
-        for region in affected_regions:
-            if region and region.lower() != request.structure_name.lower():
-                # Check if it's already in any stress category
-                region_lower = region.lower()
-                already_added = (
-                    any(r.lower() == region_lower for r in high_stress_regions) or
-                    any(r.lower() == region_lower for r in moderate_stress_regions) or
-                    any(r.lower() == region_lower for r in low_stress_regions)
-                )
-                
-                if not already_added:
-                    # Determine stress level based on region type and keywords
-                    if any(keyword in region_lower for keyword in ["primary", "direct", "immediate", "critical", "eloquent"]):
-                        high_stress_regions.append(region)
-                    elif any(keyword in region_lower for keyword in ["adjacent", "connected", "nearby", "surrounding", "associated"]):
-                        moderate_stress_regions.append(region)
-                    else:
-                        # Default to moderate for affected regions (they're affected, so not low stress)
-                        moderate_stress_regions.append(region)
-        
-        # Add preserved regions as low stress
-        for region in preserved_regions[:3]:  # Limit to first 3
-            if region not in low_stress_regions:
-                low_stress_regions.append(region)
-        
-        # Calculate max stress based on severity
-        stress_map = {"SEVERE": 180.0, "MODERATE": 120.0, "MILD": 85.0, "NONE": 60.0}
-        max_stress = stress_map.get(max_severity, 100.0)
-        
-        # Remove duplicates and limit regions
-        high_stress_regions = list(dict.fromkeys(high_stress_regions))[:5]  # Preserve order, remove dupes
-        moderate_stress_regions = list(dict.fromkeys(moderate_stress_regions))[:5]
-        low_stress_regions = list(dict.fromkeys(low_stress_regions))[:5]
-        
-        # Ensure we have at least the structure name in high stress
-        if not high_stress_regions or high_stress_regions[0].lower() != request.structure_name.lower():
-            high_stress_regions.insert(0, request.structure_name)
+        logger.debug(f"Gemini response keys: {result.keys()}")
+        logger.debug(f"Removal summary: {result.get('removalSummary', {})}")
+
+        # Sort affected regions into stress levels
+        with span("fea.classify_stress"):
+            max_stress, affected_regions, stress_distribution = classify_stress(
+                result,
+                structure_name=request.structure_name,
+                brain_region=brain_region,
+                index=get_region_index(STL_BASE_DIR)
+            )
         
         # Add FEA results to the Gemini analysis
         result["fea_results"] = {
@@ -501,19 +425,58 @@ def run_fea_simulation(request: StructureFEARequest):
             "structure_label": request.structure_label,
             "stl_filename": request.stl_filename,
             "max_stress_kpa": max_stress,
-            "affected_regions": affected_regions if affected_regions else [request.structure_name],
-            "stress_distribution": {
-                "high_stress": high_stress_regions,
-                "moderate_stress": moderate_stress_regions,
-                "low_stress": low_stress_regions
-            }
+            "affected_regions": affected_regions,
+            "stress_distribution": stress_distribution
         }
         
         return result
     except Exception as e:
-        print(f"Error in FEA simulation: {e}")
+        logger.error(f"Error in FEA simulation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/health")
 def health_check():
-    return {"api": "healthy", "gemini": "connected", "organ": "brain"}
\ No newline at end of file
+    return {"api": "healthy", "gemini": "connected", "organ": "brain"}
+
+@app.get("/api/ready")
+def readiness_check():
+    # Readiness, separate from liveness: warmup has loaded the imaging libraries (a failed Gemini warmup only degrades it)
+    return JSONResponse(warmup.status(), status_code=200 if warmup.ready else 503)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    # Prometheus text format: per-route request latency and per-stage span histograms
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not PROFILER_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not admin_token_valid(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def _collapsed_response(profile):
+    return PlainTextResponse(
+        profile.collapsed(),
+        headers={
+            "Content-Disposition": f'attachment; filename="profile-{profile.id}.folded"',
+            "X-Profile-Id": profile.id
+        }
+    )
+
+@app.post("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_worker(seconds: float = Query(10, gt=0, le=PROFILER_MAX_SECONDS)):
+    """Sample every thread of this worker for `seconds`; collapsed stacks for a flamegraph"""
+    profile = await attach(seconds)
+    return _collapsed_response(profile)
+
+@app.get("/api/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    """Recent profiles, including those recorded for requests sent with X-Profile: 1"""
+    return {"profiles": get_profiler().list()}
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def download_profile(profile_id: str):
+    profile = get_profiler().get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return _collapsed_response(profile)
\ No newline at end of file
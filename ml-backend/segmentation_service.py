@@ -1,16 +1,24 @@
 """
 Segmentation service that uses the existing segmentation scripts
+
+Segmentation runs the project's segment_brain_regions.py; extracting,
+ordering and meshing the regions, the per-region status and the job
+events are the main backend's shared pipeline (nifti_to_stl).
 """
+import logging
 import os
 import sys
-import subprocess
-import nibabel as nib
-import numpy as np
-from skimage import measure
-import trimesh
 from pathlib import Path
 from typing import List, Dict, Optional
 
+import services_path  # noqa: F401  (backend/app/services on sys.path)
+from app.services.job_queue import get_event_log
+from app.services.nifti_to_stl import process_nifti_to_stl_files as build_case_meshes
+from app.services.object_store import data_path
+
+logger = logging.getLogger(__name__)
+
+
 # Import functions from existing scripts
 # We'll call the scripts as subprocesses or import their functions
 def run_segmentation_script(input_file: str, output_dir: str) -> Optional[str]:
@@ -33,7 +41,7 @@ def run_segmentation_script(input_file: str, output_dir: str) -> Optional[str]:
         
         # Check if SynthSeg is available
         if not check_synthseg_installed():
-            print("SynthSeg not found, using fallback...")
+            logger.warning("SynthSeg not found, using fallback...")
             # Try alternative method
             from segment_brain_regions import segment_with_alternative
             if segment_with_alternative(input_file, segmented_output):
@@ -51,111 +59,25 @@ def run_segmentation_script(input_file: str, output_dir: str) -> Optional[str]:
             return None
             
     except ImportError as e:
-        print(f"Could not import segmentation functions: {e}")
+        logger.warning(f"Could not import segmentation functions: {e}")
         return None
     except Exception as e:
-        print(f"Segmentation error: {e}")
+        logger.error(f"Segmentation error: {e}")
         return None
 
 
-def extract_regions_to_nifti(segmented_file: str, output_dir: str) -> Dict[int, Dict]:
-    """
-    Extract individual brain regions from segmented file
-    Uses the existing extract_regions function
-    """
-    try:
-        base_dir = Path(__file__).parent.parent
-        sys.path.insert(0, str(base_dir))
-        from segment_brain_regions import extract_regions
-        
-        regions = extract_regions(segmented_file, output_dir)
-        return regions
-    except Exception as e:
-        print(f"Error extracting regions: {e}")
-        return {}
-
-
-def nifti_to_stl(nifti_file: str, stl_file: str, iso_level: float = 0.5) -> bool:
-    """
-    Convert NIfTI file to STL using marching cubes
-    Uses the same approach as make_3d_model.py
-    """
-    try:
-        img = nib.load(nifti_file)
-        data = img.get_fdata()
-        
-        if np.count_nonzero(data) < 100:
-            return False
-        
-        # Get spacing from header
-        spacing = img.header.get_zooms()[:3]
-        
-        # Marching cubes (same as make_3d_model.py)
-        verts, faces, normals, values = measure.marching_cubes(
-            data,
-            level=iso_level,
-            spacing=spacing
-        )
-        
-        if len(verts) == 0:
-            return False
-        
-        # Create trimesh (same as make_3d_model.py)
-        mesh = trimesh.Trimesh(vertices=verts, faces=faces, vertex_normals=normals)
-        
-        # Export STL
-        mesh.export(stl_file)
-        
-        return True
-    except Exception as e:
-        print(f"Error converting {nifti_file} to STL: {e}")
-        return False
-
-
 def process_nifti_to_stl_files(
     input_file: str,
     case_id: str,
-    stl_base_dir: str = "stl"
+    stl_base_dir: str = data_path("stl")
 ) -> List[Dict[str, str]]:
     """
     Main function: Process NIfTI -> Segment -> Extract regions -> Convert to STL
-    Uses existing segmentation scripts
+    Uses the existing segmentation scripts, then the shared meshing pipeline
+    (clinical-priority order, per-region status, mesh_ready/done events)
     """
-    # Create case-specific directories
-    case_stl_dir = os.path.join(stl_base_dir, case_id)
-    temp_seg_dir = os.path.join("temp_seg", case_id)
-    os.makedirs(case_stl_dir, exist_ok=True)
-    os.makedirs(temp_seg_dir, exist_ok=True)
-    
-    # Step 1: Segment the brain using existing script
-    segmented_file = run_segmentation_script(input_file, temp_seg_dir)
-    if not segmented_file or not os.path.exists(segmented_file):
-        raise RuntimeError("Segmentation failed")
-    
-    # Step 2: Extract individual regions using existing function
-    regions = extract_regions_to_nifti(segmented_file, temp_seg_dir)
-    
-    # Step 3: Convert each region to STL (same as make_3d_model.py)
-    stl_files = []
-    for label, region_info in regions.items():
-        nifti_path = region_info['file']
-        region_name = region_info['name']
-        
-        # Create STL filename (same naming as make_3d_model.py)
-        safe_name = region_name.replace(" ", "_").replace("/", "_")
-        stl_filename = f"{safe_name}.stl"
-        stl_path = os.path.join(case_stl_dir, stl_filename)
-        
-        # Convert to STL
-        if nifti_to_stl(nifti_path, stl_path):
-            stl_files.append({
-                'filename': stl_filename,
-                'path': stl_path,
-                'name': region_name,
-                'label': label,
-                'voxels': region_info['voxels']
-            })
-            print(f"Created STL: {stl_filename}")
-    
-    return stl_files
-
+    try:
+        return build_case_meshes(input_file, case_id, stl_base_dir, segment=run_segmentation_script)
+    except Exception as e:
+        get_event_log().publish(case_id, "failed", {"error": str(e)})
+        raise
@@ -0,0 +1,16 @@
+"""
+Makes the main backend's shared service modules importable.
+
+Infrastructure used by both APIs (upload streaming, tracing, profiling,
+warmup, the object store, job events, mesh writers, region labels) has a
+single copy in backend/app/services. Import this module before any
+`app.services` import; the backend directory is appended to sys.path, so
+ml-backend's own modules still take precedence.
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
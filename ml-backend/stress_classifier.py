@@ -0,0 +1,279 @@
+"""
+Stress classification for /api/fea results.
+
+Turns a Gemini removal analysis into high/moderate/low stress region lists.
+Anatomy terms (generic ones like "gyrus" plus every region name we segment)
+are compiled into a single regex, and each match maps back to its term's
+rank. The index is rebuilt when STL files are added or removed.
+"""
+import glob
+import os
+import re
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Tuple
+
+import services_path  # noqa: F401  (backend/app/services on sys.path)
+from app.services.region_labels import REGION_LABELS
+
+# Generic anatomy terms, in priority order (earlier terms are reported first)
+BRAIN_TERMS = ["gyrus", "cortex", "lobe", "nucleus", "tract", "pathway", "area", "region"]
+
+# Keywords that push an affected region into the high stress tier
+HIGH_STRESS_KEYWORDS = ["primary", "direct", "immediate", "critical", "eloquent"]
+
+SEVERITY_ORDER = {"SEVERE": 3, "MODERATE": 2, "MILD": 1, "NONE": 0}
+STRESS_MAP = {"SEVERE": 180.0, "MODERATE": 120.0, "MILD": 85.0, "NONE": 60.0}
+
+MAX_REGIONS_PER_LEVEL = 5
+
+_HIGH_STRESS_RE = re.compile("|".join(HIGH_STRESS_KEYWORDS))
+
+
+def _normalize_region_name(name: str) -> str:
+    """'Left_Hippocampus' / 'CSF_(Cerebrospinal_Fluid)' -> 'hippocampus' / 'csf'"""
+    name = re.sub(r"\(.*?\)", " ", name.replace("_", " "))
+    words = [w for w in name.lower().split() if w not in ("left", "right")]
+    # Drop trailing label numbers from STL names such as "Cerebellum_6"
+    while words and words[-1].isdigit():
+        words.pop()
+    return " ".join(words)
+
+
+def _trie_pattern(terms: List[str]) -> str:
+    """
+    Build a prefix-factored regex from literal terms. Python's re tries
+    alternatives one by one, so "thalamus|hypothalamus|..." costs one attempt
+    per term at every position; a trie needs one per distinct first letter.
+    Longer terms win over their prefixes ("deep gray matter" over "deep").
+    """
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def render(node):
+        branches = []
+        for char in sorted(node, key=lambda c: c == ""):
+            if char == "":
+                branches.append("")
+            else:
+                branches.append(re.escape(char) + render(node[char]))
+        if len(branches) == 1:
+            return branches[0]
+        optional = "" in branches
+        branches = [b for b in branches if b]
+        body = "(?:" + "|".join(branches) + ")" if len(branches) > 1 else "(?:" + branches[0] + ")"
+        return body + "?" if optional else body
+
+    return render(trie)
+
+
+class RegionTermIndex:
+    """
+    Single compiled automaton over the anatomical vocabulary.
+    Each match maps back to a term rank so results keep the same ordering
+    as the old per-term scan: by term priority, then by word position.
+    """
+
+    def __init__(self, vocabulary: List[str]):
+        self.vocabulary = vocabulary
+        self.rank = {term: i for i, term in enumerate(vocabulary)}
+        self.pattern = re.compile(_trie_pattern(vocabulary))
+
+    def extract_phrases(self, description: str) -> List[str]:
+        """Return the phrases (term plus one word either side) mentioned in description"""
+        if not description:
+            return []
+
+        # Scan the words joined by single spaces, so word start offsets follow
+        # from the word lengths and each match is placed by bisecting into them
+        words = description.split()
+        text = " ".join(words).lower()
+        starts = list(accumulate((len(word) + 1 for word in words[:-1]), initial=0))
+
+        hits = []
+        for match in self.pattern.finditer(text):
+            # Terms start with a letter, so a match starts inside the word it belongs to
+            first = bisect_right(starts, match.start()) - 1
+            last = bisect_left(starts, match.end()) - 1
+            hits.append((self.rank[match.group(0)], first, last))
+
+        hits.sort()
+        phrases = []
+        seen = set()
+        for _, first, last in hits:
+            start = max(0, first - 1)
+            end = min(len(words), last + 2)
+            phrase = " ".join(words[start:end])
+            if phrase not in seen and len(phrase) > 5:
+                seen.add(phrase)
+                phrases.append(phrase)
+        return phrases
+
+
+def build_vocabulary(stl_dir: Optional[str] = None) -> List[str]:
+    """Generic terms followed by region names from REGION_LABELS and any STL files"""
+    names = [name for label, name in sorted(REGION_LABELS.items()) if label != 0]
+    if stl_dir and os.path.exists(stl_dir):
+        stl_files = glob.glob(os.path.join(stl_dir, "**", "*.stl"), recursive=True)
+        names.extend(sorted(os.path.basename(p)[:-len(".stl")] for p in stl_files))
+
+    vocabulary = list(BRAIN_TERMS)
+    seen = set(vocabulary)
+    for name in names:
+        term = _normalize_region_name(name)
+        if len(term) > 2 and term not in seen:
+            seen.add(term)
+            vocabulary.append(term)
+    return vocabulary
+
+
+def _stl_dir_signature(stl_dir: Optional[str]) -> Optional[Tuple]:
+    """
+    mtimes of stl_dir and of each case directory in it. STL files are
+    written to stl_dir or to stl_dir/<case_id>, so this changes whenever
+    one is added or removed.
+    """
+    if not stl_dir:
+        return None
+    try:
+        signature = [("", os.stat(stl_dir).st_mtime_ns)]
+        with os.scandir(stl_dir) as entries:
+            signature.extend((entry.name, entry.stat().st_mtime_ns) for entry in entries if entry.is_dir())
+    except OSError:
+        return None
+    return tuple(sorted(signature))
+
+
+@lru_cache(maxsize=8)
+def _build_region_index(stl_dir: Optional[str], signature: Optional[Tuple]) -> RegionTermIndex:
+    return RegionTermIndex(build_vocabulary(stl_dir))
+
+
+def get_region_index(stl_dir: Optional[str] = None) -> RegionTermIndex:
+    """The region index for stl_dir, built again only when its STL files change"""
+    return _build_region_index(stl_dir, _stl_dir_signature(stl_dir))
+
+
+def classify_stress(
+    result: Dict[str, Any],
+    structure_name: str,
+    brain_region: str,
+    index: Optional[RegionTermIndex] = None
+) -> Tuple[float, List[str], Dict[str, List[str]]]:
+    """
+    Sort regions from a Gemini analysis into stress levels.
+    Returns (max_stress_kpa, affected_regions, stress_distribution).
+    """
+    index = index or get_region_index()
+    structure_lower = structure_name.lower()
+    brain_region_lower = brain_region.lower()
+
+    removal_summary = result.get("removalSummary", {})
+    affected_regions = removal_summary.get("affectedRegions", [])
+    preserved_regions = removal_summary.get("preservedRegions", [])
+
+    # If no affected regions, use the structure name and common adjacent areas
+    if not affected_regions:
+        affected_regions = [structure_name]
+        if "gyrus" in brain_region_lower or "cortex" in brain_region_lower:
+            affected_regions.append("Adjacent cortical areas")
+        if "hippocampus" in brain_region_lower:
+            affected_regions.append("Temporal lobe connections")
+        if "frontal" in brain_region_lower:
+            affected_regions.append("Prefrontal connections")
+
+    high_stress_regions = []
+    moderate_stress_regions = []
+    low_stress_regions = []
+
+    # Determine stress levels based on neurological deficit severity
+    max_severity = "NONE"
+    for deficit_type, deficit_info in result.get("neurologicalDeficits", {}).items():
+        if not (isinstance(deficit_info, dict) and deficit_info.get("affected")):
+            continue
+
+        severity = deficit_info.get("severity", "MODERATE")
+        if SEVERITY_ORDER.get(severity, 0) > SEVERITY_ORDER.get(max_severity, 0):
+            max_severity = severity
+
+        description = deficit_info.get("description", "")
+        body_parts = deficit_info.get("bodyParts", [])
+        extracted_regions = index.extract_phrases(description)
+
+        if severity == "SEVERE":
+            if extracted_regions:
+                high_stress_regions.extend(extracted_regions[:2])
+            elif body_parts:
+                high_stress_regions.append(f"Contralateral {body_parts[0]} motor cortex")
+            else:
+                high_stress_regions.append(f"{deficit_type.capitalize()} pathways")
+        elif severity == "MODERATE":
+            if extracted_regions:
+                moderate_stress_regions.extend(extracted_regions[:2])
+            elif body_parts:
+                moderate_stress_regions.append(f"{body_parts[0]} motor pathways")
+            else:
+                # Clean up description - remove redundant parts
+                clean_desc = description.replace(f"{deficit_type.lower()} ", "").replace("deficits ", "").replace("expected from ", "")
+                if len(clean_desc) > 60:
+                    clean_desc = clean_desc[:60] + "..."
+                if clean_desc and clean_desc not in moderate_stress_regions:
+                    moderate_stress_regions.append(clean_desc)
+        else:
+            if extracted_regions:
+                low_stress_regions.extend(extracted_regions[:1])
+            elif description and len(description) < 50:
+                low_stress_regions.append(description)
+
+    # Primary resection site is always high stress (and only in high stress)
+    if structure_name not in high_stress_regions:
+        high_stress_regions.insert(0, structure_name)
+    moderate_stress_regions = [r for r in moderate_stress_regions if r.lower() != structure_lower]
+    low_stress_regions = [r for r in low_stress_regions if r.lower() != structure_lower]
+
+    # Add adjacent regions from Gemini's analysis, skipping any already in a level
+    seen = {r.lower() for r in high_stress_regions}
+    seen.update(r.lower() for r in moderate_stress_regions)
+    seen.update(r.lower() for r in low_stress_regions)
+    for region in affected_regions:
+        if not region:
+            continue
+        region_lower = region.lower()
+        if region_lower == structure_lower or region_lower in seen:
+            continue
+        seen.add(region_lower)
+        if _HIGH_STRESS_RE.search(region_lower):
+            high_stress_regions.append(region)
+        else:
+            # Affected regions default to moderate (they're affected, so not low stress)
+            moderate_stress_regions.append(region)
+
+    # Add preserved regions as low stress
+    low_seen = set(low_stress_regions)
+    for region in preserved_regions[:3]:
+        if region not in low_seen:
+            low_seen.add(region)
+            low_stress_regions.append(region)
+
+    max_stress = STRESS_MAP.get(max_severity, 100.0)
+
+    # Remove duplicates (preserving order) and limit regions
+    high_stress_regions = list(dict.fromkeys(high_stress_regions))[:MAX_REGIONS_PER_LEVEL]
+    moderate_stress_regions = list(dict.fromkeys(moderate_stress_regions))[:MAX_REGIONS_PER_LEVEL]
+    low_stress_regions = list(dict.fromkeys(low_stress_regions))[:MAX_REGIONS_PER_LEVEL]
+
+    # Ensure the structure name leads the high stress list
+    if not high_stress_regions or high_stress_regions[0].lower() != structure_lower:
+        high_stress_regions.insert(0, structure_name)
+
+    stress_distribution = {
+        "high_stress": high_stress_regions,
+        "moderate_stress": moderate_stress_regions,
+        "low_stress": low_stress_regions
+    }
+    return max_stress, affected_regions or [structure_name], stress_distribution
@@ -16,51 +16,9 @@ INPUT_FILE = r"C:\Users\arish\OneDrive\Documents\GitHub\prince\HackPrinceton2025
 OUTPUT_DIR = r"C:\Users\arish\OneDrive\Documents\GitHub\prince\HackPrinceton2025\segmented_regions"
 SEGMENTED_OUTPUT = os.path.join(OUTPUT_DIR, "segmented_brain.nii.gz")
 
-# Brain region labels
-# Note: SynthSeg provides anatomical regions (thalamus, hypothalamus, etc.)
-# ANTsPyNet deep_atropos provides tissue types (CSF, gray matter, white matter, etc.)
-REGION_LABELS = {
-    # Tissue types (from ANTsPyNet deep_atropos)
-    0: "Background",
-    1: "CSF (Cerebrospinal Fluid)",
-    2: "Gray Matter",
-    3: "White Matter",
-    4: "Deep Gray Matter",
-    5: "Brain Stem",
-    6: "Cerebellum",
-    # Anatomical regions (from SynthSeg - if available)
-    10: "Left Thalamus",
-    11: "Left Caudate",
-    12: "Left Putamen",
-    13: "Left Pallidum",
-    14: "3rd Ventricle",
-    15: "4th Ventricle",
-    16: "Brain Stem",
-    17: "Left Hippocampus",
-    18: "Left Amygdala",
-    26: "Left Accumbens area",
-    28: "Left VentralDC",
-    31: "Left choroid plexus",
-    41: "Right Cerebral White Matter",
-    42: "Right Cerebral Cortex",
-    43: "Right Lateral Ventricle",
-    44: "Right Inf Lat Vent",
-    46: "Right Cerebellum White Matter",
-    47: "Right Cerebellum Cortex",
-    49: "Right Thalamus",
-    50: "Right Caudate",
-    51: "Right Putamen",
-    52: "Right Pallidum",
-    53: "Right Hippocampus",
-    54: "Right Amygdala",
-    58: "Right Accumbens area",
-    60: "Right VentralDC",
-    63: "Right choroid plexus",
-    # Additional labels for hypothalamus and other regions
-    173: "Hypothalamus",
-    174: "Left Hypothalamus",
-    175: "Right Hypothalamus",
-}
+# Brain region labels (shared with both APIs)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.services.region_labels import REGION_LABELS
 
 def check_synthseg_installed():
     """Check if SynthSeg is installed"""
@@ -279,7 +237,10 @@ def extract_regions(segmented_file, output_dir):
     
     # Load segmented image
     seg_img = nib.load(segmented_file)
-    seg_data = seg_img.get_fdata().astype(np.int32)
+    # Labels at their stored integer type, or rounded from float storage, never via float64
+    seg_data = np.asanyarray(seg_img.dataobj)
+    if seg_data.dtype.kind == 'f':
+        seg_data = np.rint(seg_data).astype(np.int32)
     
     # Get unique labels
     unique_labels = np.unique(seg_data)
@@ -290,12 +251,14 @@ def extract_regions(segmented_file, output_dir):
     extracted_regions = {}
     
     for label in unique_labels:
-        # Create binary mask for this region
-        region_mask = (seg_data == label).astype(np.float32)
+        # Create binary mask for this region, as uint8 rather than float32
+        region_mask = (seg_data == label).view(np.uint8)
+        voxels = int(np.count_nonzero(region_mask))
         
-        if np.sum(region_mask) > 0:  # Only save if region exists
+        if voxels > 0:  # Only save if region exists
             # Create NIfTI image for this region
             region_img = nib.Nifti1Image(region_mask, seg_img.affine, seg_img.header)
+            region_img.set_data_dtype(np.uint8)
             
             # Get region name
             region_name = REGION_LABELS.get(int(label), f"Region_{int(label)}")
@@ -309,10 +272,10 @@ def extract_regions(segmented_file, output_dir):
             extracted_regions[int(label)] = {
                 'name': region_name,
                 'file': filepath,
-                'voxels': int(np.sum(region_mask))
+                'voxels': voxels
             }
             
-            print(f"  Extracted: {region_name} ({int(np.sum(region_mask))} voxels)")
+            print(f"  Extracted: {region_name} ({voxels} voxels)")
     
     return extracted_regions
 